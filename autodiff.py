@@ -0,0 +1,330 @@
+'''
+Automatic differentiation for CAS.
+
+The value of a derivative at a point can be found without building the
+derivative as an expression at all, which -- through the product and quotient
+rules -- may be far larger than the expression itself. Instead, the
+expression's tape (see tape) is compiled into straight-line Python code that
+applies the chain rule to numbers, not trees, in one of two ways:
+
+    forward mode    alongside the value of each instruction, its derivative
+                    with respect to one variable is carried up the tape: the
+                    value and the derivative come out together, for about the
+                    cost of evaluating the expression twice
+    reverse mode    the values are found first, and then, going back down
+                    the tape, the derivative of the whole expression with
+                    respect to each instruction (its adjoint): the whole
+                    gradient comes out at once, for a few times the cost of
+                    evaluating the expression, however many variables there
+                    are
+
+Instructions that don't depend on the variables differentiated with respect
+to cost no more than evaluating them.
+'''
+
+import re
+
+from parser import Func, Transform, MinusOp, Name, Number
+import evaluation
+import tape
+
+## The derivative of each function, given the source of its argument, u, and of
+## its value, f: those of differentiation.func_diff_rules, along with ln and abs
+derivatives = {'sin':'_cos({u})',
+               'cos':'(-_sin({u}))',
+               'tan':'(1 + {f}*{f})',
+               'exp':'{f}',
+               'ln':'(1/{u})',
+               'abs':'_sign({u})'}
+
+## The names of the temporaries in the generated code
+temporary = re.compile(r'\b_[vda]\d+\b')
+
+def sign(u):
+    return (u > 0) - (u < 0)
+
+def product(a, b):
+    '''The source for a*b, where either may be 1'''
+    if a == '1.0':
+        return b
+    elif b == '1.0':
+        return a
+    return '%s*%s' % (a, b)
+## -----------------------------------------------------------------------------
+## Code generation
+## -----------------------------------------------------------------------------
+def evaluated(t, vars):
+    '''
+    The source for the value of each instruction of the tape t -- a constant,
+    a variable, or a temporary -- and the statement assigning each temporary
+    (None for the instructions that need none)
+    '''
+    evaluation.check_variables(vars)
+    values, statements = [], []
+    for i, (code, left, right) in enumerate(zip(t.codes, t.left, t.right)):
+        token = t.pool[code]
+        if left == tape.none:
+            if isinstance(token, Number):
+                values.append(evaluation.constant(token))
+            elif token.value not in vars:
+                raise evaluation.EvaluationError('No value for variable: %s' %
+                                                 token.value)
+            else:
+                values.append(token.value)
+            statements.append(None)
+            continue
+        value = '_v%d' % i
+        if isinstance(token, Transform):
+            raise evaluation.EvaluationError('Cannot evaluate an integral with '
+                                             'respect to %s that CAS has no '
+                                             'antiderivative for' %
+                                             t.pool[t.codes[right]])
+        elif isinstance(token, Func):
+            if token.value not in derivatives:
+                raise evaluation.EvaluationError('Unknown function: %s' %
+                                                 token.value)
+            statements.append('%s = _%s(%s)' % (value, token.value,
+                                                values[left]))
+        elif isinstance(token, MinusOp) and right == tape.none:
+            statements.append('%s = -%s' % (value, values[left]))
+        else:
+            statements.append('%s = %s %s %s' %
+                              (value, values[left],
+                               evaluation.python_ops[token.value],
+                               values[right]))
+        values.append(value)
+    return values, statements
+
+def power_slope(t, i, values):
+    '''
+    The source for the derivative of instruction i, u^w, with respect to u:
+    w*u^(w - 1), with w - 1 worked out here if w is a constant
+    '''
+    u, w = values[t.left[i]], values[t.right[i]]
+    exponent = t.pool[t.codes[t.right[i]]]
+    if isinstance(exponent, Number):
+        return product(w, '%s**%s' % (u, evaluation.constant(
+            Number(exponent.value - 1))))
+    return '%s*%s**(%s - 1)' % (w, u, w)
+
+def released(statements):
+    '''
+    statements, with each temporary deleted once it has last been used: over
+    arrays, each holds a whole array, and a long expression has many
+    '''
+    last = {}
+    for i, statement in enumerate(statements):
+        for name in temporary.findall(statement):
+            last[name] = i
+    dead = {}
+    for name, i in last.items():
+        dead.setdefault(i, []).append(name)
+    output = []
+    for i, statement in enumerate(statements):
+        output.append(statement)
+        if i in dead and i < len(statements) - 1:
+            output.append('del %s' % ', '.join(sorted(dead[i])))
+    return output
+
+def function(statements, vars, results):
+    '''
+    The source of a function of the variables named in vars, which runs
+    statements and returns results
+    '''
+    return '\n    '.join(['def compiled(%s):' % ', '.join(vars)] +
+                         released(statements + ['return ' + results])) + '\n'
+
+def generate_forward(expr, var, vars):
+    '''
+    Generate the source of a Python function of the variables named in vars,
+    returning the value of expr and its derivative with respect to var
+    '''
+    t = tape.from_tree(expr)
+    values, assignments = evaluated(t, vars)
+    # the source for the derivative of each instruction; None where it is zero
+    slopes = []
+    statements = []
+    for i, (code, left, right) in enumerate(zip(t.codes, t.left, t.right)):
+        token = t.pool[code]
+        if left == tape.none:
+            slopes.append('1.0' if isinstance(token, Name) and
+                          token.value == var else None)
+            continue
+        statements.append(assignments[i])
+        value, slope = values[i], '_d%d' % i
+        u, du = values[left], slopes[left]
+        derivative = None
+        if isinstance(token, Func):
+            if du:
+                derivative = product(derivatives[token.value].format(u=u,
+                                                                     f=value),
+                                     du)
+        elif isinstance(token, MinusOp) and right == tape.none:
+            if du:
+                derivative = '-%s' % du
+        else:
+            op = token.value
+            w, dw = values[right], slopes[right]
+            if op in ('+', '-'):
+                if du and dw:
+                    derivative = '%s %s %s' % (du, op, dw)
+                elif dw:
+                    derivative = dw if op == '+' else '-%s' % dw
+                else:
+                    derivative = du
+            elif op == '*':
+                if du and dw:
+                    derivative = '%s + %s' % (product(du, w), product(u, dw))
+                elif dw:
+                    derivative = product(u, dw)
+                elif du:
+                    derivative = product(du, w)
+            elif op == '/':
+                # (u/w)' = (du - (u/w)*dw)/w
+                if du and dw:
+                    derivative = '(%s - %s*%s)/%s' % (du, value, dw, w)
+                elif dw:
+                    derivative = '-%s*%s/%s' % (value, dw, w)
+                elif du:
+                    derivative = '%s/%s' % (du, w)
+            else:
+                # (u^w)' = w*u^(w - 1)*du + u^w*ln(u)*dw
+                terms = []
+                if du:
+                    terms.append(product(power_slope(t, i, values), du))
+                if dw:
+                    terms.append(product('%s*_ln(%s)' % (value, u), dw))
+                derivative = ' + '.join(terms)
+        if derivative:
+            statements.append('%s = %s' % (slope, derivative))
+        slopes.append(slope if derivative else None)
+    return function(statements, vars,
+                    '%s, %s' % (values[-1], slopes[-1] or '0.0'))
+
+def generate_reverse(expr, wrt, vars):
+    '''
+    Generate the source of a Python function of the variables named in vars,
+    returning the value of expr and a list of its derivatives with respect to
+    each of the variables named in wrt
+    '''
+    t = tape.from_tree(expr)
+    values, statements = evaluated(t, vars)
+    statements = [statement for statement in statements if statement]
+    # which instructions depend on any of the variables in wrt: only these
+    # need adjoints
+    active = []
+    for code, left, right in zip(t.codes, t.left, t.right):
+        token = t.pool[code]
+        if left == tape.none:
+            active.append(isinstance(token, Name) and token.value in wrt)
+        else:
+            active.append(active[left] or
+                          right != tape.none and active[right])
+    # the terms of each instruction's adjoint, added up when it is reached:
+    # every instruction using it comes later on the tape, so by then it has
+    # them all
+    terms = [[] for code in t.codes]
+    if active[-1]:
+        terms[-1].append('1.0')
+    adjoints = [None] * len(t.codes)
+    for i in range(len(t.codes) - 1, -1, -1):
+        if not terms[i]:
+            continue
+        adjoint = adjoints[i] = '_a%d' % i
+        # a few terms at a time, since Python's compiler limits how deeply
+        # expressions may nest (see evaluation.max_nesting)
+        step = evaluation.max_nesting
+        statements.append('%s = %s' % (adjoint, ' + '.join(terms[i][:step])))
+        for k in range(step, len(terms[i]), step):
+            statements.append('%s = %s + %s' %
+                              (adjoint, adjoint,
+                               ' + '.join(terms[i][k:k + step])))
+        terms[i] = None
+        token, left, right = t.pool[t.codes[i]], t.left[i], t.right[i]
+        if left == tape.none:
+            continue
+        value, u = values[i], values[left]
+        if isinstance(token, Func):
+            terms[left].append(product(
+                adjoint, derivatives[token.value].format(u=u, f=value)))
+        elif isinstance(token, MinusOp) and right == tape.none:
+            terms[left].append('-' + adjoint)
+        else:
+            op, w = token.value, values[right]
+            if active[left]:
+                if op in ('+', '-'):
+                    terms[left].append(adjoint)
+                elif op == '*':
+                    terms[left].append(product(adjoint, w))
+                elif op == '/':
+                    terms[left].append('%s/%s' % (adjoint, w))
+                else:
+                    terms[left].append(product(adjoint,
+                                               power_slope(t, i, values)))
+            if active[right]:
+                if op == '+':
+                    terms[right].append(adjoint)
+                elif op == '-':
+                    terms[right].append('-' + adjoint)
+                elif op == '*':
+                    terms[right].append(product(adjoint, u))
+                elif op == '/':
+                    terms[right].append('-%s*%s/%s' % (adjoint, value, w))
+                else:
+                    terms[right].append('%s*%s*_ln(%s)' % (adjoint, value, u))
+    # the adjoint of each variable is the derivative with respect to it
+    gradient = {}
+    for i, code in enumerate(t.codes):
+        token = t.pool[code]
+        if t.left[i] == tape.none and isinstance(token, Name):
+            gradient[token.value] = adjoints[i]
+    return function(statements, vars,
+                    '%s, [%s]' % (values[-1],
+                                  ', '.join([gradient.get(var) or '0.0'
+                                             for var in wrt])))
+## -----------------------------------------------------------------------------
+## Compilation
+## -----------------------------------------------------------------------------
+def compiled(source, arrays):
+    '''The function source defines, over floats or, if arrays, NumPy arrays'''
+    if arrays:
+        numpy = evaluation.numpy
+        if numpy is None:
+            raise evaluation.EvaluationError('Evaluation over arrays requires '
+                                             'NumPy')
+        namespace = {'_' + name:func
+                     for name, func in evaluation.array_funcs.items()}
+        namespace['_sign'] = numpy.sign
+    else:
+        namespace = {'_' + name:func
+                     for name, func in evaluation.math_funcs.items()}
+        namespace['_sign'] = sign
+    try:
+        exec(source, namespace)
+    except SyntaxError as e:
+        raise evaluation.EvaluationError('Could not compile expression: %s' % e)
+    return namespace['compiled']
+
+def compile_dual(expr, var, vars, arrays=False):
+    '''
+    Compile expr into a Python function of the variables named in vars (a
+    sequence of strings), taken in that order, which returns a pair: the value
+    of expr, and of its derivative with respect to var, found in forward mode.
+    If arrays, the function works on NumPy arrays (see
+    evaluation.evaluate_array), rather than single numbers.
+
+    Example: compile_dual(f, 'x', ('x', 'y'))(1, 2) for f and df/dx at (1, 2)
+    '''
+    return compiled(generate_forward(expr, var, vars), arrays)
+
+def compile_gradient(expr, wrt, vars, arrays=False):
+    '''
+    Compile expr into a Python function of the variables named in vars, taken
+    in that order, which returns a pair: the value of expr, and a list of its
+    derivatives with respect to each of the variables named in wrt, found in
+    reverse mode. If arrays, the function works on NumPy arrays.
+
+    Example: compile_gradient(f, ('x', 'y'), ('x', 'y'))(1, 2)
+    '''
+    return compiled(generate_reverse(expr, wrt, vars), arrays)
+## END -------------------------------------------------------------------------
@@ -0,0 +1,165 @@
+'''
+Parallel batch processing for CAS.
+
+batch_map applies an operation to many expressions at once, across a pool of
+worker processes (threads wouldn't help: the work is pure Python). Work is
+sent to the workers in chunks, and no more than a few chunks per worker are
+in flight at any time, so however many expressions there are, only those
+being worked on, or waiting to be collected, are held in memory.
+
+Expressions go to the workers as strings or serialized tapes (see
+serialization), and come back the same way: these are far more compact than
+pickled parse trees, and -- unlike pickled trees, which are pickled
+recursively -- of any depth.
+'''
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from parser import Parser, Token
+import serialization
+
+## The state each worker process keeps between chunks: its parser, and the
+## operations it has been asked to apply so far
+parser = None
+pipelines = {}
+
+def warm_up():
+    '''
+    Set up a worker process: make its parser, and run a little work through
+    the differentiator, integrator and simplifier, so that the tables they
+    build as they go are ready before the first chunk arrives
+    '''
+    global parser
+    import cas
+    parser = Parser()
+    f = cas.Expr(expr_tree=parser.parse('x^2*sin(x)/(1+exp(x))'))
+    str(f.d('x').integrate('x'))
+
+def pipeline(op):
+    '''The function applying op -- see batch_map -- to an Expr'''
+    if callable(op):
+        return op
+    if op not in pipelines:
+        import cli
+        specs = op.split()
+        if 'eval' in [spec.partition(':')[0] for spec in specs[:-1]]:
+            raise cli.IllegalOperation('eval must be the last operation')
+        steps = [cli.operation(spec) for spec in specs]
+
+        def apply(f):
+            for step in steps:
+                f = step(f)
+            return f
+
+        pipelines[op] = apply
+    return pipelines[op]
+
+def run_chunk(op, items, as_strings):
+    '''
+    Apply op to each of items, in a worker process. Each item is an
+    expression string, or a serialized tree -- or an exception, if it couldn't
+    be sent, which is passed back as it is; each result is a number, a string
+    (if as_strings), or a serialized tree -- or, if op failed, the exception
+    it raised.
+    '''
+    import cas
+    if parser is None:
+        warm_up()
+    apply = pipeline(op)
+    results = []
+    for item in items:
+        if isinstance(item, Exception):
+            results.append(item)
+            continue
+        try:
+            if isinstance(item, str):
+                tree = parser.parse(item)
+            else:
+                tree, = serialization.loads(item)
+            result = apply(cas.Expr(expr_tree=tree))
+            if isinstance(result, cas.Expr):
+                result = str(result) if as_strings else\
+                    serialization.dumps([result.tree_repr])
+            results.append(result)
+        except Exception as e:
+            results.append(e)
+    return results
+
+def encoded(expr):
+    '''An expression -- a string, a parse tree or an Expr -- to send'''
+    if isinstance(expr, str):
+        return expr
+    elif isinstance(expr, Token):
+        return serialization.dumps([expr])
+    return serialization.dumps([expr.tree_repr])
+
+def batch_map(op, expressions, workers=None, chunksize=32, prefetch=2,
+              as_strings=False):
+    '''
+    Apply op to each of expressions (strings, parse trees or Exprs; any
+    iterable of them, which is read only as fast as the workers keep up), in
+    workers processes (by default, one per CPU). Yields the results in the
+    same order: Exprs, or numbers for evaluations -- or, if as_strings, the
+    Exprs printed. As on the command line, blank strings are skipped, and an
+    expression that can't be parsed or processed doesn't stop the rest: its
+    result is the exception raised instead.
+
+    op is a string of operations to apply in turn, as on the command line (see
+    cli): 'd:x', 'int:x d:y', 'simplify' or 'd:x eval:x=1', say. It may also
+    be a function from Exprs to Exprs, which must be defined at the top level
+    of a module, so that the workers can import it.
+
+    Expressions are sent in chunks of chunksize, and at most prefetch chunks
+    per worker are in flight at a time.
+
+    Example: for g in batch_map('d:x', open('formulas.txt')): print(g)
+    '''
+    import cas
+    # check op before any work is sent
+    if not callable(op):
+        pipeline(op)
+    workers = workers or os.cpu_count() or 1
+
+    def chunks():
+        chunk = []
+        for expr in expressions:
+            if isinstance(expr, str):
+                expr = expr.strip()
+                if not expr:
+                    continue
+            try:
+                chunk.append(encoded(expr))
+            except serialization.SerializationError as e:
+                chunk.append(e)
+            if len(chunk) == chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def decoded(results):
+        for result in results:
+            if isinstance(result, bytes):
+                tree, = serialization.loads(result)
+                yield cas.Expr(expr_tree=tree)
+            else:
+                yield result
+
+    with ProcessPoolExecutor(workers, initializer=warm_up) as pool:
+        pending = deque()
+        try:
+            for chunk in chunks():
+                pending.append(pool.submit(run_chunk, op, chunk, as_strings))
+                # back-pressure: collect the oldest chunk's results before any
+                # more are sent
+                while len(pending) >= workers * prefetch:
+                    yield from decoded(pending.popleft().result())
+            while pending:
+                yield from decoded(pending.popleft().result())
+        finally:
+            # if the results aren't all wanted, don't wait on work not begun
+            for future in pending:
+                future.cancel()
+## END -------------------------------------------------------------------------
@@ -0,0 +1,383 @@
+'''
+Benchmarks for CAS.
+
+Run all of them with
+
+     python benchmark.py
+
+or name the ones to run, e.g. python benchmark.py diff.
+'''
+
+import io
+import os
+import re
+import sys
+import tempfile
+import tracemalloc
+from timeit import repeat
+
+from cas import Expr, compile_matrix
+from parser import Parser
+from differentiation import derive
+from simplification import reduce
+from traversal import postorder, subtrees
+import tape
+import serialization
+import caching
+from batch import batch_map
+import sampling
+
+def best_time(func, runs=3):
+    '''The best wall-clock time, in seconds, of several calls to func'''
+    return min(repeat(func, number=1, repeat=runs))
+
+def count_nodes(expr):
+    '''The number of nodes in expr, counting shared subtrees every time'''
+    sizes = {}
+    return postorder(expr,
+                     lambda expr: 1 + sum([sizes[child]
+                                           for child in subtrees(expr)]),
+                     memo=sizes)
+
+## -----------------------------------------------------------------------------
+## Expression builders
+## -----------------------------------------------------------------------------
+def nested_quotient(depth):
+    '''x/(x+1)/(x+2)/...: a chain of depth quotients'''
+    return '/'.join(['x'] + ['(x+%d)' % k for k in range(1, depth + 1)])
+
+def nested_product(depth):
+    '''x*sin(x*sin(...)): depth products, nested through function calls'''
+    return 'x*sin(' * depth + 'x' + ')' * depth
+
+def dense_polynomial(degree):
+    '''1+2*x+3*x^2+...: every power of x up to degree'''
+    return '+'.join(['%d*x^%d' % (k + 1, k) for k in range(degree + 1)])
+
+def polynomial_product(degree, factors=4):
+    '''(1+x+...)*(1+2*x+...)*...: a product of dense polynomials'''
+    return '*'.join(['(%s)' % '+'.join(['%d*x^%d' % (j + k, k)
+                                        for k in range(degree + 1)])
+                     for j in range(1, factors + 1)])
+
+def sum_chain(nodes):
+    '''sin(x+1)+sin(x+2)+...: a left-deep sum with about the given number of nodes'''
+    return '+'.join(['sin(x+%d)' % k for k in range(1, nodes // 5 + 1)])
+
+def nested_chain(nodes):
+    '''exp(x+exp(x+...)): a chain nested about as deep as the given number of nodes'''
+    return 'exp(x+' * (nodes // 3) + 'x' + ')' * (nodes // 3)
+
+## A corpus of expressions whose derivatives are typical of what CAS produces
+corpus = ['x^2*sin(x)', 'exp(x)/(1+x^2)', 'tan(x)*cos(x)', 'x^3+2*x^2-5*x+1',
+          '(x+1)*(x-1)*(x+2)', 'sin(x)^2+cos(x)^2', 'x*exp(2*x)',
+          'exp(sin(x))*x^2', 'x/(x+1)/(x+2)', '3*x^4-2*x^3+x']
+## -----------------------------------------------------------------------------
+## The benchmarks
+## -----------------------------------------------------------------------------
+def bench_diff():
+    '''Differentiation of nested quotients and products'''
+    for name, build in (('quotient', nested_quotient),
+                        ('product', nested_product)):
+        for depth in (4, 8, 16, 32):
+            f = Expr(build(depth))
+            print('  %-8s depth %3d: %9.4fs' %
+                  (name, depth, best_time(lambda: f.d('x'))))
+
+def bench_polynomial():
+    '''Differentiation and integration of degree-200 polynomials'''
+    for name, f in (('dense', dense_polynomial(200)),
+                    ('product', polynomial_product(50))):
+        f = Expr(f)
+        print('  %-8s d: %9.4fs   integrate: %9.4fs' %
+              (name, best_time(lambda: f.d('x')),
+               best_time(lambda: f.integrate('x'))))
+
+def bench_chain():
+    '''Parsing, differentiation, integration, simplification and printing of
+    10k- and 100k-node chains'''
+    for nodes in (10000, 100000):
+        for name, build in (('sum', sum_chain), ('nested', nested_chain)):
+            source = build(nodes)
+            # each pass is timed once: trees are interned, and their
+            # simplified forms cached, so a second run would measure the cache
+            times = []
+            for run in (lambda: Parser().parse(source),
+                        lambda: f.d('x'),
+                        lambda: f.integrate('x'),
+                        lambda: reduce(f.tree_repr),
+                        lambda: str(f)):
+                times.append(best_time(run, runs=1))
+                if len(times) == 1:
+                    f = Expr(source)
+            print('  %-6s %6d nodes: parse %7.3fs  d %7.3fs  integrate %7.3fs'
+                  '  simplify %7.3fs  print %7.3fs' % ((name, nodes) +
+                                                      tuple(times)))
+
+def bench_print():
+    '''Printing 100k-node chains, and the derivative of the sum: the first str,
+    a cached str, and writing to a file'''
+    # the nested chain's derivative shares each exp(x+...) between its terms,
+    # but printed, each is written out in full: its output is quadratic in
+    # the chain's length
+    chain, nested = Expr(sum_chain(100000)), Expr(nested_chain(100000))
+    for label, f in (('sum', chain), ("sum'", chain.d('x')),
+                     ('nested', nested)):
+        # a fresh Expr for each run, so that nothing is cached
+        first = best_time(lambda: str(Expr(expr_tree=f.tree_repr)))
+        cached = best_time(lambda: str(f))
+        written = best_time(
+            lambda: Expr(expr_tree=f.tree_repr).write(io.StringIO()))
+        print('  %-7s %8d chars: str %7.3fs  cached %9.6fs  write %7.3fs' %
+              (label, len(str(f)), first, cached, written))
+
+def bench_tape():
+    '''Memory used by 100k-node chains, as parse trees and as tapes, and
+    conversion, evaluation, differentiation and printing of the tapes'''
+    for name, build in (('sum', sum_chain), ('nested', nested_chain)):
+        source = build(100000)
+        tracemalloc.start()
+        tree = Parser().parse(source)
+        tree_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        t = tape.from_tree(tree)
+        print('  %-6s %6d instructions: %5.1fMB as a tree, %4.1fMB as a tape'
+              % (name, len(t), tree_bytes / 1e6, t.nbytes() / 1e6))
+        print('  %6s from_tree %.3fs  to_tree %.3fs  evaluate %.3fs  '
+              'diff %.3fs  str %.3fs' %
+              ('', best_time(lambda: tape.from_tree(tree)),
+               best_time(lambda: t.to_tree()),
+               best_time(lambda: t.evaluate(x=-3)),
+               best_time(lambda: t.diff('x')),
+               best_time(lambda: str(t))))
+
+def bench_serialize():
+    '''Loading 100k-node chains, and the derivative of the sum: parsing their
+    printed forms, against decoding them from binary and JSON'''
+    def serialized(name, f):
+        return (name, str(f), serialization.dumps([f.tree_repr]),
+                serialization.dumps_json([f.tree_repr]))
+
+    # trees are interned, so none is kept once serialized (nor put in the
+    # parse cache), so that each load builds its tree afresh
+    chain = Expr(expr_tree=Parser().parse(sum_chain(100000)))
+    forms = [serialized('sum', chain), serialized("sum'", chain.d('x'))]
+    del chain
+    nested = Expr(expr_tree=Parser().parse(nested_chain(100000)))
+    forms.append(serialized('nested', nested))
+    del nested
+    for name, text, data, document in forms:
+        print('  %-7s %8d bytes: parse %7.3fs   %8d binary: load %7.3fs   '
+              '%8d JSON: load %7.3fs' %
+              (name, len(text), best_time(lambda: Parser().parse(text)),
+               len(data), best_time(lambda: serialization.loads(data)),
+               len(document),
+               best_time(lambda: serialization.loads_json(document))))
+
+def bench_cache():
+    '''Differentiation and integration of the corpus and a 10k-node chain,
+    without the persistent cache, and with it, cold and warm'''
+    exprs = [Expr(f) for f in corpus] + [Expr(sum_chain(10000))]
+
+    def run():
+        for f in exprs:
+            f.d('x')
+            f.integrate('x')
+
+    with tempfile.TemporaryDirectory() as directory:
+        uncached = best_time(run, runs=1)
+        caching.enable(os.path.join(directory, 'results.db'))
+        cold = best_time(run, runs=1)
+        warm = best_time(run, runs=1)
+        caching.disable()
+    print('  uncached %.3fs   cold cache %.3fs   warm cache %.3fs' %
+          (uncached, cold, warm))
+
+def bench_batch():
+    '''Differentiating 2000 variants of the corpus, in this process, and with
+    batch_map on 1, 2, 4, ... worker processes, up to the number of CPUs'''
+    exprs = [re.sub(r'\bx\b', '(x+%d)' % k, f)
+             for k in range(200) for f in corpus]
+    print('  serial            %7.3fs' %
+          best_time(lambda: [str(Expr(f).d('x')) for f in exprs], runs=1))
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        print('  %2d worker(s)      %7.3fs' %
+              (workers, best_time(lambda: list(batch_map('d:x', exprs,
+                                                         workers,
+                                                         as_strings=True)),
+                                  runs=1)))
+        workers *= 2
+
+def bench_sample():
+    '''Points and worst error of plots sampled adaptively, and evenly at 200
+    points, as gnuplot does, over [-2, 2]; and the time to sample an integral
+    CAS has no antiderivative for'''
+    numpy = sampling.numpy
+    fine = numpy.linspace(-2, 2, 100001)
+    for f in ('1/(1+exp(-50*x))', 'sin(x^2)', 'sin(1/x)', 'ln(x)'):
+        t = tape.from_tree(Expr(f).tree_repr)
+        func = lambda xs: sampling.evaluate(t, {'x':xs})
+        truth = func(fine)
+        defined = numpy.isfinite(truth)
+
+        def error(xs, ys):
+            # the worst error of the lines drawn between the points
+            return numpy.nanmax(numpy.abs(numpy.interp(fine, xs, ys) -
+                                          truth)[defined])
+
+        xs, ys = sampling.sample(func, -2, 2)
+        even = numpy.linspace(-2, 2, 200)
+        print('  %-18s adaptive %4d points, error %.4f; even 200, error '
+              '%.4f' % (f, len(xs), error(xs, ys), error(even, func(even))))
+    f = Expr('sin(x^2)').integrate('x')
+    t = tape.from_tree(f.tree_repr)
+    print('  %-18s %7.3fs' %
+          (f, best_time(lambda: sampling.sample(
+              lambda xs: sampling.evaluate(t, {'x':xs}), -10, 10))))
+
+def bench_dual():
+    '''The value and derivative of nested quotients, products and a 1000-node
+    chain of sines at 1000 points, and over an array of 100k: from the symbolic
+    derivative, compiled, and from the expression alone, in forward mode'''
+    numpy = sampling.numpy
+    points, array = [k / 1000 for k in range(1000)], numpy.linspace(0, 1, 10**5)
+    for name, source in (('quotient', nested_quotient(32)),
+                         ('product', nested_product(32)),
+                         ('chain', 'sin(x+' * 333 + 'x' + ')' * 333)):
+        # fresh Exprs for each run, so that nothing compiled is reused
+        def symbolic():
+            f = Expr(source)
+            func, d = f.compile('x'), f.d('x').compile('x')
+            return [(func(x), d(x)) for x in points]
+
+        def forward():
+            f = Expr(source)
+            return [f.eval_with_derivative('x', x=x) for x in points]
+
+        def symbolic_array():
+            f = Expr(source)
+            return f.evaluate_array(x=array), f.d('x').evaluate_array(x=array)
+
+        def forward_array():
+            return Expr(source).eval_with_derivative_array('x', x=array)
+
+        print('  %-8s points: symbolic %7.3fs  forward %7.3fs   array: '
+              'symbolic %7.3fs  forward %7.3fs' %
+              (name, best_time(symbolic, runs=1), best_time(forward, runs=1),
+               best_time(symbolic_array, runs=1),
+               best_time(forward_array, runs=1)))
+
+def many_variables(count):
+    '''x0*sin(x0*x7)/(1+x0^2)+...: a sum over count variables, each coupled to
+    two others'''
+    return '+'.join(['x%d*sin(x%d*x%d)/(1+x%d^2)' %
+                     (k, k, k * 7 % count, k * 3 % count)
+                     for k in range(count)])
+
+def bench_gradient():
+    '''The gradients of expressions in 10, 100 and 300 variables at 100
+    points: from the derivative with respect to each variable, compiled, and
+    in reverse mode; and the cost of reverse mode, relative to evaluation'''
+    for count in (10, 100, 300):
+        source = many_variables(count)
+        vars = ['x%d' % k for k in range(count)]
+        points = [{var:(k + j) % 17 / 17 for j, var in enumerate(vars)}
+                  for k in range(100)]
+
+        def symbolic():
+            func = compile_matrix(Expr(source).gradient(vars), *vars)
+            return [func(**point) for point in points]
+
+        def reverse():
+            f = Expr(source)
+            return [f.eval_with_gradient(vars, **point) for point in points]
+
+        f = Expr(source)
+        func = f.compile(*vars)
+        evaluate = best_time(lambda: [func(**point) for point in points])
+        f.eval_with_gradient(vars, **points[0])
+        gradient = best_time(lambda: [f.eval_with_gradient(vars, **point)
+                                      for point in points])
+        print('  %3d variables: symbolic %7.3fs  reverse %7.3fs  (%.1f '
+              'evaluations)' %
+              (count, best_time(symbolic, runs=1), best_time(reverse, runs=1),
+               gradient / evaluate))
+
+def bench_taylor():
+    '''The fourth derivative of the corpus, by d four times over and by
+    d(var, 4); the fifth, from scratch and from the fourth, kept; and Taylor
+    polynomials of order 8'''
+    # fresh Exprs for each run, so that no derivatives are kept between runs
+    exprs = lambda: [Expr(f) for f in corpus]
+    repeated = best_time(lambda: [f.d('x').d('x').d('x').d('x')
+                                  for f in exprs()])
+    chained = best_time(lambda: [f.d('x', 4) for f in exprs()])
+    print('  fourth: d four times %7.3fs  d(x, 4) %7.3fs' %
+          (repeated, chained))
+    fs = exprs()
+    for f in fs:
+        f.d('x', 4)
+    print('  fifth: from scratch %7.3fs  from the fourth %7.3fs' %
+          (best_time(lambda: [f.d('x', 5) for f in exprs()]),
+           best_time(lambda: [f.d('x', 5) for f in fs], runs=1)))
+    print('  taylor, order 8 %7.3fs' %
+          best_time(lambda: [f.taylor('x', 0, 8) for f in exprs()]))
+
+def bench_definite():
+    '''Definite integrals of the corpus and of integrands CAS has no
+    antiderivative for: one at a time, of new Exprs and of the same Exprs
+    again, and a thousand at a time, over arrays of bounds'''
+    numpy = sampling.numpy
+    mixed = corpus + ['sin(x^2)', 'x*exp(x)', 'exp(-x^2)', 'sin(x)/x',
+                      'exp(sin(x))', 'ln(x)', 'x^x']
+    bounds = [1 + k / 20 for k in range(20)]
+    for label, run in (('new', lambda: [Expr(f).integrate('x', 0.5, b)
+                                        for b in bounds for f in mixed]),
+                       ('again', lambda: [f.integrate('x', 0.5, b)
+                                          for b in bounds for f in fs])):
+        fs = [Expr(f) for f in mixed]
+        print('  %-6s %8.0f integrals/s' %
+              (label, len(bounds) * len(mixed) / best_time(run)))
+    array = numpy.linspace(1, 2, 1000)
+    print('  arrays %8.0f integrals/s' %
+          (len(array) * len(mixed) /
+           best_time(lambda: [Expr(f).integrate('x', 0.5, array)
+                              for f in mixed])))
+
+def bench_simplify():
+    '''Node counts of the first three derivatives of the corpus, as simplified'''
+    total_raw, total = 0, 0
+    for f in corpus:
+        expr = Expr(f).tree_repr
+        counts = []
+        for order in range(3):
+            raw = derive(expr, 'x', {})
+            expr = reduce(raw)
+            total_raw += count_nodes(raw)
+            total += count_nodes(expr)
+            counts.append(count_nodes(expr))
+        print('  %-20s %5d %5d %5d' % (f, *counts))
+    print('  %-20s %5d nodes, from %d unsimplified' % ('total', total,
+                                                       total_raw))
+## -----------------------------------------------------------------------------
+benchmarks = {'diff': bench_diff,
+              'polynomial': bench_polynomial,
+              'chain': bench_chain,
+              'print': bench_print,
+              'tape': bench_tape,
+              'serialize': bench_serialize,
+              'cache': bench_cache,
+              'batch': bench_batch,
+              'sample': bench_sample,
+              'dual': bench_dual,
+              'gradient': bench_gradient,
+              'taylor': bench_taylor,
+              'definite': bench_definite,
+              'simplify': bench_simplify}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or benchmarks:
+        print('%s: %s' % (name, benchmarks[name].__doc__))
+        benchmarks[name]()
+## END -------------------------------------------------------------------------
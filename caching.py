@@ -0,0 +1,232 @@
+'''
+A persistent cache of results for CAS.
+
+Differentiating or integrating an expression that has been seen before -- in
+an earlier run, or in another process -- can fetch the result from a cache on
+disk rather than work it out again. The cache is an SQLite database, shared
+safely between processes, and kept under a size limit by evicting the results
+least recently used.
+
+Results are keyed by a digest of the operation, its variable, the input tree
+(as serialized, which is canonical: see serialization) and the version of
+CAS's own code, so that results worked out by older code are never reused.
+The cache is off until enable is called.
+
+Example: caching.enable('results.db'); Expr('x*sin(x)').d('x')
+'''
+
+import hashlib
+import os
+import sqlite3
+import time
+from threading import Lock
+
+from parser import CacheInfo
+import serialization
+
+## The modules whose code determines the results cached: the version of the
+## cache is a digest of their source, so that changing any of them leaves the
+## results worked out before unused (and, in time, evicted)
+source_modules = ('parser', 'traversal', 'polynomial', 'simplification',
+                  'differentiation', 'integration', 'tape', 'serialization')
+
+def source_version():
+    '''A digest of the source of source_modules'''
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in source_modules:
+        with open(os.path.join(directory, name + '.py'), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+version = source_version()
+
+## The database schema. The total size of the results is kept up to date by
+## triggers, so that it never has to be summed up.
+schema = '''
+CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY,
+                                    value BLOB NOT NULL,
+                                    size INTEGER NOT NULL,
+                                    used REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0),
+                                   size INTEGER NOT NULL);
+INSERT OR IGNORE INTO totals VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS results_inserted AFTER INSERT ON results
+BEGIN
+    UPDATE totals SET size = size + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS results_deleted AFTER DELETE ON results
+BEGIN
+    UPDATE totals SET size = size - old.size;
+END;
+'''
+
+class ResultCache():
+    '''
+    A cache of results in the SQLite database in the file named filename,
+    holding at most about maxsize bytes of them. Any number of processes may
+    use the same file at once; each ResultCache counts its own hits and
+    misses.
+    '''
+    def __init__(self, filename, maxsize=256 * 2**20):
+        self.filename = filename
+        self.maxsize = maxsize
+        self.hits, self.misses = 0, 0
+        self.lock = Lock()
+        # the connection, and the process it belongs to: a connection can't be
+        # shared with a child process, so one forked off makes its own
+        self.connection, self.pid = None, None
+        # the file may have been left larger than maxsize allows
+        with self.lock:
+            connection = self.connect()
+            connection.execute('BEGIN IMMEDIATE')
+            self.evict(connection)
+            connection.execute('COMMIT')
+
+    def connect(self):
+        if self.connection is None or self.pid != os.getpid():
+            # in autocommit mode, so that writes can take the database lock up
+            # front, with BEGIN IMMEDIATE; readers never block, in WAL mode
+            self.connection = sqlite3.connect(self.filename, timeout=60,
+                                              isolation_level=None,
+                                              check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.executescript(schema)
+            self.pid = os.getpid()
+        return self.connection
+
+    def key(self, operation, expr, var):
+        '''The key of the result of operation on expr, with respect to var'''
+        digest = hashlib.sha256()
+        for part in (version, operation, var):
+            digest.update(serialization.string(part))
+        digest.update(serialization.encoded(expr))
+        return digest.digest()
+
+    def get(self, key):
+        '''The result stored under key, or None'''
+        with self.lock:
+            try:
+                connection = self.connect()
+                row = connection.execute('SELECT value FROM results '
+                                         'WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    connection.execute('UPDATE results SET used = ? '
+                                       'WHERE key = ?', (time.time(), key))
+                    result, = serialization.loads(row[0])
+                    self.hits += 1
+                    return result
+            except (sqlite3.Error, serialization.SerializationError):
+                # a cache that can't be read is no worse than an empty one
+                pass
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        '''Store result under key, evicting older results if need be'''
+        try:
+            value = serialization.dumps([result])
+        except serialization.SerializationError:
+            # a result that can't be serialized just isn't kept
+            return
+        with self.lock:
+            try:
+                connection = self.connect()
+                connection.execute('BEGIN IMMEDIATE')
+                try:
+                    connection.execute('INSERT OR IGNORE INTO results '
+                                       'VALUES (?, ?, ?, ?)',
+                                       (key, value, len(value), time.time()))
+                    self.evict(connection)
+                    connection.execute('COMMIT')
+                except sqlite3.Error:
+                    connection.execute('ROLLBACK')
+                    raise
+            except sqlite3.Error:
+                # the result just isn't kept
+                pass
+
+    def evict(self, connection):
+        '''Delete the least recently used results until under maxsize'''
+        while self.size(connection) > self.maxsize:
+            connection.execute('DELETE FROM results WHERE key IN '
+                               '(SELECT key FROM results ORDER BY used '
+                               'LIMIT 16)')
+
+    def size(self, connection):
+        return connection.execute('SELECT size FROM totals').fetchone()[0]
+
+    def cached(self, operation, expr, var, compute):
+        '''
+        The result of operation on expr with respect to var: from the cache,
+        or else from compute(), which is then stored. A failure of the cache
+        never fails the computation: at worst, the result is worked out again.
+        '''
+        try:
+            key = self.key(operation, expr, var)
+        except serialization.SerializationError:
+            # an expression that can't be serialized can't be looked up
+            return compute()
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            if result is not None:
+                self.put(key, result)
+        return result
+
+    def __len__(self):
+        with self.lock:
+            return self.connect().execute('SELECT COUNT(*) FROM results')\
+                .fetchone()[0]
+
+    def clear(self):
+        '''Empty the cache and reset its statistics.'''
+        with self.lock:
+            connection = self.connect()
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('DELETE FROM results')
+            connection.execute('COMMIT')
+            self.hits, self.misses = 0, 0
+
+    def info(self):
+        '''
+        Report the cache's hit/miss statistics, size limit and current size,
+        in bytes
+        '''
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize,
+                             self.size(self.connect()))
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None and self.pid == os.getpid():
+                self.connection.close()
+            self.connection = None
+
+## The cache in use, if any
+result_cache = None
+
+def enable(filename, maxsize=256 * 2**20):
+    '''Cache results in the file named filename, and return the cache'''
+    global result_cache
+    disable()
+    result_cache = ResultCache(filename, maxsize)
+    return result_cache
+
+def disable():
+    '''Stop caching results'''
+    global result_cache
+    if result_cache is not None:
+        result_cache.close()
+        result_cache = None
+
+def cached(operation, expr, var, compute):
+    '''
+    The result of operation on expr with respect to var: compute(), unless the
+    result is in the cache (see ResultCache.cached)
+    '''
+    if result_cache is None:
+        return compute()
+    return result_cache.cached(operation, expr, var, compute)
+## END -------------------------------------------------------------------------
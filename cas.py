@@ -1,9 +1,19 @@
 import differentiation
 import integration
-from parser import Parser, ParseTree, Operators, relative_precedence,\
-    Func, Transform, MinusOp
+import quadrature
+import evaluation
+import autodiff
+import cse
+import printing
+import tape
+import serialization
+from batch import batch_map
+import plotting
+from parser import ParseTree, Number, Name, Operator, parse_cache
+from simplification import reduce
+from traversal import substitute
 
-from fractions import Fraction
+from math import factorial
 import os
 
 class Expr():
@@ -12,25 +22,265 @@ class Expr():
         if expr_tree:
             self.tree_repr = expr_tree
         else:
-            self.tree_repr = Parser().parse(self.string_repr)
+            self.tree_repr = parse_cache.parse(self.string_repr)
+        # compiled versions of the expression, keyed by their variables
+        self.compiled = {}
+        # compiled value-and-derivative functions (see autodiff), keyed by the
+        # variable, the variables given, and whether they take arrays
+        self.duals = {}
+        # compiled value-and-gradient functions, keyed likewise by the
+        # variables differentiated with respect to
+        self.gradients = {}
+        # the derivatives found so far, with respect to each variable: the
+        # expression, then its first derivative, its second, and so on
+        self.derivative_chains = {}
+        # the definite integrals with respect to each variable, as functions
+        # of their bounds (see quadrature)
+        self.definite_integrals = {}
+        # the printed expression, keyed by gnuplot_mode
+        self.rendered = {}
 
-    def d(self, var):
+    def __eq__(self, other):
+        # parse trees are interned, so identical expressions share one tree
+        return isinstance(other, Expr) and self.tree_repr is other.tree_repr
+
+    def __hash__(self):
+        return hash(self.tree_repr)
+
+    def d(self, var, n=1):
+        '''
+        Differentiate the expression n times (once, by default) with respect
+        to the variable given by the string var.
+        
+        The derivatives are kept as they are found, each simplified before the
+        next is found from it, so that asking for a higher derivative later
+        carries on from the highest found so far. The derivative returned
+        keeps the rest of them, too.
+        
+        Example: f.d('x') to differentiate some expression f wrt the variable x;
+        f.d('x', 4) for its fourth derivative.
+        '''
+        if n < 0:
+            raise ValueError('Cannot differentiate %d times' % n)
+        chain = self.derivative_chains.setdefault(var, [self.tree_repr])
+        while len(chain) <= n:
+            chain.append(differentiation.diff(chain[-1], var))
+        derivative = Expr(expr_tree=chain[n])
+        derivative.derivative_chains[var] = chain[n:]
+        return derivative
+
+    def taylor(self, var, point=0, order=5):
+        '''
+        The Taylor polynomial of the expression in var about point (a number,
+        or an Expr), with the terms up to (var - point)^order, as an Expr. It
+        is written in Horner's form, to be evaluated with as few operations as
+        possible:
+        
+            c0 + (var - point)*(c1 + (var - point)*(c2 + ...))
+        
+        where ck is the kth derivative at point, divided by k!, simplified.
+        The derivatives are found, and kept, as by d.
+        
+        Example: Expr('exp(x)').taylor('x', 0, 3) gives 1+x*(1+x*(1/2+x*(1/6)))
+        '''
+        if isinstance(point, Expr):
+            point = point.tree_repr
+        elif not isinstance(point, ParseTree) and not isinstance(point, Name):
+            point = Number(point)
+        self.d(var, order)
+        chain = self.derivative_chains[var]
+        coefficients = [reduce(ParseTree([Operator('/'),
+                                          substitute(chain[k], var, point),
+                                          Number(factorial(k))]))
+                        for k in range(order + 1)]
+        step = reduce(ParseTree([Operator('-'), Name(var), point]))
+        zero = Number(0)
+        polynomial = coefficients[-1]
+        for coefficient in reversed(coefficients[:-1]):
+            if polynomial is not zero:
+                polynomial = ParseTree([Operator('*'), step, polynomial])
+                if coefficient is not zero:
+                    polynomial = ParseTree([Operator('+'), coefficient,
+                                            polynomial])
+            else:
+                polynomial = coefficient
+        return Expr(expr_tree=polynomial)
+
+    def gradient(self, vars):
         '''
-        Differentiate the expression with respect to the variable given by the
-        string var.
+        Differentiate the expression with respect to each of the variables in
+        vars; returns a list of Exprs.
         
-        Example: f.d('x') to differentiate some expression f wrt the variable x.
+        Example: f.gradient(['x', 'y'])
         '''
-        return Expr(expr_tree=differentiation.diff(self.tree_repr, var))
+        return [Expr(expr_tree=tree)
+                for tree in differentiation.gradient(self.tree_repr, vars)]
 
-    def integrate(self, var):
+    def hessian(self, vars):
+        '''
+        The matrix of second derivatives of the expression with respect to
+        vars, as a list of rows of Exprs.
+        '''
+        return [[Expr(expr_tree=tree) for tree in row]
+                for row in differentiation.hessian(self.tree_repr, vars)]
+
+    def integrate(self, var, a=None, b=None, /, tolerance=1e-10,
+                  with_error=False, **bindings):
         '''
         Integrate the expression with respect to var; used in similar fashion as
         d.
+        
+        Given bounds a and b, the definite integral from a to b instead: a
+        number, with any other variables given values as keyword arguments
+        (the bounds are given by position, so these may be named a or b, too).
+        Any of these may be NumPy arrays, which are broadcast against each
+        other, for an array of integrals, all found at once. The integral is
+        worked out from the antiderivative, if CAS can find one and the
+        expression is finite from a to b; otherwise, found numerically, to
+        within about tolerance (see quadrature). If with_error, an estimate of
+        its error is returned with it.
+        
+        Example: f.integrate('x', 0, 1) for the integral of f from 0 to 1;
+        Expr('a*x').integrate('x', 0, 1, a=2) with a given a value.
+        '''
+        if a is None and b is None:
+            return Expr(expr_tree=integration.integrate(self.tree_repr, var))
+        if a is None or b is None:
+            raise ValueError('A definite integral needs both bounds')
+        try:
+            integral = self.definite_integrals[var]
+        except KeyError:
+            integral = quadrature.definite_integral(self.tree_repr, var)
+            self.definite_integrals[var] = integral
+        value, error = integral(a, b, bindings, tolerance)
+        return (value, error) if with_error else value
+    
+    def compile(self, *vars):
+        '''
+        Compile the expression into a Python function of the given variables,
+        for fast numeric evaluation. The function is compiled once, and reused
+        by later calls with the same variables.
+        
+        Example: f.compile('x', 'y')(1, 2) to evaluate f at x=1, y=2.
+        '''
+        try:
+            return self.compiled[vars]
+        except KeyError:
+            func = evaluation.compile_tree(self.tree_repr, vars)
+            self.compiled[vars] = func
+            return func
+    
+    def evaluate_array(self, **bindings):
+        '''
+        Evaluate the expression over NumPy arrays, given for each variable as
+        keyword arguments; the arrays are broadcast against each other.
+        
+        Example: f.evaluate_array(x=numpy.linspace(0, 1, 1000000))
+        '''
+        return evaluation.evaluate_array(self.tree_repr, bindings)
+    
+    def eval_with_derivative(self, var, **point):
+        '''
+        Evaluate the expression, and its derivative with respect to var, at a
+        single point, given by the value of each variable as keyword arguments;
+        returns the pair. The derivative is found with the value, without
+        being built as an expression (see autodiff). The function doing so is
+        compiled once, and reused by later calls with the same variables.
+        
+        Example: f.eval_with_derivative('x', x=1, y=2)
+        '''
+        return self.__dual(var, tuple(sorted(point)), False)(**point)
+    
+    def eval_with_derivative_array(self, var, **bindings):
+        '''
+        Evaluate the expression, and its derivative with respect to var, over
+        NumPy arrays, given for each variable as keyword arguments; the arrays
+        are broadcast against each other. Returns a pair of arrays.
+        
+        Example: f.eval_with_derivative_array('x', x=numpy.linspace(0, 1, 1000))
+        '''
+        numpy = evaluation.numpy
+        if numpy is None:
+            raise evaluation.EvaluationError('Evaluation over arrays requires '
+                                             'NumPy')
+        arrays = {name:numpy.asarray(values, dtype=float)
+                  for name, values in bindings.items()}
+        shape = numpy.broadcast_shapes(*[a.shape for a in arrays.values()])
+        results = self.__dual(var, tuple(sorted(arrays)), True)(**arrays)
+        return tuple([numpy.array(numpy.broadcast_to(result, shape), float)
+                      for result in results])
+    
+    def eval_with_gradient(self, vars, **point):
+        '''
+        Evaluate the expression, and its derivatives with respect to each of
+        the variables in vars, at a single point, given by the value of each
+        variable as keyword arguments; returns the value and a list of the
+        derivatives. They are found together, in reverse mode (see autodiff),
+        for a few times the cost of evaluating the expression however many
+        variables there are.
+        
+        Example: f.eval_with_gradient(['x', 'y'], x=1, y=2)
+        '''
+        return self.__gradient(tuple(vars), tuple(sorted(point)),
+                               False)(**point)
+    
+    def eval_with_gradient_array(self, vars, **bindings):
+        '''
+        Evaluate the expression, and its derivatives with respect to each of
+        the variables in vars, over NumPy arrays, given for each variable as
+        keyword arguments; the arrays are broadcast against each other.
+        Returns an array of values, and a list of arrays of derivatives.
+        '''
+        numpy = evaluation.numpy
+        if numpy is None:
+            raise evaluation.EvaluationError('Evaluation over arrays requires '
+                                             'NumPy')
+        arrays = {name:numpy.asarray(values, dtype=float)
+                  for name, values in bindings.items()}
+        shape = numpy.broadcast_shapes(*[a.shape for a in arrays.values()])
+        value, gradient = self.__gradient(tuple(vars), tuple(sorted(arrays)),
+                                          True)(**arrays)
+        return (numpy.array(numpy.broadcast_to(value, shape), float),
+                [numpy.array(numpy.broadcast_to(derivative, shape), float)
+                 for derivative in gradient])
+    
+    def __dual(self, var, vars, arrays):
+        try:
+            return self.duals[var, vars, arrays]
+        except KeyError:
+            func = autodiff.compile_dual(self.tree_repr, var, vars, arrays)
+            self.duals[var, vars, arrays] = func
+            return func
+    
+    def __gradient(self, wrt, vars, arrays):
+        try:
+            return self.gradients[wrt, vars, arrays]
+        except KeyError:
+            func = autodiff.compile_gradient(self.tree_repr, wrt, vars, arrays)
+            self.gradients[wrt, vars, arrays] = func
+            return func
+    
+    def to_tape(self):
+        '''
+        The expression as a Tape: a compact, array-backed form that can be
+        evaluated, differentiated and printed directly (see tape). Convert it
+        back with Expr(expr_tree=t.to_tree()).
+        '''
+        return tape.from_tree(self.tree_repr)
+    
+    def cse(self):
+        '''
+        Eliminate common subexpressions. Returns a list of temporaries, as
+        (name, Expr) pairs, and the expression in terms of them; see
+        cse.eliminate.
         '''
-        return Expr(expr_tree=integration.integrate(self.tree_repr, var))
+        temporaries, tree = cse.eliminate(self.tree_repr)
+        return ([(temp.value, Expr(expr_tree=subtree))
+                 for temp, subtree in temporaries],
+                Expr(expr_tree=tree))
     
-    def plot(self, title=None, labels=None, range=None):
+    def plot(self, title=None, labels=None, range=None, output=None,
+             sample=None):
         '''
         Plot the expression using gnuplot.
         
@@ -40,109 +290,107 @@ class Expr():
         When range is specified as a tuple of tuples of numbers (eg., ((0,1),
         (-1,1))), the first two will be set as the xrange and the last two, as
         the yrange.
+        If output is the name of a file, the plot is written to it (as png,
+        svg, and so on, according to its extension) rather than shown.
+        If sample is true, the expression is sampled in Python, at points
+        placed adaptively, and the points plotted; this is done anyway if
+        gnuplot couldn't evaluate it (see plotting).
+        
+        Plots are sent to a gnuplot process shared by all of them, and drawn
+        in the background; see plotting.
         '''
-        # some things we need from outside
-        from tempfile import NamedTemporaryFile
-        from subprocess import Popen
-        
-        # the expression must be sent to gnuplot in the proper format
-        plot_func = self.__str__(gnuplot_mode=True)
-        # we need to create a temporary file to hold the gnuplot commands; its
-        # contents will be sent to gnuplot via the subprocess facilities
-        plot_file = NamedTemporaryFile(mode='w+')
-        
-        # now we move on to building up the commands
-        # first, a setting to make our plots look nicer
-        plot_file.write('set samples 200\n')
-        # second, has the user specified a title for the plot?
-        if title:
-            plot_file.write('set title "%s"\n' % title)
-        # ok, how about labels for the axes?
-        if labels:
-            plot_file.write('set xlabel "%s"\nset ylabel "%s"\n' % labels)
-        # has the range been specified?
-        if range:
-            if range[0]:
-                plot_file.write('set xrange [%s:%s]\n' % range[0])
-            if len(range) == 2 and range[1]:
-                plot_file.write('set yrange [%s:%s]\n' % range[1])
-        # write plot_func to plot_file
-        plot_file.write('plot %s\n' % plot_func)
-        
-        # flush; need this so that we can send the file to gnuplot
-        plot_file.flush()
-        
-        # now, plot!
-        p = Popen('gnuplot -persist %s' % plot_file.name, shell=True)
-        p.wait()
-        # clean up
-        plot_file.close()
+        plotting.session().plot([self], title, labels, range, output,
+                                sample=sample)
         
     def __format(self, gnuplot_mode=False):
         '''
-        Format output for printing and for plotting
+        Format output for printing and for plotting. Yields the output a piece
+        at a time, in order (see printing).
         '''
-        def gnuplotized(value):
-            if value == '^' and gnuplot_mode is True:
-                return '**'
-            else:
-                return value
-        
-        def operators_p(*ops):
-            if False in [(lambda x: x in Operators)(op) for op in ops]:
-                return False
-            else:
-                return True
+        return printing.pieces(printing.tree_output(self.tree_repr,
+                                                    gnuplot_mode))
+    
+    def write(self, file, gnuplot_mode=False, chunk_size=65536):
+        '''
+        Write the expression, as str would give it, to file (anything with a
+        write method), a chunk of about chunk_size pieces at a time, so that a
+        very large expression never has to be held in memory as one string.
         
-        def precedence_for_parens(root, subtree):
-            if operators_p(root.value, subtree.root.value) and\
-                      relative_precedence(root.value, subtree.root.value) > 0:
-                return ['('] + converter(subtree) + [')']
-            else:
-                return converter(subtree)
-        
-        def parenthesizer(expr):
-            parenthesized_expr = []
-            
-            # do we need to parenthesize the left subtree?
-            if isinstance(expr.left, ParseTree):
-                parenthesized_expr += \
-                    precedence_for_parens(expr.root, expr.left)
-            else:
-                parenthesized_expr += converter(expr.left)
-            # now add the operator
-            parenthesized_expr += [gnuplotized(expr.root.value)]
-            # what about the right subtree?
-            if isinstance(expr.right, ParseTree):
-                parenthesized_expr += \
-                    precedence_for_parens(expr.root, expr.right)
-            else:
-                if expr.root.value == '^' and type(expr.right.value) == Fraction:
-                    parenthesized_expr += ['(%s)' % expr.right]
-                else:
-                    parenthesized_expr += converter(expr.right)
-            
-            return parenthesized_expr
-        
-        def converter(expr):
-            if not isinstance(expr, ParseTree):
-                return ['%s' % expr.value]
-            else:
-                if isinstance(expr.root, Func):
-                    return [expr.root.value] + ['('] + converter(expr.left) +\
-                        [')']
-                elif isinstance(expr.root, Transform):
-                    return [expr.root.value] + ['['] + converter(expr.left) +\
-                        [', '] + converter(expr.right) + [']']
-                elif isinstance(expr.root, MinusOp):
-                    return [expr.root.value] + converter(expr.left)
-                elif expr.right:
-                    return parenthesizer(expr)
-        
-        return converter(self.tree_repr)
+        Example: f.write(sys.stdout)
+        '''
+        if gnuplot_mode in self.rendered:
+            file.write(self.rendered[gnuplot_mode])
+        else:
+            printing.write(printing.tree_output(self.tree_repr, gnuplot_mode),
+                           file, chunk_size)
     
     def __str__(self, gnuplot_mode=False):
-        output = ''
-        for token in self.__format(gnuplot_mode):
-            output += token
-        return output
+        # printed once, then kept: expressions are immutable
+        try:
+            return self.rendered[gnuplot_mode]
+        except KeyError:
+            output = ''.join(self.__format(gnuplot_mode))
+            self.rendered[gnuplot_mode] = output
+            return output
+
+def jacobian(exprs, vars):
+    '''
+    The matrix of derivatives of each of exprs (a list of Exprs) with respect
+    to each of vars, as a list of rows of Exprs, one row per expression.
+    '''
+    return [[Expr(expr_tree=tree) for tree in row]
+            for row in differentiation.jacobian([e.tree_repr for e in exprs],
+                                                vars)]
+
+def compile_matrix(exprs, *vars):
+    '''
+    Compile a list of Exprs -- or a list of lists of them, such as a Hessian
+    or a Jacobian -- into a single Python function of the given variables. It
+    returns the values of all of them, in the same shape, computing any
+    subexpressions they share only once.
+    
+    Example: compile_matrix(f.hessian(['x', 'y']), 'x', 'y')(1, 2)
+    '''
+    def trees(exprs):
+        if isinstance(exprs, Expr):
+            return exprs.tree_repr
+        return [trees(item) for item in exprs]
+    
+    return evaluation.compile_trees(trees(exprs), vars)
+
+def save(exprs, filename):
+    '''
+    Save Exprs -- a list of them, or a dict mapping names to them -- to the
+    file named filename, in CAS's binary format (see serialization).
+    '''
+    if isinstance(exprs, dict):
+        trees = {name:expr.tree_repr for name, expr in exprs.items()}
+    else:
+        trees = [expr.tree_repr for expr in exprs]
+    serialization.dump(trees, filename)
+
+def load(filename):
+    '''
+    Open a file written by save. The Exprs in it are read, by index or by
+    name, only when they are asked for (see serialization.Library).
+    
+    Example: load('derivatives.cas')[0].compile('x')
+    '''
+    return serialization.load(filename, lambda tree: Expr(expr_tree=tree))
+
+def plot(exprs, title=None, labels=None, range=None, output=None,
+         sample=None):
+    '''
+    Plot several Exprs together, in one plot; the arguments are as for
+    Expr.plot.
+    
+    Example: plot([f, f.d('x')], title='f and its derivative')
+    '''
+    plotting.session().plot(exprs, title, labels, range, output,
+                            sample=sample)
+
+if __name__ == '__main__':
+    # python -m cas: the command line interface (see cli)
+    import sys
+    import cli
+    sys.exit(cli.main())
@@ -0,0 +1,142 @@
+'''
+The command line interface to CAS.
+
+    python -m cas [--jsonl] [-i FILE] OPERATION...
+
+reads expressions, one per line, from FILE (or standard input), applies each
+of the operations to each expression in turn, and writes the results, one
+line for each expression, to standard output. The operations are
+
+    d:VAR           differentiate with respect to VAR
+    int:VAR         integrate with respect to VAR
+    simplify        simplify
+    eval:VAR=VALUE,...
+                    evaluate, with the variables given the values listed;
+                    the result is a number, so nothing may come after it
+
+Example: echo 'x^2*sin(x)' | python -m cas d:x d:x eval:x=1
+
+Lines are processed as they are read, and nothing is kept from one to the
+next, so input of any size runs in bounded memory. An expression that can't be
+parsed or processed gets an error message instead of a result, and the run
+carries on; the exit status is 1 if there were any errors.
+'''
+
+import argparse
+import json
+import sys
+
+from cas import Expr
+from parser import Parser
+from simplification import reduce
+import tape
+
+## An exception for operations that can't be understood
+class IllegalOperation(Exception):
+    def __init__(self, error_msg):
+        Exception.__init__(self, error_msg)
+## -----------------------------------------------------------------------------
+## The operations
+## -----------------------------------------------------------------------------
+def differentiate(var):
+    return lambda f: f.d(var)
+
+def integrate(var):
+    return lambda f: f.integrate(var)
+
+def simplify(arg):
+    return lambda f: Expr(expr_tree=reduce(f.tree_repr))
+
+def evaluate(arg):
+    point = {}
+    for binding in arg.split(',') if arg else ():
+        var, equals, value = binding.partition('=')
+        try:
+            point[var.strip()] = float(value)
+        except ValueError:
+            raise IllegalOperation('Not a value for %s: %r' % (var, value))
+    # evaluated straight from the tree, as a tape, since each expression is
+    # evaluated just once
+    return lambda f: tape.from_tree(f.tree_repr).evaluate(**point)
+
+## Each operation's name, and a function that takes its argument (the text
+## after the colon, if any) and returns a function applying it to an Expr
+operations = {'d':differentiate,
+              'int':integrate,
+              'simplify':simplify,
+              'eval':evaluate}
+
+## The operations whose argument must be given
+needs_argument = ('d', 'int')
+
+def operation(spec):
+    '''The function for the operation spec, e.g. 'd:x', on the command line'''
+    name, colon, arg = spec.partition(':')
+    if name not in operations:
+        raise IllegalOperation('Unknown operation: %s' % name)
+    if name in needs_argument and not arg:
+        raise IllegalOperation('No variable given for %s' % name)
+    return operations[name](arg)
+## -----------------------------------------------------------------------------
+## Processing expressions
+## -----------------------------------------------------------------------------
+def process(lines, specs, output, jsonl=False):
+    '''
+    Apply the operations specs to each expression in lines, writing the results
+    to output; in jsonl mode, each result is a JSON object, giving the line
+    number, the input and the result (or the error). Returns the number of
+    errors.
+    '''
+    pipeline = [operation(spec) for spec in specs]
+    if 'eval' in [spec.partition(':')[0] for spec in specs[:-1]]:
+        raise IllegalOperation('eval must be the last operation')
+    # the parse cache is bypassed, so that no tree outlives its line
+    parser = Parser()
+    errors = 0
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            result = Expr(expr_tree=parser.parse(line))
+            for apply in pipeline:
+                result = apply(result)
+            result = result if isinstance(result, float) else str(result)
+            error = None
+        except Exception as e:
+            error = '%s: %s' % (type(e).__name__, e)
+            errors += 1
+        if jsonl:
+            record = {'line':number, 'input':line}
+            if error:
+                record['error'] = error
+            else:
+                record['result'] = result
+            output.write(json.dumps(record) + '\n')
+        else:
+            output.write('error: %s\n' % error if error else
+                         '%s\n' % (repr(result) if isinstance(result, float)
+                                   else result))
+        output.flush()
+    return errors
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(
+        prog='python -m cas',
+        description='Differentiate, integrate, simplify or evaluate '
+        'expressions, one per line.',
+        epilog='Operations: d:VAR, int:VAR, simplify, eval:VAR=VALUE,...')
+    arguments.add_argument('operations', nargs='*', metavar='OPERATION',
+                           help='the operations to apply, in order')
+    arguments.add_argument('-i', '--input', type=argparse.FileType('r'),
+                           default=sys.stdin,
+                           help='the file to read (default: standard input)')
+    arguments.add_argument('--jsonl', action='store_true',
+                           help='write JSON lines, rather than plain text')
+    args = arguments.parse_args(argv)
+    try:
+        errors = process(args.input, args.operations, sys.stdout, args.jsonl)
+    except IllegalOperation as e:
+        arguments.error(str(e))
+    return 1 if errors else 0
+## END -------------------------------------------------------------------------
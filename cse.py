@@ -0,0 +1,86 @@
+'''
+Common subexpression elimination for CAS.
+
+Parse trees are interned, so a subexpression that appears several times in an
+expression -- tan(x) in the derivative of tan(x), say, or the factors the
+product rule copies into both of its terms -- is one shared node. The routines
+here find those nodes, so that they need only be computed once.
+'''
+
+from parser import Name, ParseTree
+from traversal import postorder, subtrees
+
+def count_uses(expr, uses=None):
+    '''
+    Count how many times each subtree of expr is used, i.e., how many times it
+    appears as a child of a node (or, for expr itself, as the root). The counts
+    are added to those in uses, if given.
+    '''
+    if uses is None:
+        uses = {}
+
+    def counter(expr):
+        for child in subtrees(expr):
+            uses[child] = uses.get(child, 0) + 1
+
+    # the uses of a subtree's children are counted once, when the subtree is
+    # first seen, so those already counted are skipped
+    postorder(expr, counter, memo=dict.fromkeys(uses))
+    uses[expr] = uses.get(expr, 0) + 1
+    return uses
+
+def eliminate(expr, prefix='_c'):
+    '''
+    Eliminate the common subexpressions of expr.
+
+    Returns a list of temporaries -- (Name, ParseTree) pairs -- and a final
+    expression. Each shared subexpression is computed once, by a temporary,
+    and replaced everywhere else by that temporary's Name. A temporary only
+    refers to those before it in the list, and the final expression may refer
+    to any of them. The temporaries are named prefix0, prefix1, and so on,
+    skipping any names that expr already uses.
+    '''
+    temporaries, (expr,) = eliminate_all([expr], prefix)
+    return temporaries, expr
+
+def eliminate_all(exprs, prefix='_c'):
+    '''
+    Eliminate the common subexpressions of several expressions at once, so
+    that subexpressions shared between them are computed only once, too.
+    Returns a list of temporaries, as eliminate does, and a list of the final
+    expressions.
+    '''
+    uses = {}
+    for expr in exprs:
+        count_uses(expr, uses)
+    shared = {subtree for subtree, n in uses.items()
+              if n > 1 and isinstance(subtree, ParseTree)}
+    # the names of the expressions' own variables, which the temporaries must
+    # not take
+    taken = {token.value for token in uses if type(token) == Name}
+    temporaries = []
+    replaced = {}
+
+    def new_name():
+        n = len(temporaries)
+        while '%s%d' % (prefix, n) in taken:
+            n += 1
+        taken.add('%s%d' % (prefix, n))
+        return Name('%s%d' % (prefix, n))
+
+    def replacer(expr):
+        if isinstance(expr, ParseTree):
+            new_expr = ParseTree([expr.root] +
+                                 [replaced[child] if child is not None else None
+                                  for child in expr.value[1:]])
+        else:
+            new_expr = expr
+        if expr in shared:
+            temp = new_name()
+            temporaries.append((temp, new_expr))
+            new_expr = temp
+        return new_expr
+
+    return temporaries, [postorder(expr, replacer, memo=replaced)
+                         for expr in exprs]
+## END -------------------------------------------------------------------------
@@ -4,46 +4,119 @@ Differentiation routines for CAS.
 
 from parser import Func, Operator, MinusOp, Name, Number, ParseTree
 from simplification import reduce
+from traversal import postorder
+import polynomial
+import caching
 from operator import add, sub, mul, floordiv, pow
 
 ## First, the master differentiator -- called externally
 ## -----------------------------------------------------------------------------
 def diff(expr, var):
     '''
-    Apply the differentiation rules given in diff_rules to expr_tree.
+    Differentiate expr with respect to var: build the derivative in a single
+    memoized pass (see derive), then simplify it once. If a persistent cache
+    is enabled, the result may come from there instead (see caching).
     '''
-    def sub_diff(expr, var):
+    return caching.cached('d', expr, var,
+                          lambda: reduce(derive(expr, var, {})))
+
+def derive(expr, var, memo):
+    '''
+    Apply the differentiation rules given in diff_rules to expr, without
+    simplifying the result.
+    
+    The tree is traversed bottom-up (see traversal.postorder), so each rule
+    finds the derivatives of its operands already in memo, which maps each
+    subtree differentiated (with respect to var) to its derivative. Parse trees
+    are interned, so a subtree that occurs many times is differentiated only
+    once. Subtrees that don't contain var aren't descended into at all, and
+    polynomials are differentiated as Polynomials.
+    '''
+    # the polynomials found on the way down, to be differentiated on the way up
+    expanded = {}
+
+    def operands(expr):
+        if not isinstance(expr, ParseTree) or var not in expr.free_vars:
+            return ()
+        if expr.polynomial:
+            # differentiate a polynomial all at once, unless it expands into
+            # too many terms
+            try:
+                expanded[expr] = polynomial.from_tree(expr, compact=True)
+                return ()
+            except polynomial.NotPolynomial:
+                pass
+        return [child for child in expr.children if child is not None]
+
+    def differentiator(expr):
+        if var not in expr.free_vars:
+            return Number(0)
+        if expr in expanded:
+            return expanded.pop(expr).diff(var).to_tree()
         try:
             if not isinstance(expr, ParseTree):
-                return diff_rules[type(expr)](expr, var)
+                return diff_rules[type(expr)](expr, var, memo)
             else:
-                return diff_rules[type(expr.root)](expr, var)
+                return diff_rules[type(expr.root)](expr, var, memo)
         except KeyError:
             print(expr)
             print('No rule to differentiate given expression -- check input')
-    
-    return reduce(sub_diff(expr, var))
+            return None
+
+    return postorder(expr, differentiator, operands, memo)
+
+def gradient(expr, vars):
+    '''
+    Differentiate expr with respect to each of the variables in vars, in turn.
+    Each derivative skips the subtrees that don't contain its variable (see
+    derive), and variables that expr doesn't contain at all get a zero
+    derivative without any traversal.
+    '''
+    return [diff(expr, var) if var in expr.free_vars else Number(0)
+            for var in vars]
+
+def hessian(expr, vars):
+    '''
+    The matrix of second derivatives of expr with respect to vars, as a list of
+    rows. Mixed partial derivatives are computed once, for the upper triangle,
+    and shared with the lower.
+    '''
+    first = gradient(expr, vars)
+    rows = [[None] * len(vars) for var in vars]
+    for i in range(len(vars)):
+        rows[i][i:] = gradient(first[i], vars[i:])
+        for j in range(i + 1, len(vars)):
+            rows[j][i] = rows[i][j]
+    return rows
+
+def jacobian(exprs, vars):
+    '''
+    The matrix of derivatives of each of exprs with respect to each of vars, as
+    a list of rows (one per expression).
+    '''
+    return [gradient(expr, vars) for expr in exprs]
 ## -----------------------------------------------------------------------------
 ## Differentiation of functions
 ## -----------------------------------------------------------------------------
-def diff_func(expr, var):
+def diff_func(expr, var, memo):
     '''
     Differentiate a function
     '''
     try:
-        return chain_rule(func_diff_rules[expr.root.value], expr, var)
+        return chain_rule(func_diff_rules[expr.root.value], expr, var, memo)
     except KeyError:
         return chain_rule(
             lambda e, v: ParseTree([Func('d[%s, %s]' % (e.root.value, v)),
                                     e.left]),
             expr,
-            var)
+            var,
+            memo)
 
-def chain_rule(func, expr, var):
+def chain_rule(func, expr, var, memo):
     '''
     Perform the chain rule
     '''
-    return ParseTree([Operator('*'), func(expr, var), diff(expr.left, var)])
+    return ParseTree([Operator('*'), func(expr, var), memo[expr.left]])
 
 def d_sin(expr, var):
     '''
@@ -76,7 +149,7 @@ def d_exp(expr, var):
 ## -----------------------------------------------------------------------------
 ## Now we move on to the differentiation of operator expressions.
 ## -----------------------------------------------------------------------------
-def diff_op(expr, var):
+def diff_op(expr, var, memo):
     '''
     Differentiate an operator expression
     '''
@@ -84,50 +157,54 @@ def diff_op(expr, var):
     # rules; we need a case for each rule
     if expr.root.value in ('+', '-'):
         # this is an addition or subtraction
-        return d_add_sub(expr, var)
+        return d_add_sub(expr, var, memo)
     elif expr.root.value == '*':
         # a multiplication
-        return d_mult(expr, var)
+        return d_mult(expr, var, memo)
     elif expr.root.value == '/':
         # a division
-        return d_div(expr, var)
+        return d_div(expr, var, memo)
     elif expr.root.value == '^':
         # an exponent
-        return chain_rule(d_expt, expr, var)
+        return chain_rule(d_expt, expr, var, memo)
     else:
         # uh oh...
         print('Something is wrong -- that\'s not an operator CAS recognizes.')
 
-def d_add_sub(expr, var):
+def d_add_sub(expr, var, memo):
     '''
-    Differentiate an addition or subtraction expression
+    Differentiate an addition or subtraction expression, or a negation
     '''
-    return ParseTree([expr.root,
-                      diff(expr.left, var),
-                      diff(expr.right, var)])
+    if expr.right is None:
+        return ParseTree([expr.root, memo[expr.left]])
+    return ParseTree([expr.root, memo[expr.left], memo[expr.right]])
 
-def d_mult(expr, var):
+def d_mult(expr, var, memo):
     '''
     Differentiate a multiplication expression
     '''
     return ParseTree([Operator('+'),
-                      ParseTree([Operator('*'),
-                                 expr.left,
-                                 diff(expr.right, var)]),
-                      ParseTree([Operator('*'),
-                                 diff(expr.left, var),
-                                 expr.right])])
-def d_div(expr, var):
+                      ParseTree([Operator('*'), expr.left, memo[expr.right]]),
+                      ParseTree([Operator('*'), memo[expr.left], expr.right])])
+
+def d_div(expr, var, memo):
     '''
     Differentiate a division expression
     '''
-    return diff(ParseTree([Operator('*'),
-                           expr.left,
-                           ParseTree([Operator('^'),
-                                      expr.right,
-                                      ParseTree([MinusOp('-'),
-                                                 Number('1')])])]),
-                var)
+    # u/v is differentiated as u*v^(-1), from the derivatives of u and v found
+    # already
+    inverse = ParseTree([Operator('^'),
+                         expr.right,
+                         ParseTree([MinusOp('-'), Number('1')])])
+    if var in expr.right.free_vars:
+        d_inverse = ParseTree([Operator('*'),
+                               d_expt(inverse, var),
+                               memo[expr.right]])
+    else:
+        d_inverse = Number(0)
+    return ParseTree([Operator('+'),
+                      ParseTree([Operator('*'), expr.left, d_inverse]),
+                      ParseTree([Operator('*'), memo[expr.left], inverse])])
 
 def d_expt(expr, var):
     '''
@@ -143,7 +220,7 @@ def d_expt(expr, var):
 ## -----------------------------------------------------------------------------
 ## Name
 ## -----------------------------------------------------------------------------
-def diff_name(expr, var):
+def diff_name(expr, var, memo):
     if expr.value == var:
         return Number(1)
     else:
@@ -151,7 +228,7 @@ def diff_name(expr, var):
 ## -----------------------------------------------------------------------------
 ## Number
 ## -----------------------------------------------------------------------------
-def diff_number(expr, var):
+def diff_number(expr, var, memo):
     return Number(0)
 ## -----------------------------------------------------------------------------
 ## Build the rules tables
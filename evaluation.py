@@ -0,0 +1,260 @@
+'''
+Numeric evaluation routines for CAS.
+
+An expression is evaluated at single points by compiling it, once, into a Python
+function that does the arithmetic directly, rather than by walking its parse
+tree at every point. Over arrays of points, it is evaluated with whole-array
+NumPy operations.
+'''
+
+import math
+from fractions import Fraction
+from keyword import iskeyword
+
+from parser import Func, Transform, MinusOp, Number, ParseTree, Operators
+import cse
+from traversal import postorder
+
+# NumPy is only needed for evaluation over arrays
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+## An exception for expressions that can't be evaluated numerically
+class EvaluationError(Exception):
+    def __init__(self, error_msg):
+        Exception.__init__(self, error_msg)
+
+## Subexpressions nested deeper than this are moved out into temporaries in the
+## generated code; Python's own parser limits how deeply expressions may nest.
+max_nesting = 50
+## -----------------------------------------------------------------------------
+## Function and operator tables
+## -----------------------------------------------------------------------------
+math_funcs = {'sin':math.sin,
+              'cos':math.cos,
+              'tan':math.tan,
+              'exp':math.exp,
+              'ln':math.log,
+              'abs':abs}
+
+python_ops = {'^':'**',
+              '*':'*',
+              '/':'/',
+              '+':'+',
+              '-':'-'}
+
+if numpy:
+    array_funcs = {'sin':numpy.sin,
+                   'cos':numpy.cos,
+                   'tan':numpy.tan,
+                   'exp':numpy.exp,
+                   'ln':numpy.log,
+                   'abs':numpy.absolute}
+
+    array_ops = dict(zip(Operators, (numpy.power,
+                                     numpy.multiply,
+                                     numpy.true_divide,
+                                     numpy.add,
+                                     numpy.subtract)))
+## -----------------------------------------------------------------------------
+## Code generation
+## -----------------------------------------------------------------------------
+def constant(number):
+    '''Python source for a numeric constant'''
+    value = number.value
+    if type(value) == Fraction:
+        value = float(value)
+    if type(value) == float and not math.isfinite(value):
+        return 'float(%r)' % repr(value)
+    return '(%r)' % value if value < 0 else repr(value)
+
+def generate(expr, funcs, vars, statements):
+    '''
+    Generate Python source for expr, and return it. Any statements needed to
+    compute it first (assignments to temporaries) are appended to statements.
+    funcs maps each function name to the name its implementation goes by in the
+    generated code; vars holds the names of the variables expr may use.
+    '''
+
+    # maps each subexpression to its source, and how deeply that source nests
+    converted = {}
+
+    def converter(expr):
+        if isinstance(expr, Number):
+            return constant(expr), 0
+        elif not isinstance(expr, ParseTree):
+            if expr.value not in vars:
+                raise EvaluationError('No value for variable: %s' % expr.value)
+            return expr.value, 0
+        elif isinstance(expr.root, Transform):
+            raise EvaluationError('Cannot evaluate an integral with respect '
+                                  'to %s that CAS has no antiderivative for' %
+                                  expr.right.value)
+        elif isinstance(expr.root, Func):
+            if expr.root.value not in funcs:
+                raise EvaluationError('Unknown function: %s' %
+                                      expr.root.value)
+            arg, depth = converted[expr.left]
+            code = '%s(%s)' % (funcs[expr.root.value], arg)
+        elif isinstance(expr.root, MinusOp) and expr.right is None:
+            arg, depth = converted[expr.left]
+            code = '(-%s)' % arg
+        else:
+            left, left_depth = converted[expr.left]
+            right, right_depth = converted[expr.right]
+            depth = max(left_depth, right_depth)
+            code = '(%s %s %s)' % (left, python_ops[expr.root.value], right)
+
+        if depth + 1 < max_nesting:
+            return code, depth + 1
+        temp = '_t%d' % len(statements)
+        statements.append('%s = %s' % (temp, code))
+        return temp, 0
+
+    return postorder(expr, converter, memo=converted)[0]
+
+def check_variables(vars):
+    '''
+    Check that the variables named in vars can be the parameters of a compiled
+    function: names beginning with an underscore are kept for its own use
+    '''
+    for var in vars:
+        if not var.isidentifier() or iskeyword(var) or var.startswith('_'):
+            raise EvaluationError('Cannot compile with variable name %r' % var)
+
+def compile_tree(expr, vars):
+    '''
+    Compile expr into a Python function of the variables named in vars (a
+    sequence of strings), taken in that order. Common subexpressions are
+    computed once, and kept in local variables.
+    '''
+    return compile_trees(expr, vars)
+
+def compile_trees(exprs, vars):
+    '''
+    Compile exprs -- a parse tree, or a list of them, or a list of lists, and
+    so on -- into a single Python function of the variables named in vars. The
+    function returns its results in the same shape as exprs. Subexpressions
+    shared between the expressions are computed only once.
+    '''
+    check_variables(vars)
+
+    def flatten(exprs):
+        if isinstance(exprs, (list, tuple)):
+            for item in exprs:
+                yield from flatten(item)
+        else:
+            yield exprs
+
+    namespace = {'_' + name:func for name, func in math_funcs.items()}
+    funcs = {name:'_' + name for name in math_funcs}
+    temporaries, results = cse.eliminate_all(list(flatten(exprs)))
+    names = set(vars) | {temp.value for temp, subexpr in temporaries}
+    statements = []
+    for temp, subexpr in temporaries:
+        statements.append('%s = %s' % (temp.value,
+                                       generate(subexpr, funcs, names,
+                                                statements)))
+    results = iter([generate(result, funcs, names, statements)
+                    for result in results])
+
+    def shaped(exprs):
+        # the source for the results, nested in the same way as exprs
+        if isinstance(exprs, (list, tuple)):
+            return '[%s]' % ', '.join([shaped(item) for item in exprs])
+        else:
+            return next(results)
+
+    source = '\n    '.join(['def compiled(%s):' % ', '.join(vars)] +
+                           statements +
+                           ['return %s\n' % shaped(exprs)])
+
+    try:
+        exec(source, namespace)
+    except SyntaxError as e:
+        raise EvaluationError('Could not compile expression: %s' % e)
+    return namespace['compiled']
+## -----------------------------------------------------------------------------
+## Evaluation over arrays
+## -----------------------------------------------------------------------------
+def evaluate_array(expr, bindings):
+    '''
+    Evaluate expr over arrays of points. bindings maps each variable to an
+    array (or anything NumPy can turn into one) of its values; the arrays are
+    broadcast against each other, so a meshgrid gives a grid of results.
+    
+    Every operation is a whole-array NumPy ufunc, and intermediate results are
+    overwritten in place once used, so only a few temporary arrays are
+    allocated however large expr is. Common subexpressions are computed once.
+    '''
+    if numpy is None:
+        raise EvaluationError('Evaluation over arrays requires NumPy')
+
+    arrays = {name:numpy.asarray(values, dtype=float)
+              for name, values in bindings.items()}
+    shape = numpy.broadcast_shapes(*[a.shape for a in arrays.values()])
+    arrays = {name:numpy.broadcast_to(a, shape) for name, a in arrays.items()}
+
+    # ids of the temporary arrays created during evaluation: these, and only
+    # these, may be overwritten with the results of later operations
+    temporaries = set()
+
+    def apply(ufunc, *args):
+        for arg in args:
+            if id(arg) in temporaries:
+                return ufunc(*args, out=arg)
+        result = ufunc(*args)
+        if isinstance(result, numpy.ndarray):
+            temporaries.add(id(result))
+        return result
+
+    # the value of each subexpression; once used, those of parse trees are
+    # dropped, since after common subexpression elimination each is used only
+    # once, and would otherwise hold on to its array
+    values = {}
+
+    def value(expr):
+        if isinstance(expr, ParseTree):
+            return values.pop(expr)
+        return values[expr]
+
+    def evaluator(expr):
+        if isinstance(expr, Number):
+            return float(expr.value)
+        elif not isinstance(expr, ParseTree):
+            try:
+                return arrays[expr.value]
+            except KeyError:
+                raise EvaluationError('No value for variable: %s' % expr.value)
+        elif isinstance(expr.root, Transform):
+            raise EvaluationError('Cannot evaluate an integral with respect '
+                                  'to %s that CAS has no antiderivative for' %
+                                  expr.right.value)
+        elif isinstance(expr.root, Func):
+            try:
+                func = array_funcs[expr.root.value]
+            except KeyError:
+                raise EvaluationError('Unknown function: %s' % expr.root.value)
+            return apply(func, value(expr.left))
+        elif isinstance(expr.root, MinusOp) and expr.right is None:
+            return apply(numpy.negative, value(expr.left))
+        else:
+            return apply(array_ops[expr.root.value],
+                         value(expr.left),
+                         value(expr.right))
+
+    common, expr = cse.eliminate(expr)
+    for temp, subexpr in common:
+        result = postorder(subexpr, evaluator, memo=values)
+        # the value is used more than once, so it must not be overwritten
+        temporaries.discard(id(result))
+        arrays[temp.value] = result
+
+    result = postorder(expr, evaluator, memo=values)
+    if id(result) in temporaries:
+        return result
+    # a constant, or a bare variable: return a fresh array of the full shape
+    return numpy.array(numpy.broadcast_to(result, shape))
+## END -------------------------------------------------------------------------
@@ -2,30 +2,69 @@
 Integration routines for CAS.
 
 Currently, CAS can integrate the trigonometric functions sin, cos, and tangent,
-powers of a variable, and any sum or difference of these.
+powers of a variable, and any sum or difference of these. Polynomials are
+integrated all at once, as Polynomials.
 '''
 
 from parser import Func, Operator, MinusOp, Name, Number, ParseTree, Transform
 from simplification import reduce
+from traversal import postorder
+import polynomial
+import caching
 
 ## The master integrator, called by Expr.integrate
 ## -----------------------------------------------------------------------------
 def integrate(expr, var):
-    def sub_int(expr, var):
+    '''
+    Integrate expr with respect to var, and simplify the result.
+
+    The tree is traversed bottom-up (see traversal.postorder), visiting only
+    those operands whose integrals the rules build on -- the terms of a sum,
+    and the factor of a product that isn't constant -- so each rule finds them
+    in memo, which maps each subtree integrated to its integral. If a
+    persistent cache is enabled, the result may come from there instead (see
+    caching).
+    '''
+    memo = {}
+
+    def operands(expr):
+        if not isinstance(expr, ParseTree) or var not in expr.free_vars or\
+                expr.polynomial or not isinstance(expr.root, Operator):
+            return ()
+        elif expr.root.value in ('+', '-'):
+            return [child for child in expr.children if child is not None]
+        elif expr.root.value == '*':
+            # only a constant multiple is integrated, through its other factor
+            if var not in expr.left.free_vars:
+                return [expr.right]
+            elif var not in expr.right.free_vars:
+                return [expr.left]
+        return ()
+
+    def integrator(expr):
+        # a subtree that doesn't contain var is a constant, however complex
+        if var not in expr.free_vars:
+            return int_const(expr, var)
+        # the rules below integrate few polynomials other than sums of powers
+        # of var, so a polynomial is expanded, however many terms it has
+        if isinstance(expr, ParseTree) and expr.polynomial:
+            return polynomial.from_tree(expr).integrate(var).to_tree()
         try:
             if not isinstance(expr, ParseTree):
-                return int_rules[type(expr)](expr, var)
+                return int_rules[type(expr)](expr, var, memo)
             else:
-                return int_rules[type(expr.root)](expr, var)
+                return int_rules[type(expr.root)](expr, var, memo)
         except KeyError:
             print(expr)
             print('No rule to integrate given expression')
-        
-    return reduce(sub_int(expr, var))
+
+    return caching.cached('integrate', expr, var,
+                          lambda: reduce(postorder(expr, integrator, operands,
+                                                   memo)))
 ## -----------------------------------------------------------------------------
 ## Integration of the trigonometric functions
 ## -----------------------------------------------------------------------------
-def int_func(expr, var):
+def int_func(expr, var, memo):
     '''
     Integrate the trig functions
     '''
@@ -65,41 +104,47 @@ trig_int_rules = {'sin':i_sin,
 ## -----------------------------------------------------------------------------
 ## Integration of operator expressions
 ## -----------------------------------------------------------------------------
-def int_op(expr, var):
+def int_op(expr, var, memo):
     if expr.root.value in ('+', '-'):
-        return i_add_sub(expr, var)
+        return i_add_sub(expr, var, memo)
     elif expr.root.value == '*':
-        return i_mult(expr, var)
+        return i_mult(expr, var, memo)
     elif expr.root.value == '^' and expr.left.value == var:
         return i_pow(expr, var)
     else:
         return ParseTree([Transform('integrate'), expr, Name(var)])
 
-def i_add_sub(expr, var):
+def i_add_sub(expr, var, memo):
     '''
-    Integrate an addition or subtraction expression
+    Integrate an addition or subtraction expression, or a negation
     '''
-    return ParseTree([expr.root,
-                      integrate(expr.left, var),
-                      integrate(expr.right, var)])
+    if expr.right is None:
+        return ParseTree([expr.root, memo[expr.left]])
+    return ParseTree([expr.root, memo[expr.left], memo[expr.right]])
 
-def i_mult(expr, var):
-    '''
-    Integrate those multiplication expressions consisting of a number and a
-    symbolic expression
-    '''
-    if isinstance(expr.left, Number):
-        return ParseTree([expr.root,
-                          expr.left,
-                          integrate(expr.right, var)])
-    elif isinstance(expr.right, Number):
-        return ParseTree([expr.root,
-                          expr.right,
-                          integrate(expr.left, var)])
+def i_mult(expr, var, memo):
+    '''
+    Integrate those multiplication expressions consisting of a constant (with
+    respect to var) and a symbolic expression
+    '''
+    if var not in expr.left.free_vars:
+        return ParseTree([expr.root, expr.left, memo[expr.right]])
+    elif var not in expr.right.free_vars:
+        return ParseTree([expr.root, expr.right, memo[expr.left]])
     else:
         return ParseTree([Transform('integrate'), expr, Name(var)])
 
 def i_pow(expr, var):
+    '''
+    Integrate a constant power of var
+    '''
+    if var in expr.right.free_vars:
+        return ParseTree([Transform('integrate'), expr, Name(var)])
+    # the parser reads x^-1 as x^(-(1)), so the exponent is compared once
+    # simplified
+    exponent = reduce(expr.right)
+    if isinstance(exponent, Number) and exponent.value == -1:
+        return ParseTree([Func('ln'), ParseTree([Func('abs'), expr.left])])
     return ParseTree([Operator('/'),
                       ParseTree([Operator('^'),
                                  expr.left,
@@ -110,12 +155,12 @@ def i_pow(expr, var):
 ## -----------------------------------------------------------------------------
 ## Integration of a constants
 ## -----------------------------------------------------------------------------
-def int_const(expr, var):
+def int_const(expr, var, memo=None):
     return ParseTree([Operator('*'),
                       expr,
                       Name(var)])
 ## -----------------------------------------------------------------------------
-def int_name(expr, var):
+def int_name(expr, var, memo):
     # if the given expression is the first power of the integration variable,
     # then we can integrate it with the power rule
     if expr.value == var:
@@ -126,10 +171,21 @@ def int_name(expr, var):
     else:
         return int_const(expr, var)
 ## -----------------------------------------------------------------------------
+## Integration of integrals CAS couldn't evaluate
+## -----------------------------------------------------------------------------
+def int_transform(expr, var, memo):
+    '''
+    Integrate an integral that CAS had no antiderivative for: CAS has none for
+    this one, either
+    '''
+    return ParseTree([Transform('integrate'), expr, Name(var)])
+## -----------------------------------------------------------------------------
 ## Integration rules table
 ## -----------------------------------------------------------------------------
 int_rules = {Func:int_func,
              Operator:int_op,
+             MinusOp:int_op,
              Name:int_name,
-             Number:int_const}
+             Number:int_const,
+             Transform:int_transform}
 ## END -------------------------------------------------------------------------
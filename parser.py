@@ -3,7 +3,9 @@ The parser for CAS
 '''
 
 import re
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+from threading import Lock
+from weakref import WeakValueDictionary
 
 ## A list of our operators, in order
 Operators = ['^', '*', '/', '+', '-']
@@ -17,10 +19,23 @@ def relative_precedence(op1, op2):
     else:
         return 0
 
+## The binding power of each operator, for the precedence-climbing parser. This
+## follows the order of Operators, but -- as in the pattern-matching parser --
+## '*' and '/' share a level, as do '+' and '-'. Operators on a shared level
+## group to the left; '^' groups to the right.
+binding_power = {'^': 4, '*': 3, '/': 3, '+': 1, '-': 1}
+right_associative = ('^',)
+
+## Negation binds more loosely than '*' and '/', but more tightly than '+' and
+## '-': -x*y is -(x*y), and -x+y is (-x)+y. A negation following another
+## operator binds at least as tightly as that operator: x^-2*y is (x^(-2))*y.
+negation_power = 2
+
 ## An exception we'll need for the tokenizer
 class IllegalToken(Exception):
-    def __init__(self, error_msg):
+    def __init__(self, error_msg, column=None):
         Exception.__init__(self, error_msg)
+        self.column = column
 
 ## ...and one we'll need for the parser
 class IllegalExpr(Exception):
@@ -29,16 +44,20 @@ class IllegalExpr(Exception):
 
 ## The parser class -- also contains the tokenizer
 class Parser():
-    def __init__(self):
+    '''
+    The parser can run on one of two engines: 'precedence', a single-pass
+    precedence-climbing parser (the default), or 'pattern', the original
+    pattern-matching reducer. Both produce the same parse trees.
+    '''
+    engines = ('precedence', 'pattern')
+    
+    def __init__(self, engine='precedence'):
         #self.expr_string = string
+        if engine not in self.engines:
+            raise ValueError('Unknown parser engine: %s' % engine)
+        self.engine = engine
 
-        self.scanning_table = OrderedDict(
-            ((r'[0-9]\.?[0-9]*', Number),
-             (r'\-', MinusOp),
-             (r'\+|\*|\^|/', Operator),
-             (r'\(', OpenParen),
-             (r'\)', CloseParen),
-             (r'\w+', Name)))
+        self.scanning_table = scanning_table
         
         self.operator_precedence = ['^', '*', '/', '+', '-']
     
@@ -70,9 +89,13 @@ class Parser():
     # --------------------------------------------------------------------------
     def parse(self, expr, tokenize=True):
         '''Parse the token stream generated by the tokenizer.'''
+        if self.engine == 'precedence':
+            return self.climb(self.tokenize(expr) if tokenize else expr)
+        
         if tokenize:
-            # get the token stream, then move on to parsing
-            token_stream = self.tokenize(expr)
+            # get the token stream, then move on to parsing; the reducer below
+            # slices the stream, so it needs all of it up front
+            token_stream = list(self.tokenize(expr))
         
         # first up, let's create patterns defining some expressions to look for
         # in the token stream
@@ -115,27 +138,86 @@ class Parser():
         else:
             return subparse(expr)
 
-    def tokenize(self, expr_string):
-        '''Turn the given string into a stream of tokens.'''
+    def climb(self, tokens):
+        '''
+        Parse the given token stream by precedence climbing. This takes a
+        single pass over the stream, and keeps its state on explicit stacks
+        rather than recursing, so it runs in linear time at any nesting depth.
+        '''
+        # operands holds the parse trees built so far; pending holds the
+        # operators (and open parentheses and function calls) still waiting
+        # for their operands, each paired with its binding power and arity
+        operands, pending = [], []
         
-        def scan(string, token_stream):
-            if string != '':
-                match_found = False
-                for regex in self.scanning_table.keys():
-                    m = re.match(regex, string)
-                    if m is not None:
-                        match_found = True
-                        return scan(string[m.end():],
-                                    token_stream +
-                                    [self.scanning_table[regex](m.group())])
-                # if we loop through all the regexes and still don't have a
-                # match, then we have encountered an illegal token
-                if match_found == False:
-                    raise IllegalToken('Illegal token encountered -- check input')
+        def fold(power):
+            # build trees from the pending operators that bind at least as
+            # tightly as power, stopping at any open parenthesis
+            while pending and pending[-1][2] and pending[-1][1] >= power:
+                op, op_power, arity = pending.pop()
+                if arity == 1:
+                    operands.append(ParseTree([op, operands.pop()]))
+                else:
+                    right = operands.pop()
+                    operands.append(ParseTree([op, operands.pop(), right]))
+        
+        tokens = iter(tokens)
+        lookahead = next(tokens, None)
+        expect_operand = True
+        while lookahead is not None:
+            token, lookahead = lookahead, next(tokens, None)
+            if expect_operand:
+                if isinstance(token, Number):
+                    operands.append(token)
+                    expect_operand = False
+                elif isinstance(token, Name):
+                    if isinstance(lookahead, OpenParen):
+                        # a function call; its argument is parsed just like a
+                        # parenthesized expression
+                        pending.append((Func(token.value), None, 0))
+                        lookahead = next(tokens, None)
+                    else:
+                        operands.append(token)
+                        expect_operand = False
+                elif isinstance(token, MinusOp):
+                    # a negation straight after an operator binds only its
+                    # operand: x^-2*y is (x^(-2))*y, not x^(-(2*y))
+                    if pending and pending[-1][2]:
+                        power = max(pending[-1][1], negation_power)
+                    else:
+                        power = negation_power
+                    pending.append((token, power, 1))
+                elif isinstance(token, OpenParen):
+                    pending.append((token, None, 0))
+                else:
+                    raise IllegalExpr('Illegal expression found -- check input')
+            elif isinstance(token, Operator) and token.value in binding_power:
+                power = binding_power[token.value]
+                if token.value in right_associative:
+                    fold(power + 1)
+                else:
+                    fold(power)
+                pending.append((token, power, 2))
+                expect_operand = True
+            elif isinstance(token, CloseParen):
+                fold(0)
+                if not pending:
+                    raise IllegalExpr('Unbalanced parentheses -- check input')
+                opener = pending.pop()[0]
+                if isinstance(opener, Func):
+                    operands.append(ParseTree([opener, operands.pop()]))
             else:
-                return token_stream
+                raise IllegalExpr('Illegal expression found -- check input')
         
-        return scan(expr_string, [])
+        if expect_operand:
+            raise IllegalExpr('Incomplete expression -- check input')
+        fold(0)
+        if pending:
+            raise IllegalExpr('Unbalanced parentheses -- check input')
+        return operands[0]
+
+    def tokenize(self, expr_string):
+        '''Turn the given string into a (lazily generated) stream of tokens.'''
+        return scan(expr_string)
     
     def __termination_cond(self, item, ref_pdepth,
                            current_pdepth, precedence_flag):
@@ -179,6 +261,14 @@ class Parser():
                 next_found = False
                 for l in lst[cursor:]:
                     temp_pdepth = self.__update_pdepth(l, temp_pdepth)
+                    # a minus at the start of an operand, or straight after
+                    # another operator, is a negation, and belongs to the
+                    # operand: it ends nothing
+                    if isinstance(l, MinusOp) and \
+                            (cursor == 0 or isinstance(lst[cursor-1], Operator)):
+                        matches.append(l)
+                        cursor += 1
+                        continue
                     terminate_p =\
                         self.__termination_cond(l, paren_depth,
                                                 temp_pdepth,
@@ -216,6 +306,65 @@ class Parser():
                 return None
         return Match(matches, cursor)
 
+## The parse cache
+## -----------------------------------------------------------------------------
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+class ParseCache():
+    '''
+    A bounded, least-recently-used cache of parse trees, keyed by expression
+    string, in front of a single shared Parser.
+    
+    Every caller asking for the same string gets the same tree, so cached trees
+    must never be modified in place. (Nothing in CAS does so: the
+    differentiator, integrator and simplifier all build new trees.)
+    '''
+    def __init__(self, maxsize=4096, parser=None):
+        self.maxsize = maxsize
+        self.parser = parser if parser else Parser()
+        self.trees = OrderedDict()
+        self.hits, self.misses = 0, 0
+        self.lock = Lock()
+    
+    def parse(self, expr_string):
+        '''Parse expr_string, or fetch its tree if it has been parsed before.'''
+        with self.lock:
+            tree = self.trees.get(expr_string)
+            if tree is not None:
+                self.hits += 1
+                self.trees.move_to_end(expr_string)
+                return tree
+            self.misses += 1
+        
+        # parse outside the lock; errors propagate, and are not cached
+        tree = self.parser.parse(expr_string)
+        with self.lock:
+            if self.maxsize > 0:
+                self.trees[expr_string] = tree
+                while len(self.trees) > self.maxsize:
+                    self.trees.popitem(last=False)
+        return tree
+    
+    def resize(self, maxsize):
+        '''Change the cache size, evicting the oldest trees if need be.'''
+        with self.lock:
+            self.maxsize = maxsize
+            while len(self.trees) > max(maxsize, 0):
+                self.trees.popitem(last=False)
+    
+    def clear(self):
+        '''Empty the cache and reset its statistics.'''
+        with self.lock:
+            self.trees.clear()
+            self.hits, self.misses = 0, 0
+    
+    def info(self):
+        '''Report the cache's hit/miss statistics, size limit and current size.'''
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize,
+                             len(self.trees))
+
 class Match():
     '''Match class; nicely encodes the result of our matching algorithm'''
     def __init__(self, matching_seq, end_of_match):
@@ -228,15 +377,69 @@ class Match():
 ## the Token base class
 ## -----------------------------------------------------------------------------
 
-class Token():
-    '''Token base class'''
+class Interned(type):
+    '''
+    Metaclass for tokens and parse trees. It hash-conses them: constructing a
+    node that is structurally identical to one that already exists returns the
+    existing node, so identical subtrees are shared rather than duplicated, and
+    structural equality is just identity.
+    
+    Since nodes are shared, they must never be modified once constructed. They
+    are dropped from the intern table as soon as nothing else refers to them.
+    '''
+    table = WeakValueDictionary()
+    lock = Lock()
+    
+    def __call__(cls, *args):
+        node = type.__call__(cls, *args)
+        key = node.key()
+        existing = Interned.table.get(key)
+        if existing is not None:
+            return existing
+        with Interned.lock:
+            existing = Interned.table.setdefault(key, node)
+        if existing is node:
+            node._hash = hash(key)
+        return existing
+
+## The free variables of a token or tree with none
+no_variables = frozenset()
+
+class Token(metaclass=Interned):
+    '''
+    Token base class
+    
+    Tokens are interned (see Interned), so == is identity, and hashing is
+    constant-time. Every token also records its free variables, in free_vars:
+    the set of the names it contains, other than those of functions and
+    transforms; and whether it is a polynomial in them, with exact (not
+    floating-point) coefficients, in polynomial.
+    '''
+    __slots__ = ('value', 'free_vars', 'polynomial', '_hash', '__weakref__')
+    
     def __init__(self, token_string=''):
         self.value = token_string
+        self.free_vars = no_variables
+        self.polynomial = False
     def __str__(self):
         return self.value
+    def key(self):
+        '''The key that identifies this token in the intern table'''
+        # include the type of the value, so that 1, 1.0 and Fraction(1) --
+        # which compare equal -- remain distinct; and key floats on their repr,
+        # so that 0.0 and -0.0, which compare equal too, keep their signs
+        if type(self.value) == float:
+            return (type(self), float, repr(self.value))
+        return (type(self), type(self.value), self.value)
+    def __hash__(self):
+        return self._hash
+    def __reduce__(self):
+        # reconstruct through the constructor, so that copies are interned too
+        return (type(self), (self.value,))
 
 class Number(Token):
     '''Number token'''
+    __slots__ = ()
     def __init__(self, token_string):
         Token.__init__(self)
         if type(token_string) == str:
@@ -246,11 +449,13 @@ class Number(Token):
                 self.value = int(token_string)
         else:
             self.value = token_string
+        self.polynomial = type(self.value) != float
     def __str__(self):
         return '%s' % self.value
 
 class Operator(Token):
     '''Operator token'''
+    __slots__ = ()
     def __init__(self, token_string):
         Token.__init__(self, token_string)
 
@@ -258,60 +463,116 @@ class MinusOp(Operator):
     '''
     Minus/negation operator token; needed primarily to deal with negations
     '''
+    __slots__ = ()
     def __init__(self, token_string):
         Operator.__init__(self, token_string)
 
 class OpenParen(Token):
     '''Open parenthesis token'''
+    __slots__ = ()
     def __init__(self, token_string):
         Token.__init__(self, token_string)
     
 class CloseParen(Token):
     '''Close parenthesis token'''
+    __slots__ = ()
     def __init__(self, token_string):
         Token.__init__(self, token_string)
 
 class Name(Token):
     '''Name token'''
+    __slots__ = ()
     def __init__(self, token_string):
         Token.__init__(self, token_string)
+        self.free_vars = frozenset((token_string,))
+        self.polynomial = True
 
 class Wildcard(Token):
     '''
     Wildcard token -- needed for type magic by the pattern matching
     machinery
     '''
+    __slots__ = ()
     def __init__(self):
         Token.__init__(self)
+    def __reduce__(self):
+        return (Wildcard, ())
 
 class Func(Name):
     '''Function token; makes parse tree look nicer.'''
+    __slots__ = ()
     def __init__(self, token_string):
         Name.__init__(self, token_string)
+        self.free_vars = no_variables
+        self.polynomial = False
 
 class Transform(Name):
     '''Transform token; used to represent integrals that CAS cannot evaluate.'''
+    __slots__ = ()
     def __init__(self, token_string=''):
         Name.__init__(self, token_string)
+        self.free_vars = no_variables
+        self.polynomial = False
+
+def polynomial_p(root, left, right):
+    '''
+    Is the tree with the given root and subtrees a polynomial? Sums,
+    differences, negations and products of polynomials are; so are their
+    whole-number powers, and their quotients by (nonzero, exact) numbers.
+    '''
+    if type(root) not in (Operator, MinusOp) or not left.polynomial:
+        return False
+    elif right is None or root.value in ('+', '-', '*'):
+        return right is None or right.polynomial
+    elif root.value == '^':
+        return type(right) == Number and type(right.value) == int and\
+            right.value >= 0
+    elif root.value == '/':
+        return type(right) == Number and right.polynomial and right.value != 0
+    return False
 
 class ParseTree(Token):
     '''
     ParseTree
     
     The parse tree must itself be a token for the parser to work as designed.
+    Like any token, it is interned: its value is a tuple of the root token and
+    the (already interned) subtrees, so identical trees are the same object.
+    Its free variables are those of its subtrees, gathered as it is built.
+    
+    normalized is set by the simplifier once no rewrite rule applies to the
+    tree. It is a cache rather than part of the tree's value: it never changes
+    what the tree means, so it may be set on a shared tree.
     '''
+    __slots__ = ('root', 'left', 'right', 'children', 'normalized')
+    
     def __init__(self, value):
         Token.__init__(self)
-        self.value = value
+        self.value = tuple(value)
         self.root = value[0]
-        self.left, self.right = None, None
+        left, right = None, None
         
         if len(value) > 1:
-            self.left = value[1]
+            left = value[1]
         if len(value) > 2:
-            self.right = value[2]
+            right = value[2]
         
-        self.children = (self.left, self.right)
+        self.left, self.right = left, right
+        self.children = (left, right)
+        
+        variables = no_variables
+        for child in self.children:
+            if child is not None and not child.free_vars <= variables:
+                variables = variables | child.free_vars
+        self.free_vars = variables
+        self.polynomial = polynomial_p(self.root, left, right)
+        self.normalized = False
+
+    def key(self):
+        return (ParseTree, self.value)
+    
+    def __reduce__(self):
+        return (ParseTree, (list(self.value),))
 
     def __str__(self):
         print_version = []
@@ -321,4 +582,42 @@ class ParseTree(Token):
             else:
                 print_version.append(str(x))
         return str(print_version)
+## -----------------------------------------------------------------------------
+## The scanner
+## -----------------------------------------------------------------------------
+
+## The scanning table: each regex, paired with the class of the token it
+## recognizes. Order matters -- at any position, the first regex that matches
+## wins.
+scanning_table = OrderedDict(
+    ((r'[0-9]\.?[0-9]*', Number),
+     (r'\-', MinusOp),
+     (r'\+|\*|\^|/', Operator),
+     (r'\(', OpenParen),
+     (r'\)', CloseParen),
+     (r'\w+', Name)))
+
+## The table, compiled once into a single master regex with one group per token
+## class (the table's regexes must not contain groups of their own). The
+## trailing catch-all group matches any character that the table doesn't, so
+## that the scanner can report illegal tokens rather than skip over them.
+master_regex = re.compile('|'.join(['(%s)' % regex for regex in scanning_table]
+                                   + ['(.)']),
+                          re.DOTALL)
+token_classes = list(scanning_table.values())
+
+def scan(expr_string):
+    '''
+    Lazily generate the tokens in expr_string, left to right, in a single pass
+    over the string.
+    '''
+    for m in master_regex.finditer(expr_string):
+        if m.lastindex > len(token_classes):
+            column = m.start() + 1
+            raise IllegalToken('Illegal token %r at column %d -- check input'
+                               % (m.group(), column), column)
+        yield token_classes[m.lastindex - 1](m.group())
+
+## The process-wide parse cache, used by Expr
+parse_cache = ParseCache()
 ## END -------------------------------------------------------------------------
@@ -0,0 +1,218 @@
+'''
+Plotting for CAS, with gnuplot.
+
+A GnuplotSession keeps one gnuplot process running, and sends it commands as
+they are needed, so that plotting many expressions doesn't start many
+processes. Plots are drawn in the background: plot returns as soon as its
+commands are sent, and wait blocks until gnuplot has carried them all out.
+
+Several expressions can be drawn together in one plot, and plots can be
+written to files (png, svg, pdf, and so on) rather than shown on screen.
+
+Expressions are either handed to gnuplot to evaluate, as formulas, or sampled
+here (see sampling) and sent as points, in binary. Sampling places points
+where they are needed, and can plot expressions gnuplot can't evaluate: those
+with integrals CAS has no antiderivative for, or derivatives of functions with
+no differentiation rule, or functions gnuplot doesn't have.
+'''
+
+import os
+from subprocess import Popen, PIPE
+
+from parser import Name, Func, Transform
+import sampling
+import tape
+
+## An exception for gnuplot failing to start, or going away
+class PlottingError(Exception):
+    def __init__(self, error_msg):
+        Exception.__init__(self, error_msg)
+
+## The gnuplot terminal for each type of file plots can be written to
+terminals = {'.png':'png',
+             '.svg':'svg',
+             '.pdf':'pdfcairo',
+             '.eps':'postscript eps color',
+             '.txt':'dumb'}
+
+## The functions gnuplot has, under the same names as in CAS
+gnuplot_funcs = {'sin', 'cos', 'tan', 'exp', 'abs'}
+
+## The range plotted over when none is given, as in gnuplot
+default_range = (-10, 10)
+
+def quoted(string):
+    '''string, as a gnuplot string literal'''
+    return '"%s"' % str(string).replace('\\', '\\\\').replace('"', '\\"')
+
+class GnuplotSession():
+    '''
+    A gnuplot process, run with the given command, and kept open to plot with
+    until closed. Plots shown on screen persist after it is closed.
+
+    Example:
+        with GnuplotSession() as gnuplot:
+            gnuplot.plot([f, f.d('x')], title='f and its derivative')
+            gnuplot.plot([f], output='f.png')
+    '''
+    def __init__(self, command='gnuplot'):
+        try:
+            self.process = Popen([command, '-persist'], stdin=PIPE,
+                                 stdout=PIPE)
+        except OSError as e:
+            raise PlottingError('Could not start gnuplot: %s' % e)
+        # how many times wait has been called; each waits for its own marker
+        self.syncs = 0
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def send(self, *commands):
+        '''Send gnuplot commands, without waiting for them to be carried out'''
+        self.send_data(''.join([command + '\n'
+                                for command in commands]).encode())
+
+    def send_data(self, data):
+        '''Send bytes to gnuplot: the data for a plot, or commands'''
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise PlottingError('gnuplot has gone away: %s' % e)
+
+    def plot(self, exprs, title=None, labels=None, range=None, output=None,
+             terminal=None, titles=None, sample=None):
+        '''
+        Plot the Exprs in exprs (or a single one) together. title, labels and
+        range work as for Expr.plot; titles gives each expression's own title
+        in the key (by default, the expression itself).
+
+        If sample is true, each expression is sampled, and its points sent to
+        gnuplot; if false, it is sent as a formula. By default, only those
+        gnuplot can't evaluate are sampled.
+
+        If output is given, the plot is written to the file it names, using
+        terminal -- by default, the one for the file's type (see terminals) --
+        rather than shown on screen.
+        '''
+        if not isinstance(exprs, (list, tuple)):
+            exprs = [exprs]
+        if titles is None:
+            titles = [str(expr) for expr in exprs]
+        # each plot starts from gnuplot's defaults, rather than inheriting
+        # the settings made for the last
+        commands = ['reset', 'set samples 200']
+        if title:
+            commands.append('set title %s' % quoted(title))
+        if labels:
+            commands.append('set xlabel %s' % quoted(labels[0]))
+            commands.append('set ylabel %s' % quoted(labels[1]))
+        if range:
+            if range[0]:
+                commands.append('set xrange [%s:%s]' % tuple(range[0]))
+            if len(range) == 2 and range[1]:
+                commands.append('set yrange [%s:%s]' % tuple(range[1]))
+        if output:
+            if terminal is None:
+                extension = os.path.splitext(output)[1].lower()
+                if extension not in terminals:
+                    raise PlottingError('No terminal for %s files' %
+                                        extension)
+                terminal = terminals[extension]
+            commands += ['set terminal push',
+                         'set terminal %s' % terminal,
+                         'set output %s' % quoted(output)]
+        xrange = range[0] if range and range[0] else default_range
+        plots, data = [], []
+        for expr, name in zip(exprs, titles):
+            t = tape.from_tree(expr.tree_repr)
+            if sample or sample is None and needs_sampling(t):
+                xs, ys = sampled(t, *xrange)
+                plots.append("'-' binary record=(%d) format=\"%%float64\" "
+                             "endian=little using 1:2 with lines title %s" %
+                             (len(xs), quoted(name)))
+                data.append(numpy.column_stack((xs, ys)).astype('<f8')
+                            .tobytes())
+            else:
+                plots.append('%s title %s' % (expr.__str__(gnuplot_mode=True),
+                                              quoted(name)))
+        commands.append('plot ' + ', '.join(plots))
+        self.send(*commands)
+        # the points follow the plot command, in the order they are plotted
+        for points in data:
+            self.send_data(points)
+        if output:
+            # unsetting the output closes the file
+            self.send('unset output', 'set terminal pop')
+
+    def wait(self):
+        '''Wait until gnuplot has carried out all the commands sent so far'''
+        self.syncs += 1
+        marker = 'CAS sync %d' % self.syncs
+        self.send('set print "-"', 'print %s' % quoted(marker),
+                  'unset print')
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise PlottingError('gnuplot has gone away')
+            if line.decode(errors='replace').rstrip('\n') == marker:
+                return
+
+    def close(self):
+        '''Finish any plotting, and end the gnuplot process'''
+        if self.alive():
+            try:
+                self.send('quit')
+                self.process.stdin.close()
+            except PlottingError:
+                pass
+            self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+## -----------------------------------------------------------------------------
+## Sampling
+## -----------------------------------------------------------------------------
+numpy = sampling.numpy
+
+def needs_sampling(t):
+    '''
+    Whether the expression on the tape t must be sampled: whether it has any
+    integrals or functions gnuplot can't evaluate
+    '''
+    return any(isinstance(token, Transform) or
+               isinstance(token, Func) and token.value not in gnuplot_funcs
+               for token in t.pool)
+
+def sampled(t, low, high):
+    '''
+    The points at which the expression on the tape t is sampled, between low
+    and high, and its values there
+    '''
+    if numpy is None:
+        raise PlottingError('Sampling requires NumPy')
+    # the variable plotted against is the only one there is, if any; the
+    # variable of an integral is bound by it, but is also its upper limit
+    names = {token.value for token in t.pool if isinstance(token, Name) and
+             not isinstance(token, (Func, Transform))}
+    if len(names) > 1:
+        raise PlottingError('Cannot plot a function of %s' %
+                            ', '.join(sorted(names)))
+    var = names.pop() if names else 'x'
+    return sampling.sample(lambda xs: sampling.evaluate(t, {var:xs}),
+                           float(low), float(high))
+
+## The session Expr.plot uses, started when first needed
+shared_session = None
+
+def session():
+    '''The shared GnuplotSession, started (or restarted) if need be'''
+    global shared_session
+    if shared_session is None or not shared_session.alive():
+        shared_session = GnuplotSession()
+    return shared_session
+## END -------------------------------------------------------------------------
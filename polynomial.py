@@ -0,0 +1,268 @@
+'''
+Polynomial arithmetic for CAS.
+
+A polynomial is stored sparsely, as a dict from the exponents of each monomial
+to its coefficient, so that x^200+1 has two terms, not two hundred and one.
+Polynomials are added, multiplied, differentiated and integrated directly on
+the dict, which is far quicker than doing the same a tree node at a time; the
+results are converted back into parse trees.
+'''
+
+from fractions import Fraction
+from operator import add
+
+from parser import Operator, MinusOp, Name, Number, ParseTree
+from traversal import postorder
+
+## An exception for trees that aren't polynomials (or are better left as trees)
+class NotPolynomial(Exception):
+    def __init__(self, error_msg):
+        Exception.__init__(self, error_msg)
+
+class Polynomial():
+    '''
+    A polynomial in the variables named in vars. terms maps each monomial --
+    a tuple of exponents, one for each variable, in order -- to its
+    coefficient, a nonzero rational: a Fraction, or an int when it is whole,
+    since integer arithmetic is so much quicker.
+    '''
+    def __init__(self, vars, terms=None):
+        self.vars = tuple(vars)
+        self.terms = {}
+        if terms:
+            for monomial, coefficient in terms.items():
+                if coefficient != 0:
+                    self.terms[monomial] = exact(coefficient)
+
+    def __eq__(self, other):
+        return isinstance(other, Polynomial) and self.vars == other.vars and\
+            self.terms == other.terms
+
+    def __repr__(self):
+        return 'Polynomial(%r, %r)' % (self.vars, self.terms)
+
+    def degree(self):
+        '''The total degree; -1 for the zero polynomial'''
+        return max([sum(monomial) for monomial in self.terms], default=-1)
+
+    def same_vars(self, other):
+        if self.vars != other.vars:
+            raise ValueError('Polynomials in different variables: %r and %r' %
+                             (self.vars, other.vars))
+
+    def __neg__(self):
+        return Polynomial(self.vars, {monomial:-coefficient
+                                      for monomial, coefficient in
+                                      self.terms.items()})
+
+    def __add__(self, other):
+        self.same_vars(other)
+        terms = dict(self.terms)
+        for monomial, coefficient in other.terms.items():
+            terms[monomial] = terms.get(monomial, 0) + coefficient
+        return Polynomial(self.vars, terms)
+
+    def __sub__(self, other):
+        return self + -other
+
+    def __mul__(self, other):
+        self.same_vars(other)
+        terms = {}
+        for left, left_coefficient in self.terms.items():
+            for right, right_coefficient in other.terms.items():
+                monomial = tuple(map(add, left, right))
+                terms[monomial] = terms.get(monomial, 0) +\
+                    left_coefficient * right_coefficient
+        return Polynomial(self.vars, terms)
+
+    def __pow__(self, n):
+        '''A whole-number power, by repeated squaring'''
+        if type(n) != int or n < 0:
+            raise ValueError('Cannot raise a polynomial to the power %r' % n)
+        if len(self.terms) == 1:
+            # a power of a single term is just that term's powers
+            (monomial, coefficient), = self.terms.items()
+            return Polynomial(self.vars,
+                              {tuple([e * n for e in monomial]):
+                               coefficient ** n})
+        result = constant(self.vars, 1)
+        square = self
+        while n:
+            if n & 1:
+                result = result * square
+            n >>= 1
+            if n:
+                square = square * square
+        return result
+
+    def diff(self, var):
+        '''The derivative with respect to the variable named var'''
+        if var not in self.vars:
+            return Polynomial(self.vars)
+        i = self.vars.index(var)
+        terms = {}
+        for monomial, coefficient in self.terms.items():
+            if monomial[i]:
+                terms[monomial[:i] + (monomial[i] - 1,) + monomial[i + 1:]] =\
+                    coefficient * monomial[i]
+        return Polynomial(self.vars, terms)
+
+    def integrate(self, var):
+        '''
+        The antiderivative with respect to the variable named var (with no
+        constant of integration); var is added to the variables if need be.
+        '''
+        poly = self
+        if var not in poly.vars:
+            poly = Polynomial(poly.vars + (var,),
+                              {monomial + (0,):coefficient
+                               for monomial, coefficient in poly.terms.items()})
+        i = poly.vars.index(var)
+        terms = {}
+        for monomial, coefficient in poly.terms.items():
+            terms[monomial[:i] + (monomial[i] + 1,) + monomial[i + 1:]] =\
+                Fraction(coefficient, monomial[i] + 1)
+        return Polynomial(poly.vars, terms)
+
+    def to_tree(self):
+        '''
+        Convert to a parse tree: a sum of terms, highest degree first, each a
+        coefficient times a product of powers of the variables; fractional
+        coefficients are written as quotients, as in x^2/2.
+        '''
+        # the monomials, in order of total degree, and then of their exponents
+        ordered = sorted(self.terms, key=lambda monomial: (sum(monomial),
+                                                            monomial),
+                         reverse=True)
+        tree = None
+        for monomial in ordered:
+            coefficient = self.terms[monomial]
+            term = term_tree(self.vars, monomial, abs(coefficient))
+            if tree is None:
+                tree = ParseTree([MinusOp('-'), term]) if coefficient < 0 \
+                    else term
+            elif coefficient < 0:
+                tree = ParseTree([MinusOp('-'), tree, term])
+            else:
+                tree = ParseTree([Operator('+'), tree, term])
+        return Number(0) if tree is None else tree
+
+def exact(value):
+    '''value, a rational, as an int if it is whole, or else as a Fraction'''
+    if type(value) == int:
+        return value
+    value = Fraction(value)
+    return value.numerator if value.denominator == 1 else value
+
+def constant(vars, value):
+    '''The constant polynomial value, in the variables vars'''
+    return Polynomial(vars, {(0,) * len(vars):value})
+
+def variable(vars, var):
+    '''The polynomial var, for one of the variables in vars'''
+    return Polynomial(vars, {tuple([int(v == var) for v in vars]):1})
+
+def term_tree(vars, monomial, coefficient):
+    '''The parse tree for a single (positive) term'''
+    tree = None
+    for var, exponent in zip(vars, monomial):
+        if exponent == 0:
+            continue
+        factor = Name(var)
+        if exponent > 1:
+            factor = ParseTree([Operator('^'), factor, Number(exponent)])
+        tree = factor if tree is None else \
+            ParseTree([Operator('*'), tree, factor])
+    numerator, denominator = coefficient.numerator, coefficient.denominator
+    if tree is None:
+        tree = Number(numerator)
+    elif numerator != 1:
+        tree = ParseTree([Operator('*'), Number(numerator), tree])
+    if denominator != 1:
+        tree = ParseTree([Operator('/'), tree, Number(denominator)])
+    return tree
+
+def from_tree(expr, vars=None, compact=False):
+    '''
+    Convert expr, a parse tree whose polynomial flag is set, into a Polynomial
+    in vars (by default, its free variables, in alphabetical order).
+
+    If compact is true, a subtree whose expansion would have more terms than
+    the subtree has nodes -- (x+1)^100, say -- raises NotPolynomial instead:
+    it is better handled as a tree.
+    '''
+    if not expr.polynomial:
+        raise NotPolynomial('Not a polynomial: %s' % expr)
+    if vars is None:
+        vars = sorted(expr.free_vars)
+    # maps each subtree converted to its polynomial, and the number of nodes
+    # in it
+    converted = {}
+    # the sums found on the way down: the first term of each, and the rest of
+    # its terms, with their signs
+    sums = {}
+
+    def is_sum(expr):
+        return isinstance(expr, ParseTree) and expr.right is not None and \
+            expr.root.value in ('+', '-')
+
+    def operands(expr):
+        if not isinstance(expr, ParseTree):
+            return ()
+        elif is_sum(expr):
+            # a long sum is added up in a single dict, rather than as a chain
+            # of sums, each copying the one before; so its terms are its
+            # operands, rather than the sums it is built from
+            addends = []
+            first = expr
+            while is_sum(first) and first not in converted:
+                addends.append((first.root.value, first.right))
+                first = first.left
+            addends.reverse()
+            sums[expr] = first, addends
+            return [first] + [addend for op, addend in addends]
+        elif expr.root.value in ('^', '/'):
+            return [expr.left]
+        return [child for child in expr.children if child is not None]
+
+    def converter(expr):
+        if isinstance(expr, Number):
+            result, size = constant(vars, expr.value), 1
+        elif not isinstance(expr, ParseTree):
+            result, size = variable(vars, expr.value), 1
+        elif expr.right is None:
+            left, size = converted[expr.left]
+            result, size = -left, size + 1
+        elif is_sum(expr):
+            first, addends = sums.pop(expr)
+            result, size = converted[first]
+            terms = dict(result.terms)
+            for op, addend in addends:
+                addend, addend_size = converted[addend]
+                size += addend_size + 1
+                for monomial, coefficient in addend.terms.items():
+                    if op == '-':
+                        coefficient = -coefficient
+                    terms[monomial] = terms.get(monomial, 0) + coefficient
+            result = Polynomial(vars, terms)
+        else:
+            op = expr.root.value
+            left, left_size = converted[expr.left]
+            size = left_size + 2
+            if op == '^':
+                if compact and len(left.terms) > 1 and \
+                        expr.right.value + 1 > size:
+                    raise NotPolynomial('Too many terms to expand')
+                result = left ** expr.right.value
+            elif op == '/':
+                result = left * constant(vars, Fraction(1, expr.right.value))
+            else:
+                right, right_size = converted[expr.right]
+                size = left_size + right_size + 1
+                result = left * right
+        if compact and len(result.terms) > size:
+            raise NotPolynomial('Too many terms to expand')
+        return result, size
+
+    return postorder(expr, converter, operands, converted)[0]
+## END -------------------------------------------------------------------------
@@ -0,0 +1,138 @@
+'''
+Printing for CAS.
+
+An expression is printed bottom-up: each node's output is put together from
+its operands' outputs, parenthesized as the parser's binding powers require.
+The output for a node is a tuple of strings and the outputs of its operands,
+which are only joined up at the end, by pieces: joining them at every level
+would copy the output of a deep tree over and over.
+
+Printed output parses back to the same tree, except for the numbers the
+parser has no syntax for: a negative number is printed as a negation, and a
+fraction as a quotient, so -1/2 is read back as -(1 divided by 2).
+'''
+
+from fractions import Fraction
+
+from parser import Func, Transform, MinusOp, Number, ParseTree,\
+    binding_power, right_associative, negation_power
+from traversal import postorder
+
+## How tightly a function call, a name or a (nonnegative, whole) number holds
+## together when printed: more tightly than any operator
+atomic_power = max(binding_power.values()) + 1
+
+def leaf(token, gnuplot_mode=False):
+    '''
+    The output for a Number or a Name, and how tightly it holds together, on
+    the parser's scale of binding powers: negative numbers print like
+    negations, and fractions like quotients. In gnuplot_mode, whole numbers
+    are written as floats, and fractions as quotients of floats: gnuplot
+    divides integers as C does, so that 1/2 is 0.
+    '''
+    if isinstance(token, Number):
+        value = token.value
+        if gnuplot_mode and type(value) == int:
+            output = '%d.0' % value
+        elif gnuplot_mode and type(value) == Fraction:
+            output = '%d.0/%d' % (value.numerator, value.denominator)
+        else:
+            output = '%s' % value
+        if value < 0:
+            return output, negation_power
+        elif type(value) == Fraction:
+            return output, binding_power['/']
+        return output, atomic_power
+    return '%s' % token.value, atomic_power
+
+def whole_number(expr):
+    return isinstance(expr, Number) and type(expr.value) == int
+
+def node(root, left, right=None, gnuplot_mode=False):
+    '''
+    The output for a tree with the given root token, and how tightly it holds
+    together. left and right are its operands' outputs, paired with how
+    tightly they hold together (right is None for a negation or a function).
+    In gnuplot_mode, '^' is written as '**'.
+    '''
+    def parenthesized(operand):
+        return ('(', operand[0], ')')
+
+    if isinstance(root, Func):
+        return (root.value, '(', left[0], ')'), atomic_power
+    elif isinstance(root, Transform):
+        return (root.value, '[', left[0], ', ', right[0], ']'), atomic_power
+    elif isinstance(root, MinusOp) and right is None:
+        if left[1] <= negation_power:
+            return (root.value, parenthesized(left)), negation_power
+        return (root.value, left[0]), negation_power
+
+    op = root.value
+    power = binding_power[op]
+    # do we need to parenthesize the left operand?
+    if left[1] < power or (left[1] == power and op in right_associative):
+        left = parenthesized(left)
+    else:
+        left = left[0]
+    # what about the right operand? a negation always is, and so is an
+    # operator of the same precedence, unless it groups to the right: x+(y-z)
+    # and x*(y/z) are parsed differently without their parentheses
+    if right[1] < power or right[1] == negation_power or\
+            (right[1] == power and op not in right_associative):
+        right = parenthesized(right)
+    else:
+        right = right[0]
+    # now add the operator
+    if op == '^' and gnuplot_mode:
+        op = '**'
+    return (left, op, right), power
+
+def tree_output(expr, gnuplot_mode=False):
+    '''
+    The output for the parse tree expr, converted bottom-up (see
+    traversal.postorder). Shared subexpressions are converted once, and their
+    output reused. In gnuplot_mode, the output is for gnuplot (see node and
+    leaf).
+    '''
+    converted = {}
+
+    def convert(expr):
+        if not isinstance(expr, ParseTree):
+            return leaf(expr, gnuplot_mode)
+        right = converted.get(expr.right)
+        if gnuplot_mode and expr.root.value == '^':
+            # gnuplot raises negative numbers to whole powers only if they are
+            # integers, so these are left as they are
+            if whole_number(expr.right):
+                right = leaf(expr.right)
+            elif isinstance(expr.right, ParseTree) and\
+                    isinstance(expr.right.root, MinusOp) and\
+                    expr.right.right is None and whole_number(expr.right.left):
+                right = node(expr.right.root, leaf(expr.right.left))
+        return node(expr.root, converted[expr.left], right, gnuplot_mode)
+
+    return postorder(expr, convert, memo=converted)[0]
+
+def pieces(output):
+    '''Generate the strings that make up output, in order'''
+    stack = [output]
+    while stack:
+        part = stack.pop()
+        if type(part) == str:
+            yield part
+        else:
+            stack.extend(reversed(part))
+
+def write(output, file, chunk_size=65536):
+    '''
+    Write output to file (anything with a write method), a chunk of about
+    chunk_size pieces at a time
+    '''
+    chunk = []
+    for part in pieces(output):
+        chunk.append(part)
+        if len(chunk) >= chunk_size:
+            file.write(''.join(chunk))
+            chunk = []
+    file.write(''.join(chunk))
+## END -------------------------------------------------------------------------
@@ -0,0 +1,388 @@
+'''
+Numeric definite integration for CAS.
+
+A definite integral is worked out from the antiderivative, where CAS can find
+one: F(b) - F(a). Where it can't -- the antiderivative has integrals left in
+it, or functions that can't be evaluated -- or where the antiderivative can't
+be evaluated at the bounds, the integrand is integrated numerically, by
+adaptive Gauss-Kronrod quadrature.
+
+F(b) - F(a) is only the integral if the integrand is finite from a to b: that
+of 1/x^2 from -1 to 1 is not -2, nor that of tan(x) from 0 to 3 -ln(-cos(3)).
+So the integrand is first evaluated over the whole of [a, b] at once, in
+interval arithmetic, which bounds its values there: where the bounds are
+finite, so is the integrand, and F(b) - F(a) is the integral, with error 0.
+The bounds can be wider than the integrand's values -- x - x has the bounds
+[a - b, b - a] -- but never narrower, so an integrand found to be finite is.
+
+Elsewhere, the integrand is integrated numerically, and F(b) - F(a), if
+there is one, given only where the two agree, to within the quadrature's
+estimate of its error (so the integral of x^(-1/2) from 0 to 1 is still
+exactly 2); otherwise, the numeric integral is. Either is given with that
+estimate, unless the quadrature found the integral to within its tolerance,
+and F(b) - F(a) agreed: then it is exact, and its error 0.
+
+Each interval is integrated with the 7-point Gauss rule and the 15-point
+Kronrod rule, which shares its points; the difference between the two is an
+estimate of the error. Intervals whose error is too large for their share of
+the tolerance are halved, and integrated again, until all of them are within
+it. Every interval still to be integrated, of every integral asked for at
+once, is integrated together, in whole-array NumPy operations.
+'''
+
+from math import pi
+
+import evaluation
+from parser import Func, Number, Transform
+import integration
+import sampling
+import tape
+
+numpy = evaluation.numpy
+
+## The points of the 15-point Kronrod rule on [-1, 1], and their weights; every
+## other point, from the second, is a point of the 7-point Gauss rule
+kronrod_points = (0.991455371120812639206854697526329,
+                  0.949107912342758524526189684047851,
+                  0.864864423359769072789712788640926,
+                  0.741531185599394439863864773280788,
+                  0.586087235467691130294144845693013,
+                  0.405845151377397166906606412076961,
+                  0.207784955007898467600689403773245,
+                  0.0)
+kronrod_weights = (0.022935322010529224963732008058970,
+                   0.063092092629978553290700663189204,
+                   0.104790010322250183839876322541518,
+                   0.140653259715525918745189590510238,
+                   0.169004726639267902826583426598550,
+                   0.190350578064785409913256402421014,
+                   0.204432940075298892414161999234649,
+                   0.209482141084727828012999174891714)
+gauss_weights = (0.129484966168869693270611432679082,
+                 0.279705391489276667901467771423780,
+                 0.381830050505118944950369775488975,
+                 0.417959183673469387755102040816327)
+
+if numpy:
+    # the points in order, from -1 to 1, and the weights of each rule for
+    # them (zero for those of the Kronrod rule alone)
+    points = numpy.concatenate((-numpy.array(kronrod_points[:-1]),
+                                numpy.array(kronrod_points[::-1])))
+    kronrod = numpy.concatenate((kronrod_weights[:-1],
+                                 kronrod_weights[::-1]))
+    gauss = numpy.zeros(15)
+    gauss[1:7:2] = gauss_weights[:-1]
+    gauss[7] = gauss_weights[-1]
+    gauss[9::2] = gauss_weights[-2::-1]
+
+def gauss_kronrod(func, a, b, tolerance=1e-10, max_intervals=500):
+    '''
+    Integrate func from a to b, adaptively, by Gauss-Kronrod quadrature; a and
+    b may be arrays (broadcast against each other), for many integrals at
+    once. func is called with a two-dimensional array of points, each row in
+    one of the integrals, and an array of the index of each row's integral
+    (in the flattened a and b), and returns the integrand's values there.
+
+    Each integral is found to within about tolerance, relative to its size --
+    or absolutely, for integrals smaller than 1 -- unless it takes more than
+    max_intervals intervals. Returns the integrals, and estimates of their
+    errors, as arrays shaped like a and b (or as numbers, if both are).
+    '''
+    if numpy is None:
+        raise evaluation.EvaluationError('Numeric integration requires NumPy')
+    a, b = numpy.broadcast_arrays(numpy.asarray(a, dtype=float),
+                                  numpy.asarray(b, dtype=float))
+    shape, count = a.shape, a.size
+    lengths = numpy.abs(b - a).ravel()
+    values, errors = numpy.zeros(count), numpy.zeros(count)
+    intervals = numpy.ones(count)
+    # the intervals still to be integrated, and the integral each belongs to
+    lows, highs = a.ravel(), b.ravel()
+    owners = numpy.arange(count)
+    with numpy.errstate(all='ignore'):
+        while len(owners):
+            centres, halves = (lows + highs) / 2, (highs - lows) / 2
+            x = centres[:, None] + halves[:, None] * points
+            fx = numpy.asarray(func(x, owners), dtype=float) +\
+                numpy.zeros_like(x)
+            estimates = halves * (fx @ kronrod)
+            differences = numpy.abs(estimates - halves * (fx @ gauss))
+            # each interval's share of the tolerance is in proportion to its
+            # length
+            totals = values + numpy.bincount(owners, estimates,
+                                             minlength=count)
+            allowed = tolerance *\
+                numpy.maximum(1, numpy.abs(totals[owners])) *\
+                numpy.abs(2 * halves) / lengths[owners]
+            done = (differences <= allowed) |\
+                ~numpy.isfinite(differences) |\
+                (intervals[owners] >= max_intervals) |\
+                (numpy.abs(halves) <= 1e-15 * numpy.abs(centres))
+            values += numpy.bincount(owners[done], estimates[done],
+                                     minlength=count)
+            errors += numpy.bincount(owners[done], differences[done],
+                                     minlength=count)
+            # the rest are halved
+            split = ~done
+            intervals += numpy.bincount(owners[split], minlength=count)
+            lows = numpy.concatenate((lows[split], centres[split]))
+            highs = numpy.concatenate((centres[split], highs[split]))
+            owners = numpy.concatenate((owners[split], owners[split]))
+    if not shape:
+        return float(values[0]), float(errors[0])
+    return values.reshape(shape), errors.reshape(shape)
+
+def evaluable(t):
+    '''Whether everything on the tape t can be evaluated over arrays'''
+    return not any(isinstance(token, Transform) or
+                   isinstance(token, Func) and
+                   token.value not in evaluation.array_funcs
+                   for token in t.pool)
+
+## -----------------------------------------------------------------------------
+## Interval arithmetic
+## -----------------------------------------------------------------------------
+class Interval():
+    '''
+    The bounds of the values an expression takes, for many intervals of its
+    variables at once: arrays of lower and upper bounds. NaN bounds stand for
+    values that may be undefined, e.g., ln of a negative number.
+    '''
+    __slots__ = ('low', 'high')
+
+    def __init__(self, low, high):
+        self.low, self.high = low, high
+
+    def __neg__(self):
+        if self.low is self.high:
+            low = high = -self.low
+        else:
+            low, high = -self.high, -self.low
+        return Interval(low, high)
+
+def point(interval):
+    '''
+    Whether interval is a single number, as for constants: both bounds the
+    same object, not an array
+    '''
+    return interval.low is interval.high and\
+        not isinstance(interval.low, numpy.ndarray)
+
+def hull(*values):
+    '''The interval from the least of values to the greatest'''
+    low = high = values[0]
+    for value in values[1:]:
+        low, high = numpy.minimum(low, value), numpy.maximum(high, value)
+    return Interval(low, high)
+
+def unbounded(where, interval):
+    '''interval, made unbounded where where is true'''
+    return Interval(numpy.where(where, -numpy.inf, interval.low),
+                    numpy.where(where, numpy.inf, interval.high))
+
+def contains(interval, point):
+    return (interval.low <= point) & (point <= interval.high)
+
+def meets(interval, offset, period):
+    '''Whether interval contains offset + k*period, for some whole k'''
+    return numpy.ceil((interval.low - offset) / period) <=\
+        numpy.floor((interval.high - offset) / period)
+
+def i_add(u, v):
+    return Interval(u.low + v.low, u.high + v.high)
+
+def i_sub(u, v):
+    return Interval(u.low - v.high, u.high - v.low)
+
+def i_mul(u, v):
+    if point(v):
+        # a constant factor, as most are
+        return i_scale(u, v.low)
+    elif point(u):
+        return i_scale(v, u.low)
+    return hull(u.low * v.low, u.low * v.high, u.high * v.low,
+                u.high * v.high)
+
+def i_scale(u, c):
+    '''u*c, for a number c'''
+    if c >= 0:
+        return Interval(u.low * c, u.high * c)
+    return Interval(u.high * c, u.low * c)
+
+def i_div(u, v):
+    return unbounded(contains(v, 0),
+                     i_mul(u, Interval(1 / v.high, 1 / v.low)))
+
+def i_abs(u):
+    low = numpy.minimum(numpy.abs(u.low), numpy.abs(u.high))
+    return Interval(numpy.where(contains(u, 0), 0.0, low),
+                    numpy.maximum(numpy.abs(u.low), numpy.abs(u.high)))
+
+def whole_power(u, n):
+    '''
+    u^n, for a whole number n: for even n, |u|^n, between the powers of |u|'s
+    bounds; for odd n, between those of u's, on either side of 0
+    '''
+    if n % 2 == 0:
+        size = i_abs(u)
+        if n >= 0:
+            return Interval(size.low ** n, size.high ** n)
+        return Interval(size.high ** n, size.low ** n)
+    elif n > 0:
+        return Interval(u.low ** n, u.high ** n)
+    return unbounded(contains(u, 0), Interval(u.high ** n, u.low ** n))
+
+def real_power(u, v):
+    '''
+    u^v, for any v: for positive u, as exp(v*ln(u)); for u from 0, and
+    positive v, from the powers of u's upper bound; unbounded otherwise
+    '''
+    positive = i_exp(i_mul(v, i_log(u)))
+    from_zero = hull(0.0, u.high ** v.low, u.high ** v.high)
+    power = Interval(numpy.where(u.low > 0, positive.low, from_zero.low),
+                     numpy.where(u.low > 0, positive.high, from_zero.high))
+    return unbounded((u.low < 0) | (u.low == 0) & (v.low <= 0), power)
+
+def i_pow(u, v):
+    if point(v) and float(v.low) == round(float(v.low)):
+        # a constant, whole exponent, as most are
+        return whole_power(u, float(v.low))
+    return real_power(u, v)
+
+def i_exp(u):
+    return Interval(numpy.exp(u.low), numpy.exp(u.high))
+
+def i_log(u):
+    # NaN below 0, and unbounded at it
+    return Interval(numpy.log(u.low), numpy.log(u.high))
+
+def i_sin(u):
+    ends = hull(numpy.sin(u.low), numpy.sin(u.high))
+    return Interval(numpy.where(meets(u, -pi / 2, 2 * pi), -1.0, ends.low),
+                    numpy.where(meets(u, pi / 2, 2 * pi), 1.0, ends.high))
+
+def i_cos(u):
+    return i_sin(Interval(u.low + pi / 2, u.high + pi / 2))
+
+def i_tan(u):
+    return unbounded(meets(u, pi / 2, pi),
+                     Interval(numpy.tan(u.low), numpy.tan(u.high)))
+
+if numpy:
+    interval_funcs = {'sin':i_sin,
+                      'cos':i_cos,
+                      'tan':i_tan,
+                      'exp':i_exp,
+                      'ln':i_log,
+                      'abs':i_abs}
+    interval_ops = {'^':i_pow,
+                    '*':i_mul,
+                    '/':i_div,
+                    '+':i_add,
+                    '-':i_sub}
+
+def bounded(t, intervals):
+    '''
+    Whether the tape t is certainly finite, with its variables in intervals,
+    a dict of Intervals; t must be evaluable
+    '''
+    def leaf_value(token):
+        if isinstance(token, Number):
+            # see point
+            value = float(token.value)
+            return Interval(value, value)
+        try:
+            return intervals[token.value]
+        except KeyError:
+            raise evaluation.EvaluationError('No value for variable: %s' %
+                                             token.value)
+
+    with numpy.errstate(all='ignore'):
+        bounds = t.run(leaf_value, interval_funcs, interval_ops)
+    return numpy.isfinite(bounds.low) & numpy.isfinite(bounds.high)
+
+def finite(t, var, a, b, bindings):
+    '''
+    Whether the tape t is certainly finite as var runs from a to b, with the
+    other variables given values by bindings (arrays, broadcast against a and
+    b), by interval arithmetic; t must be evaluable
+    '''
+    intervals = {name:Interval(value, value)
+                 for name, value in bindings.items()}
+    intervals[var] = Interval(numpy.minimum(a, b), numpy.maximum(a, b))
+    if numpy.size(a) > 1:
+        # if t is finite over an interval holding them all, it is over each
+        whole = {name:Interval(interval.low.min(), interval.high.max())
+                 for name, interval in intervals.items()}
+        if bounded(t, whole):
+            return numpy.ones_like(a, dtype=bool)
+    return bounded(t, intervals) & numpy.ones_like(a, dtype=bool)
+## -----------------------------------------------------------------------------
+## Definite integrals
+## -----------------------------------------------------------------------------
+def definite_integral(expr, var):
+    '''
+    The definite integral of expr with respect to var, as a function of the
+    bounds a and b, a dict of the values of any other variables, and the
+    tolerance (see gauss_kronrod); it returns the integral and an estimate of
+    its error, which is 0 where the antiderivative gave it. The antiderivative
+    is found once, here.
+    '''
+    if numpy is None:
+        raise evaluation.EvaluationError('Numeric integration requires NumPy')
+    try:
+        antiderivative = tape.from_tree(integration.integrate(expr, var))
+    except ZeroDivisionError:
+        # the simplifier found a division by zero in the antiderivative
+        antiderivative = None
+    if antiderivative is not None and not evaluable(antiderivative):
+        antiderivative = None
+    integrand = tape.from_tree(expr)
+    # whether the integrand can be bounded, to check F(b) - F(a) by
+    checked = evaluable(integrand)
+
+    def integral(a, b, bindings, tolerance):
+        bounds = numpy.broadcast_arrays(*[numpy.asarray(value, dtype=float)
+                                          for value in
+                                          [a, b] + list(bindings.values())])
+        a, b = bounds[:2]
+        bindings = dict(zip(bindings, bounds[2:]))
+        if antiderivative is not None:
+            with numpy.errstate(all='ignore'):
+                exact = antiderivative.evaluate_array(**dict(bindings,
+                                                             **{var:b})) -\
+                    antiderivative.evaluate_array(**dict(bindings,
+                                                         **{var:a}))
+            exact = exact + numpy.zeros_like(a)
+            if checked:
+                numeric = ~(numpy.isfinite(exact) &
+                            finite(integrand, var, a, b, bindings))
+            else:
+                numeric = numpy.ones_like(a, dtype=bool)
+        else:
+            exact = numpy.full_like(a, numpy.nan)
+            numeric = numpy.ones_like(a, dtype=bool)
+        values, errors = numpy.array(exact), numpy.zeros_like(a)
+        if numeric.any():
+            others = {name:value[numeric] for name, value in bindings.items()}
+
+            def func(x, owners):
+                return sampling.evaluate(integrand, dict(
+                    {name:value[owners, None]
+                     for name, value in others.items()}, **{var:x}))
+
+            found, error = gauss_kronrod(func, a[numeric], b[numeric],
+                                         tolerance)
+            # F(b) - F(a), where there is one, if the quadrature bears it out
+            with numpy.errstate(all='ignore'):
+                allowed = tolerance * numpy.maximum(1, numpy.abs(found))
+                agreed = numpy.abs(exact[numeric] - found) <= error + allowed
+            values[numeric] = numpy.where(agreed, exact[numeric], found)
+            errors[numeric] = numpy.where(agreed & (error <= allowed), 0.0,
+                                          error)
+        if not numpy.ndim(values):
+            return float(values), float(errors)
+        return values, errors
+
+    return integral
+## END -------------------------------------------------------------------------
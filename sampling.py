@@ -0,0 +1,152 @@
+'''
+Numeric sampling of expressions for CAS, for plotting.
+
+gnuplot can only plot what it can evaluate itself. Sampled here instead, in
+Python, over whole NumPy arrays of points, any tree an Expr can represent can
+be plotted, including those parts CAS could not work out symbolically:
+
+    d[f, x](u)       the derivative of a function with no differentiation
+                     rule, found numerically, by central differences
+    integrate[f, x]  an integral with no antiderivative, found by Gauss-
+                     Legendre quadrature, from 0 to x (so it may differ from
+                     an antiderivative worked out symbolically by a constant)
+
+Points are placed adaptively: intervals over which the expression is far from
+a straight line are split, again and again, so that sharp features get many
+points and flat stretches few.
+'''
+
+import re
+
+from parser import Name
+import evaluation
+
+numpy = evaluation.numpy
+
+## The relative step for numeric differentiation: about the cube root of the
+## machine epsilon, which balances truncation against rounding error
+step = 2.0 ** -17
+
+## The quadrature rule for integrals: panels panels of order points each
+panels, order = 8, 10
+
+## The name of the derivative of a function, as diff_func writes it
+derivative_name = re.compile(r'd\[(.*), \w+\]$')
+
+class NumericFuncs(dict):
+    '''
+    The NumPy functions of evaluation.array_funcs, along with the derivatives
+    of any of them, d[f, x] -- or of their derivatives, d[d[f, x], x], and so
+    on -- which are worked out numerically when first asked for
+    '''
+    def __init__(self):
+        dict.__init__(self, evaluation.array_funcs)
+
+    def __missing__(self, name):
+        match = derivative_name.match(name)
+        if not match:
+            raise KeyError(name)
+        func = self[match.group(1)]
+
+        def derivative(u):
+            h = step * numpy.maximum(1, numpy.abs(u))
+            return (func(u + h) - func(u - h)) / (2 * h)
+
+        self[name] = derivative
+        return derivative
+
+def evaluate(t, bindings):
+    '''
+    Evaluate the tape t over arrays of points, as Tape.evaluate_array does --
+    bindings maps each variable to an array of its values -- but working out
+    numerically the derivatives and integrals CAS couldn't work out
+    symbolically. Points where it is undefined are NaN.
+    '''
+    if numpy is None:
+        raise evaluation.EvaluationError('Sampling requires NumPy')
+    arrays = {name:numpy.asarray(values, dtype=float)
+              for name, values in bindings.items()}
+
+    def leaf_value(token):
+        if not isinstance(token, Name):
+            return float(token.value)
+        try:
+            return arrays[token.value]
+        except KeyError:
+            raise evaluation.EvaluationError('No value for variable: %s' %
+                                             token.value)
+
+    def integral(t, i, values):
+        # integrate[f, x] is the integral of f from 0 to x: at each point, f is
+        # evaluated at the quadrature points between 0 and x, which run along
+        # a new last axis, and summed up
+        var = t.pool[t.codes[t.right[i]]].value
+        upper = numpy.asarray(values[t.right[i]], dtype=float)[..., None]
+        inner = {name:array[..., None] for name, array in arrays.items()}
+        inner[var] = upper * fractions
+        integrand = evaluate(t.compacted(t.left[i]), inner)
+        return upper[..., 0] * numpy.sum(integrand * weights, axis=-1)
+
+    with numpy.errstate(all='ignore'):
+        return t.run(leaf_value, funcs, evaluation.array_ops, integral)
+
+if numpy:
+    funcs = NumericFuncs()
+    # the quadrature points, as fractions of the way from 0 to the upper
+    # limit, and their weights (which sum to 1)
+    nodes, node_weights = numpy.polynomial.legendre.leggauss(order)
+    fractions = ((numpy.arange(panels)[:, None] + (nodes + 1) / 2) /
+                 panels).ravel()
+    weights = numpy.tile(node_weights / 2 / panels, panels)
+
+def sample(func, low, high, points=50, max_points=1000, tolerance=1e-3):
+    '''
+    Sample func, a function of arrays of points, between low and high. Starting
+    from points evenly spaced points, each interval over which func strays
+    from a straight line by more than tolerance (as a fraction of the range of
+    its values) is split, until none does or there are max_points.
+    Returns arrays of the points, and of func's values at them.
+    '''
+    xs = numpy.linspace(low, high, points)
+    with numpy.errstate(all='ignore'):
+        ys = numpy.asarray(func(xs), dtype=float) + numpy.zeros_like(xs)
+        while len(xs) < max_points:
+            # each interval is tested a quarter and three quarters of the way
+            # along (not at its middle, where the line through its ends meets
+            # anything symmetric about it, such as a step), and, if need be,
+            # split there, in three
+            widths = xs[1:] - xs[:-1]
+            tests = numpy.stack((xs[:-1] + widths / 4,
+                                 xs[:-1] + 3 * widths / 4))
+            values = numpy.asarray(func(tests), dtype=float) +\
+                numpy.zeros_like(tests)
+            lines = numpy.stack(((3 * ys[:-1] + ys[1:]) / 4,
+                                 (ys[:-1] + 3 * ys[1:]) / 4))
+            finite = numpy.isfinite(ys)
+            scale = numpy.ptp(ys[finite]) if finite.any() else 0
+            # where the expression is defined at some of an interval's points
+            # but not at the others, there is an edge to find
+            defined = finite[:-1] & finite[1:] &\
+                numpy.isfinite(values).all(axis=0)
+            edges = ~defined & (finite[:-1] | finite[1:] |
+                                numpy.isfinite(values).any(axis=0))
+            error = numpy.where(defined,
+                                numpy.abs(values - lines).max(axis=0),
+                                numpy.where(edges, numpy.inf, 0))
+            # intervals too narrow to split any further are left alone
+            error[widths <= 1e-9 * (high - low)] = 0
+            split = numpy.flatnonzero(error > tolerance * (scale or 1))
+            if not len(split):
+                break
+            if 2 * len(split) > max_points - len(xs):
+                worst = numpy.argsort(error[split])[::-1]
+                split = numpy.sort(split[worst[:(max_points - len(xs)) // 2]])
+                if not len(split):
+                    break
+            xs = numpy.insert(xs, numpy.repeat(split + 1, 2),
+                              tests[:, split].T.ravel())
+            ys = numpy.insert(ys, numpy.repeat(split + 1, 2),
+                              values[:, split].T.ravel())
+    ys[~numpy.isfinite(ys)] = numpy.nan
+    return xs, ys
+## END -------------------------------------------------------------------------
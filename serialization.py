@@ -0,0 +1,365 @@
+'''
+Serialization of parse trees for CAS.
+
+Expressions are saved as tapes (see tape): a pool of tokens, and the arrays of
+instructions, written out as they are held in memory. Loading one is a single
+pass along its tape, far quicker than parsing its printed form.
+
+A file holds a library of expressions -- a list, or a mapping from names to
+them -- each stored separately, behind an index of where each starts. The file
+is memory-mapped when loaded, and an expression is only read and rebuilt when
+it is asked for.
+
+The binary format is little-endian throughout:
+
+    header      magic b'CAS\\0', format version (16 bits), flags (16 bits: 1
+                if the expressions are named), number of expressions (32 bits)
+    index       the offset of each expression, and of the end of the last,
+                from the start of the file (64 bits each)
+    names       for a named library, each expression's name, as a string
+    expressions each a pool -- its size (32 bits), and each token in it, as a
+                kind byte and the token's value -- then the number of
+                instructions (32 bits), and the codes, left and right arrays
+                (32-bit signed integers)
+
+where a string is its length (32 bits) and its UTF-8 bytes. For debugging,
+the same tapes can be written as JSON instead.
+'''
+
+import json
+import mmap
+import struct
+import sys
+from array import array
+from fractions import Fraction
+
+from parser import Operator, MinusOp, Func, Transform, Name, Number
+import tape
+
+## The current version of the format; files of other versions are rejected
+version = 1
+magic = b'CAS\0'
+header = struct.Struct('<4sHHI')
+offset = struct.Struct('<Q')
+size = struct.Struct('<I')
+named = 1
+
+## An exception for files that aren't in the format, or can't be read
+class SerializationError(Exception):
+    def __init__(self, error_msg):
+        Exception.__init__(self, error_msg)
+## -----------------------------------------------------------------------------
+## Token kinds
+## -----------------------------------------------------------------------------
+## The kind byte of each class of token written as its name. Number tokens are
+## written according to the type of their value instead.
+token_kinds = {Name:b'n',
+               Func:b'u',
+               Transform:b't',
+               Operator:b'o',
+               MinusOp:b'm'}
+
+token_classes = {kind:cls for cls, kind in token_kinds.items()}
+
+number_kinds = {int:b'i',
+                Fraction:b'q',
+                float:b'f'}
+## -----------------------------------------------------------------------------
+## Writing
+## -----------------------------------------------------------------------------
+def string(value):
+    '''The bytes for a string'''
+    data = value.encode('utf-8')
+    return size.pack(len(data)) + data
+
+def digits(value):
+    '''The decimal digits of an int'''
+    try:
+        return str(value)
+    except ValueError as e:
+        # Python limits how long an int it converts to a string may be
+        raise SerializationError('Cannot serialize number: %s' % e)
+
+def encoded_token(token):
+    '''The bytes for a token in a tape's pool'''
+    if isinstance(token, Number):
+        value = token.value
+        if type(value) == float:
+            return b'f' + struct.pack('<d', value)
+        elif type(value) == Fraction:
+            return b'q' + string(digits(value.numerator)) +\
+                string(digits(value.denominator))
+        return b'i' + string(digits(value))
+    return token_kinds[type(token)] + string(token.value)
+
+def encoded(expr):
+    '''The bytes for the parse tree expr'''
+    t = tape.from_tree(expr)
+    parts = [size.pack(len(t.pool))]
+    parts.extend([encoded_token(token) for token in t.pool])
+    parts.append(size.pack(len(t)))
+    for column in (t.codes, t.left, t.right):
+        if sys.byteorder != 'little':
+            column = array('i', column)
+            column.byteswap()
+        parts.append(column.tobytes())
+    return b''.join(parts)
+
+def dumps(exprs):
+    '''
+    The bytes for a library of parse trees: exprs is a list of them, or a
+    mapping from names (strings) to them. Raises SerializationError for an
+    integer too long for Python to write out in decimal.
+    '''
+    names = list(exprs) if isinstance(exprs, dict) else None
+    records = [encoded(exprs[name]) for name in names] \
+        if names is not None else [encoded(expr) for expr in exprs]
+    parts = [header.pack(magic, version, 0 if names is None else named,
+                         len(records))]
+    start = header.size + offset.size * (len(records) + 1)
+    if names is not None:
+        names = [string(name) for name in names]
+        start += sum([len(name) for name in names])
+    for record in records:
+        parts.append(offset.pack(start))
+        start += len(record)
+    parts.append(offset.pack(start))
+    return b''.join(parts + (names or []) + records)
+
+def dump(exprs, file):
+    '''
+    Write a library of parse trees (see dumps) to file, a filename or a file
+    object opened for writing bytes
+    '''
+    if isinstance(file, str):
+        with open(file, 'wb') as f:
+            f.write(dumps(exprs))
+    else:
+        file.write(dumps(exprs))
+## -----------------------------------------------------------------------------
+## Reading
+## -----------------------------------------------------------------------------
+class Library():
+    '''
+    A library of expressions, read from data -- bytes, or anything else that
+    supports the buffer protocol -- or from a file, given its name, which is
+    memory-mapped. Expressions are decoded only when asked for, by index or,
+    in a named library, by name; convert is applied to each tree decoded.
+
+    Example: Library('derivatives.cas')['f_x']
+    '''
+    def __init__(self, source, convert=None):
+        self.file = None
+        if isinstance(source, str):
+            self.file = open(source, 'rb')
+            try:
+                source = mmap.mmap(self.file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+            except ValueError:
+                # an empty file can't be mapped
+                source = b''
+        self.data = memoryview(source)
+        self.convert = convert
+        if len(self.data) < header.size:
+            self.close()
+            raise SerializationError('Not a CAS library: too short')
+        file_magic, file_version, flags, self.count =\
+            header.unpack_from(self.data)
+        if file_magic != magic:
+            self.close()
+            raise SerializationError('Not a CAS library')
+        if file_version != version:
+            self.close()
+            raise SerializationError('Unsupported CAS library version %d' %
+                                     file_version)
+        # the index of each expression, by name
+        self.names = None
+        if flags & named:
+            self.names = {}
+            position = header.size + offset.size * (self.count + 1)
+            try:
+                for i in range(self.count):
+                    name, position = self.read_string(position)
+                    self.names[name] = i
+            except (struct.error, UnicodeDecodeError) as e:
+                self.close()
+                raise SerializationError('Corrupt CAS library: %s' % e)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        '''The expressions, or for a named library, their names'''
+        if self.names is not None:
+            return iter(self.names)
+        return (self[i] for i in range(self.count))
+
+    def keys(self):
+        return self.names.keys()
+
+    def __getitem__(self, key):
+        if self.names is not None and not isinstance(key, int):
+            key = self.names[key]
+        elif key < 0:
+            key += self.count
+        if not 0 <= key < self.count:
+            raise IndexError('Library index out of range')
+        try:
+            expr = self.tape(key).to_tree()
+        except IndexError as e:
+            raise SerializationError('Corrupt CAS library: %s' % e)
+        return self.convert(expr) if self.convert else expr
+
+    def read_string(self, position):
+        '''The string at position in the data, and the position after it'''
+        length, = size.unpack_from(self.data, position)
+        position += size.size
+        return str(self.data[position:position + length], 'utf-8'),\
+            position + length
+
+    def tape(self, i):
+        '''Decode the i'th expression into a Tape'''
+        try:
+            position, end = struct.unpack_from(
+                '<2Q', self.data, header.size + offset.size * i)
+            t = tape.Tape()
+            pool_size, = size.unpack_from(self.data, position)
+            position += size.size
+            for code in range(pool_size):
+                kind = bytes(self.data[position:position + 1])
+                position += 1
+                if kind == b'f':
+                    value, = struct.unpack_from('<d', self.data, position)
+                    position += 8
+                    token = Number(value)
+                elif kind == b'q':
+                    numerator, position = self.read_string(position)
+                    denominator, position = self.read_string(position)
+                    token = Number(Fraction(int(numerator), int(denominator)))
+                elif kind == b'i':
+                    value, position = self.read_string(position)
+                    token = Number(int(value))
+                else:
+                    value, position = self.read_string(position)
+                    token = token_classes[kind](value)
+                t.pool.append(token)
+                t.pooled[token] = code
+            length, = size.unpack_from(self.data, position)
+            position += size.size
+            for column in (t.codes, t.left, t.right):
+                column.frombytes(self.data[position:position + 4 * length])
+                if sys.byteorder != 'little':
+                    column.byteswap()
+                position += 4 * length
+        except (struct.error, KeyError, ValueError) as e:
+            raise SerializationError('Corrupt CAS library: %s' % e)
+        if position != end or not length:
+            raise SerializationError('Corrupt CAS library: bad expression %d'
+                                     % i)
+        return t
+
+    def close(self):
+        '''Release the data, and close the file, if there is one'''
+        data, self.data = self.data, memoryview(b'')
+        source = data.obj
+        data.release()
+        if isinstance(source, mmap.mmap):
+            source.close()
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def loads(data):
+    '''
+    Decode all the expressions in data: a list of parse trees or, for a named
+    library, a dict
+    '''
+    library = Library(data)
+    if library.names is not None:
+        return {name:library[name] for name in library}
+    return list(library)
+
+def load(filename, convert=None):
+    '''Open the library in the file named filename, lazily (see Library)'''
+    return Library(filename, convert)
+## -----------------------------------------------------------------------------
+## JSON
+## -----------------------------------------------------------------------------
+def token_json(token):
+    '''A token, as a list of JSON strings: its kind, and its value'''
+    if isinstance(token, Number):
+        value = token.value
+        if type(value) == Fraction:
+            return ['q', digits(value.numerator), digits(value.denominator)]
+        elif type(value) == int:
+            return ['i', digits(value)]
+        return ['f', repr(value)]
+    return [str(token_kinds[type(token)], 'ascii'), token.value]
+
+def json_token(item):
+    '''The token for a list produced by token_json'''
+    kind = item[0]
+    if kind == 'f':
+        return Number(float(item[1]))
+    elif kind == 'q':
+        return Number(Fraction(int(item[1]), int(item[2])))
+    elif kind == 'i':
+        return Number(int(item[1]))
+    return token_classes[kind.encode('ascii')](item[1])
+
+def to_json(expr):
+    '''The parse tree expr as a tape, in a JSON-compatible dict'''
+    t = tape.from_tree(expr)
+    return {'pool':[token_json(token) for token in t.pool],
+            'codes':list(t.codes),
+            'left':list(t.left),
+            'right':list(t.right)}
+
+def from_json(item):
+    '''The parse tree for a dict produced by to_json'''
+    t = tape.Tape()
+    try:
+        for token in item['pool']:
+            token = json_token(token)
+            t.pooled[token] = len(t.pool)
+            t.pool.append(token)
+        for name in ('codes', 'left', 'right'):
+            getattr(t, name).extend(item[name])
+        return t.to_tree()
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        raise SerializationError('Corrupt CAS JSON: %s' % e)
+
+def dumps_json(exprs, **options):
+    '''
+    A library of parse trees (see dumps) as a JSON string; options are passed
+    on to json.dumps
+    '''
+    if isinstance(exprs, dict):
+        items = {name:to_json(expr) for name, expr in exprs.items()}
+    else:
+        items = [to_json(expr) for expr in exprs]
+    return json.dumps({'format':'CAS', 'version':version,
+                       'expressions':items}, **options)
+
+def loads_json(text):
+    '''Decode a JSON string produced by dumps_json'''
+    try:
+        document = json.loads(text)
+        if document.get('format') != 'CAS':
+            raise SerializationError('Not a CAS library')
+        if document.get('version') != version:
+            raise SerializationError('Unsupported CAS library version %r' %
+                                     document.get('version'))
+        items = document['expressions']
+    except (ValueError, AttributeError, KeyError) as e:
+        raise SerializationError('Not a CAS library: %s' % e)
+    if isinstance(items, dict):
+        return {name:from_json(item) for name, item in items.items()}
+    return [from_json(item) for item in items]
+## END -------------------------------------------------------------------------
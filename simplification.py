@@ -1,9 +1,17 @@
 '''
 Simplification routines for CAS.
+
+Expressions are simplified by rewriting: a table of rules, each of which turns
+one kind of node into a simpler equivalent (x*1 into x, x+x into 2*x, and so
+on), is applied bottom-up, and at each node over and over until none applies.
+Rules are indexed by the node's root and the kinds of its children, so only
+those that could apply are tried. A tree to which no rule applies is flagged as
+normalized; since trees are shared, that work is never repeated.
 '''
 
 from parser import Operator, MinusOp, Number, ParseTree
-from operator import add, sub, mul, truediv, pow
+from traversal import postorder, subtrees
+from operator import add, sub, mul, truediv
 from fractions import Fraction
 
 class NonNumericExpr(Exception):
@@ -13,19 +21,59 @@ class NonNumericExpr(Exception):
     def __init__(self, error_msg=''):
         Exception.__init__(self, error_msg)
 
-def reduce(expr):
+## The most rewrite steps a single call to reduce will take. Past this, the rest
+## of the expression is left as it is.
+rewrite_budget = 100000
+
+def reduce(expr, budget=None):
     '''
-    Cleans up expr, reducing any easily-computed numeric expressions.
+    Cleans up expr, reducing any easily-computed numeric expressions and
+    rewriting it, as far as the rewrite rules go, into a simpler form. At most
+    budget rewrite steps are taken (rewrite_budget, by default).
     '''
-    if not isinstance(expr, ParseTree):
+    remaining = [rewrite_budget if budget is None else budget]
+    # maps each subtree visited to its simplified form
+    memo = {}
+
+    def operands(expr):
+        if not isinstance(expr, ParseTree) or expr.normalized:
+            return ()
+        return [child for child in expr.children if child is not None]
+
+    def rebuilt(expr):
+        # expr, with its operands simplified; a negation may carry an empty
+        # right child, which is dropped, so that it is the same tree as the
+        # parser's
+        children = [memo[child] for child in expr.children if child is not None]
+        if tuple(children) != expr.value[1:]:
+            return ParseTree([expr.root] + children)
         return expr
-    else:
-        if expr.right:
-            return minimal_simplify(ParseTree([expr.root,
-                                               reduce(expr.left),
-                                               reduce(expr.right)]))
-        else:
-            return minimal_simplify(ParseTree([expr.root, reduce(expr.left)]))
+
+    def normalizer(expr):
+        if not isinstance(expr, ParseTree) or expr.normalized:
+            return expr
+        expr = rebuilt(expr)
+        while isinstance(expr, ParseTree) and not expr.normalized:
+            if remaining[0] <= 0:
+                break
+            for rewrite in rules_for(expr):
+                result = rewrite(expr)
+                if result is not None:
+                    remaining[0] -= 1
+                    break
+            else:
+                expr.normalized = True
+                break
+            # the rewritten tree's operands may be new, and need simplifying
+            # in turn
+            expr = result
+            if isinstance(expr, ParseTree) and not expr.normalized:
+                for child in subtrees(expr):
+                    postorder(child, normalizer, operands, memo)
+                expr = rebuilt(expr)
+        return expr
+
+    return postorder(expr, normalizer, operands, memo)
 
 def minimal_simplify(expr):
     if isinstance(expr.root, Operator):
@@ -33,6 +81,12 @@ def minimal_simplify(expr):
     else:
         return expr
 
+def number(value):
+    '''A Number token for value; fractions that are whole become integers'''
+    if type(value) == Fraction and value.denominator == 1:
+        value = value.numerator
+    return Number(value)
+
 def reduce_numeric_expr(expr, op):
     '''
     Reduces a numeric expression (e.g., [+, 2, 2]); raises NonNumericExpr if
@@ -40,10 +94,25 @@ def reduce_numeric_expr(expr, op):
     '''
     if False not in [isinstance(x, Number) for x in expr.children]:
         left, right = expr.left.value, expr.right.value
-        return Number(op(left, right))
+        return number(op(left, right))
     else:
         raise NonNumericExpr
 
+def exact_pow(base, exponent):
+    '''
+    base raised to exponent, kept exact: a negative power of an integer or a
+    fraction is a fraction. Raises NonNumericExpr if the power is irrational
+    or not a real number, e.g., 2^(1/2) or (-1)^0.5.
+    '''
+    if type(exponent) == Fraction and type(base) != float:
+        raise NonNumericExpr
+    if type(exponent) == int and exponent < 0 and type(base) != float:
+        return Fraction(1, base ** -exponent)
+    result = base ** exponent
+    if type(result) == complex:
+        raise NonNumericExpr
+    return result
+
 def reduce_add_sub(expr):
     '''
     Reduction cases for addition, subtraction, or negation expressions
@@ -51,7 +120,7 @@ def reduce_add_sub(expr):
     # we need two operations, since this function handles both addition and
     # subtraction
     ops = {'+':add, '-':sub}
-    
+
     # if the operands are both numeric, evaluate the expression
     try:
         return reduce_numeric_expr(expr, ops[expr.root.value])
@@ -71,7 +140,7 @@ def reduce_add_sub(expr):
                 return expr.right
             elif expr.right.value == 0:
                 return expr.left
-        
+
         return expr
 
 def reduce_mul(expr):
@@ -98,10 +167,10 @@ def reduce_div(expr):
     # thus, I won't use reduce_numeric_expr right away.
     if False not in [isinstance(x, Number) for x in expr.children] and \
             (float not in [type(x.value) for x in expr.children]):
-        return Number(Fraction(expr.left.value, expr.right.value))
+        return number(Fraction(expr.left.value, expr.right.value))
     else:
         try:
-            reduce_numeric_expr(expr, truediv)
+            return reduce_numeric_expr(expr, truediv)
         except NonNumericExpr:
             if expr.right.value == 1:
                 return expr.left
@@ -115,7 +184,7 @@ def reduce_pow(expr):
     Reduction case for exponentiation expressions
     '''
     try:
-        return reduce_numeric_expr(expr, pow)
+        return reduce_numeric_expr(expr, exact_pow)
     except:
         if expr.right.value == 1:
             return expr.left
@@ -131,4 +200,389 @@ op_table = {'+':reduce_add_sub,
             '*':reduce_mul,
             '/':reduce_div,
             '^':reduce_pow}
+## -----------------------------------------------------------------------------
+## The rule index
+## -----------------------------------------------------------------------------
+## Rules are indexed by the root of the tree they rewrite -- an operator, 'neg'
+## for a negation, or a function name -- and the kinds of its two children:
+## 'number', 'name', 'tree', None for a missing child, or any_kind.
+any_kind = 'any'
+rule_index = {}
+
+## The rules that might apply to each (root, left kind, right kind), as looked up
+## so far
+rule_lookup = {}
+
+def rule(roots, left=any_kind, right=any_kind):
+    '''
+    Register the decorated function as a rewrite rule for trees with any of
+    the given roots (one, or a tuple of them) and children of the given kinds.
+    A rule returns the rewritten tree, or None if it does not apply.
+    '''
+    if type(roots) == str:
+        roots = (roots,)
+
+    def register(func):
+        for root in roots:
+            rule_index.setdefault((root, left, right), []).append(func)
+        rule_lookup.clear()
+        return func
+    return register
+
+def kind(expr):
+    '''The kind of node expr is, for indexing rules'''
+    if expr is None:
+        return None
+    elif isinstance(expr, Number):
+        return 'number'
+    elif isinstance(expr, ParseTree):
+        return 'tree'
+    else:
+        return 'name'
+
+def root_key(expr):
+    '''The root of expr, for indexing rules'''
+    if isinstance(expr.root, MinusOp) and expr.right is None:
+        return 'neg'
+    return expr.root.value
+
+def rules_for(expr):
+    '''The rules that might apply to expr, the most specific first'''
+    key = (root_key(expr), kind(expr.left), kind(expr.right))
+    try:
+        return rule_lookup[key]
+    except KeyError:
+        root, left, right = key
+        rules = []
+        for index in ((root, left, right), (root, left, any_kind),
+                      (root, any_kind, right), (root, any_kind, any_kind)):
+            for func in rule_index.get(index, ()):
+                if func not in rules:
+                    rules.append(func)
+        rule_lookup[key] = rules
+        return rules
+## -----------------------------------------------------------------------------
+## Helpers for the rules
+## -----------------------------------------------------------------------------
+def is_negation(expr):
+    return isinstance(expr, ParseTree) and isinstance(expr.root, MinusOp) and\
+        expr.right is None
+
+def is_op(expr, *ops):
+    return isinstance(expr, ParseTree) and not is_negation(expr) and\
+        expr.root.value in ops and isinstance(expr.root, Operator)
+
+def negated(expr):
+    '''x, if expr is -x or a negative number; None otherwise'''
+    if is_negation(expr):
+        return expr.left
+    elif isinstance(expr, Number) and expr.value < 0:
+        return number(-expr.value)
+    return None
+
+def negation(expr):
+    return ParseTree([MinusOp('-'), expr])
+
+def coefficient(expr):
+    '''
+    Split a term of a sum into its numeric coefficient and the rest: 3*x gives
+    (3, x), -x gives (-1, x), x gives (1, x), and the number 3 gives (3, None).
+    '''
+    if isinstance(expr, Number):
+        return expr.value, None
+    elif is_negation(expr):
+        value, term = coefficient(expr.left)
+        return -value, term
+    elif is_op(expr, '*') and isinstance(expr.left, Number):
+        return expr.left.value, expr.right
+    return 1, expr
+
+def scaled(value, term):
+    '''The term of a sum with the given coefficient and rest'''
+    if term is None:
+        return number(value)
+    elif value == 0:
+        return Number(0)
+    elif value < 0:
+        return negation(scaled(-value, term))
+    elif value == 1:
+        return term
+    return ParseTree([Operator('*'), number(value), term])
+
+def power(expr):
+    '''Split a factor of a product into its base and exponent'''
+    if is_op(expr, '^'):
+        return expr.left, expr.right
+    return expr, Number(1)
+
+def merged(left, right):
+    '''
+    The product of left and right as a single power, if they are powers of the
+    same (non-numeric) base; None otherwise.
+    '''
+    left_base, left_exp = power(left)
+    right_base, right_exp = power(right)
+    if left_base is right_base and not isinstance(left_base, Number):
+        return ParseTree([Operator('^'), left_base,
+                          ParseTree([Operator('+'), left_exp, right_exp])])
+    return None
+
+## The most operands like_terms and like_factors look through a sum or product
+## for, to combine; past this, they look only one level down, so that long sums
+## and products aren't searched over and over, once for each of their nodes
+max_operands = 16
+
+def flattened(expr, ops):
+    '''
+    The operands of expr, nested any way under the operators in ops, in order,
+    as (sign, operand) pairs, the sign -1 for those subtracted; or None if
+    there are more than max_operands of them
+    '''
+    operands, pending = [], [(1, expr)]
+    while pending:
+        sign, expr = pending.pop()
+        if is_op(expr, *ops):
+            pending.append((-sign if expr.root.value == '-' else sign,
+                            expr.right))
+            pending.append((sign, expr.left))
+        else:
+            operands.append((sign, expr))
+        if len(operands) + len(pending) > max_operands:
+            return None
+    return operands
+## -----------------------------------------------------------------------------
+## The rules
+## -----------------------------------------------------------------------------
+@rule(('+', '-', '*', '/', '^', 'neg'))
+def table_rule(expr):
+    '''The reductions of op_table: numeric evaluation and simple identities'''
+    result = minimal_simplify(expr)
+    return None if result is expr else result
+
+@rule('neg', 'number')
+def negate_number(expr):
+    '''-(3) is the number -3'''
+    return number(-expr.left.value)
+
+@rule('neg', 'tree')
+def double_negation(expr):
+    '''-(-x) is x'''
+    return negated(expr.left) if is_negation(expr.left) else None
+
+@rule('+')
+def add_negation(expr):
+    '''x+(-y) is x-y, and (-x)+y is y-x'''
+    if negated(expr.right) is not None:
+        return ParseTree([MinusOp('-'), expr.left, negated(expr.right)])
+    elif is_negation(expr.left):
+        return ParseTree([MinusOp('-'), expr.right, expr.left.left])
+    return None
+
+@rule('-')
+def subtract_negation(expr):
+    '''x-(-y) is x+y, and (-x)-y is -(x+y)'''
+    if negated(expr.right) is not None:
+        return ParseTree([Operator('+'), expr.left, negated(expr.right)])
+    elif is_negation(expr.left):
+        return negation(ParseTree([Operator('+'), expr.left.left, expr.right]))
+    return None
+
+@rule(('+', '-'))
+def like_terms(expr):
+    '''
+    Combine like terms: 2*x+3*x is 5*x, x-x is 0, and (y+x)+x and x+(y+x) are
+    y+2*x and 2*x+y -- each term taking the place of the first like it.
+    Numbers are like terms, too, so (x+2)+3 is x+5.
+    '''
+    terms = flattened(expr, ('+', '-'))
+    if terms is None:
+        return nearby_like_terms(expr)
+    # the total coefficient of each term, in the order they first appear
+    totals = {}
+    for sign, operand in terms:
+        value, term = coefficient(operand)
+        totals[term] = totals.get(term, 0) + sign * value
+    if len(totals) == len(terms):
+        return None
+    result = None
+    for term, value in totals.items():
+        if value == 0:
+            continue
+        elif result is None:
+            result = scaled(value, term)
+        elif value < 0:
+            result = ParseTree([MinusOp('-'), result, scaled(-value, term)])
+        else:
+            result = ParseTree([Operator('+'), result, scaled(value, term)])
+    return Number(0) if result is None else result
+
+def nearby_like_terms(expr):
+    '''
+    like_terms, for sums too long to search: combines the right operand with
+    the left, or with either operand of the left
+    '''
+    sign = 1 if expr.root.value == '+' else -1
+    value, term = coefficient(expr.right)
+    left_value, left_term = coefficient(expr.left)
+    if left_term is term and term is not None:
+        return scaled(left_value + sign * value, term)
+    if is_op(expr.left, '+', '-'):
+        # (a+b)+c, where c is like a or like b
+        inner_sign = 1 if expr.left.root.value == '+' else -1
+        a_value, a_term = coefficient(expr.left.left)
+        b_value, b_term = coefficient(expr.left.right)
+        if b_term is term:
+            return ParseTree([expr.left.root, expr.left.left,
+                              scaled(b_value + inner_sign * sign * value,
+                                     term)])
+        elif a_term is term:
+            return ParseTree([expr.left.root,
+                              scaled(a_value + sign * value, term),
+                              expr.left.right])
+    return None
+
+@rule('*', 'number', 'tree')
+def collect_coefficients(expr):
+    '''2*(3*x) is 6*x'''
+    if is_op(expr.right, '*') and isinstance(expr.right.left, Number):
+        return ParseTree([expr.root,
+                          number(expr.left.value * expr.right.left.value),
+                          expr.right.right])
+    return None
+
+@rule('*', 'number')
+def negative_coefficient(expr):
+    '''(-2)*x is -(2*x)'''
+    if negated(expr.left) is not None and not isinstance(expr.right, Number):
+        return negation(ParseTree([expr.root, negated(expr.left), expr.right]))
+    return None
+
+@rule('*', 'tree', 'number')
+@rule('*', 'name', 'number')
+def coefficient_first(expr):
+    '''x*2 is 2*x'''
+    return ParseTree([expr.root, expr.right, expr.left])
+
+@rule('*')
+def move_coefficients(expr):
+    '''(2*x)*y and x*(2*y) are both 2*(x*y)'''
+    for factor, other in ((expr.left, expr.right), (expr.right, expr.left)):
+        if is_op(factor, '*') and isinstance(factor.left, Number) and\
+                not isinstance(other, Number):
+            if factor is expr.left:
+                rest = ParseTree([expr.root, factor.right, other])
+            else:
+                rest = ParseTree([expr.root, other, factor.right])
+            return ParseTree([expr.root, factor.left, rest])
+    return None
+
+@rule(('*', '/'))
+def factor_negation(expr):
+    '''(-x)*y and x*(-y) are both -(x*y); likewise for quotients'''
+    if is_negation(expr.left):
+        return negation(ParseTree([expr.root, expr.left.left, expr.right]))
+    elif is_negation(expr.right):
+        return negation(ParseTree([expr.root, expr.left, expr.right.left]))
+    return None
+
+@rule('*')
+def like_factors(expr):
+    '''
+    x*x is x^2, x^a*x^b is x^(a+b), and (y*x)*x and x*(y*x) are y*x^2 and
+    x^2*y -- each power taking the place of the first factor with its base
+    '''
+    factors = flattened(expr, ('*',))
+    if factors is None:
+        return nearby_like_factors(expr)
+    # the factors with each (non-numeric) base, in the order they first appear
+    bases, groups = {}, []
+    for sign, factor in factors:
+        base, exponent = power(factor)
+        if base in bases and not isinstance(base, Number):
+            groups[bases[base]][1].append(factor)
+        else:
+            bases[base] = len(groups)
+            groups.append((base, [factor]))
+    if len(groups) == len(factors):
+        return None
+    result = None
+    for base, group in groups:
+        factor = group[0]
+        for other in group[1:]:
+            factor = merged(factor, other)
+        result = factor if result is None else\
+            ParseTree([Operator('*'), result, factor])
+    return result
+
+def nearby_like_factors(expr):
+    '''
+    like_factors, for products too long to search: merges the right operand
+    with the left, or with either operand of the left
+    '''
+    product = merged(expr.left, expr.right)
+    if product is not None:
+        return product
+    if is_op(expr.left, '*'):
+        product = merged(expr.left.right, expr.right)
+        if product is not None:
+            return ParseTree([expr.root, expr.left.left, product])
+        product = merged(expr.left.left, expr.right)
+        if product is not None:
+            return ParseTree([expr.root, product, expr.left.right])
+    return None
+
+@rule('/')
+def self_quotient(expr):
+    '''x/x is 1'''
+    if expr.left is expr.right and not isinstance(expr.left, Number):
+        return Number(1)
+    return None
+
+@rule('^', 'tree', 'number')
+def power_of_power(expr):
+    '''(x^a)^n is x^(a*n), for a whole number n; (-x)^n is x^n or -(x^n)'''
+    if type(expr.right.value) != int:
+        return None
+    if is_op(expr.left, '^'):
+        return ParseTree([expr.root, expr.left.left,
+                          ParseTree([Operator('*'), expr.left.right,
+                                     expr.right])])
+    elif is_negation(expr.left):
+        result = ParseTree([expr.root, expr.left.left, expr.right])
+        return result if expr.right.value % 2 == 0 else negation(result)
+    return None
+
+@rule('^', 'number')
+def power_of_one(expr):
+    '''1^x is 1'''
+    return Number(1) if expr.left.value == 1 else None
+
+## Functions at those points where their values are exact
+exact_values = {('sin', 0):0,
+                ('cos', 0):1,
+                ('tan', 0):0,
+                ('exp', 0):1,
+                ('ln', 1):0}
+
+@rule(('sin', 'cos', 'tan', 'exp', 'ln'), 'number')
+def exact_value(expr):
+    '''sin(0) is 0, exp(0) is 1, and so on'''
+    if (expr.root.value, expr.left.value) in exact_values:
+        return Number(exact_values[(expr.root.value, expr.left.value)])
+    return None
+
+@rule(('sin', 'cos', 'tan'), 'tree')
+def odd_even(expr):
+    '''sin(-x) is -sin(x), tan(-x) is -tan(x), and cos(-x) is cos(x)'''
+    if is_negation(expr.left):
+        result = ParseTree([expr.root, expr.left.left])
+        return result if expr.root.value == 'cos' else negation(result)
+    return None
+
+@rule('ln', 'tree')
+def log_of_exp(expr):
+    '''ln(exp(x)) is x'''
+    if isinstance(expr.left.root, Operator) or expr.left.root.value != 'exp':
+        return None
+    return expr.left.left
 ## END -------------------------------------------------------------------------
@@ -0,0 +1,357 @@
+'''
+Compact storage of expressions for CAS.
+
+A Tape holds an expression as a flat sequence of instructions, in postfix
+order: each is a Number or a Name, or an operator, function or transform
+applied to the results of instructions before it. An instruction takes three
+machine integers in all, in arrays, where a parse tree node takes a Python
+object, a tuple and several references: a million-node expression fits in a
+dozen megabytes. As in parse trees, shared subexpressions are stored once.
+
+Tapes are evaluated, differentiated and printed directly, one pass along the
+tape each, without being converted back into parse trees.
+'''
+
+from array import array
+from operator import add, sub, mul, truediv, pow, neg
+
+from parser import Operator, MinusOp, Func, Transform, Name, Number, ParseTree
+import differentiation
+import evaluation
+import printing
+from traversal import postorder
+
+## The operand index of an operand that isn't there
+none = -1
+
+## The Python operators for each of CAS's
+scalar_ops = {'^':pow,
+              '*':mul,
+              '/':truediv,
+              '+':add,
+              '-':sub}
+
+class Tape():
+    '''
+    An expression as a tape of instructions. Instruction i applies the token
+    pool[codes[i]] to the results of instructions left[i] and right[i] -- the
+    operands of an operator, a function's argument, or a transform's integrand
+    and variable -- either of which may be none. A Number or a Name has no
+    operands, and its result is itself. The last instruction gives the value
+    of the whole expression.
+
+    The pool holds each distinct token once; its index of them is kept in
+    pooled.
+    '''
+    def __init__(self):
+        self.codes = array('i')
+        self.left = array('i')
+        self.right = array('i')
+        self.pool = []
+        self.pooled = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        '''Generate each instruction, as its token and its operands' indices'''
+        pool = self.pool
+        for code, left, right in zip(self.codes, self.left, self.right):
+            yield pool[code], left, right
+
+    def append(self, token, left=none, right=none):
+        '''Add an instruction to the end of the tape, and return its index'''
+        try:
+            code = self.pooled[token]
+        except KeyError:
+            code = self.pooled[token] = len(self.pool)
+            self.pool.append(token)
+        self.codes.append(code)
+        self.left.append(left)
+        self.right.append(right)
+        return len(self.codes) - 1
+
+    def nbytes(self):
+        '''The size of the instruction arrays, in bytes'''
+        return sum([len(a) * a.itemsize
+                    for a in (self.codes, self.left, self.right)])
+
+    def to_tree(self):
+        '''Convert the tape into a parse tree'''
+        nodes = []
+        for token, left, right in self:
+            if left == none:
+                nodes.append(token)
+            elif right == none:
+                nodes.append(ParseTree([token, nodes[left]]))
+            else:
+                nodes.append(ParseTree([token, nodes[left], nodes[right]]))
+        return nodes[-1]
+
+    def compacted(self, result=none):
+        '''
+        A copy of the tape with just the instructions that the instruction
+        result (by default, the last) uses, ending with result
+        '''
+        used = bytearray(len(self))
+        used[result] = 1
+        for i in reversed(range(len(self))):
+            if used[i]:
+                if self.left[i] != none:
+                    used[self.left[i]] = 1
+                if self.right[i] != none:
+                    used[self.right[i]] = 1
+        tape = Tape()
+        # the index of each instruction kept, on the new tape
+        moved = array('i', [none]) * len(self)
+        for i, (token, left, right) in enumerate(self):
+            if used[i]:
+                moved[i] = tape.append(token,
+                                       moved[left] if left != none else none,
+                                       moved[right] if right != none else none)
+        return tape
+
+    def run(self, leaf_value, funcs, ops, integral=None):
+        '''
+        Evaluate the tape: leaf_value gives the value of a Number or a Name;
+        funcs maps function names to their implementations, and ops, operators
+        to theirs. Integrals CAS has no antiderivative for can't be evaluated,
+        unless integral is given: it is called with the tape, the index of the
+        transform's instruction and the values so far, and returns its value.
+        '''
+        # what to do for each token in the pool
+        actions = []
+        for token in self.pool:
+            if isinstance(token, Transform):
+                actions.append(None)
+            elif isinstance(token, Func):
+                try:
+                    actions.append(funcs[token.value])
+                except KeyError:
+                    raise evaluation.EvaluationError('Unknown function: %s' %
+                                                     token.value)
+            elif isinstance(token, Operator):
+                actions.append(ops[token.value])
+            else:
+                actions.append(leaf_value(token))
+
+        values = []
+        for code, left, right in zip(self.codes, self.left, self.right):
+            action = actions[code]
+            if left == none:
+                values.append(action)
+            elif action is None:
+                if integral is None:
+                    raise evaluation.EvaluationError(
+                        'Cannot evaluate an integral with respect to %s that '
+                        'CAS has no antiderivative for' %
+                        self.pool[self.codes[right]])
+                values.append(integral(self, len(values), values))
+            elif right == none:
+                # a function, or a negation
+                values.append(neg(values[left]) if action is ops['-'] else
+                              action(values[left]))
+            else:
+                values.append(action(values[left], values[right]))
+        return values[-1]
+
+    def evaluate(self, **bindings):
+        '''
+        Evaluate the tape at a single point, given by the value of each
+        variable as keyword arguments.
+
+        Example: t.evaluate(x=1, y=2)
+        '''
+        def leaf_value(token):
+            if isinstance(token, Number):
+                return float(token.value)
+            try:
+                return bindings[token.value]
+            except KeyError:
+                raise evaluation.EvaluationError('No value for variable: %s' %
+                                                 token.value)
+
+        return self.run(leaf_value, evaluation.math_funcs, scalar_ops)
+
+    def evaluate_array(self, **bindings):
+        '''
+        Evaluate the tape over NumPy arrays, given for each variable as keyword
+        arguments; the arrays are broadcast against each other.
+        '''
+        numpy = evaluation.numpy
+        if numpy is None:
+            raise evaluation.EvaluationError('Evaluation over arrays requires '
+                                             'NumPy')
+        arrays = {name:numpy.asarray(values, dtype=float)
+                  for name, values in bindings.items()}
+        shape = numpy.broadcast_shapes(*[a.shape for a in arrays.values()])
+
+        def leaf_value(token):
+            if isinstance(token, Number):
+                return float(token.value)
+            try:
+                return arrays[token.value]
+            except KeyError:
+                raise evaluation.EvaluationError('No value for variable: %s' %
+                                                 token.value)
+
+        result = self.run(leaf_value, evaluation.array_funcs,
+                          evaluation.array_ops)
+        return numpy.array(numpy.broadcast_to(result, shape))
+
+    def diff(self, var):
+        '''
+        Differentiate the tape with respect to the variable named var, in a
+        single pass along it, giving a new tape: this one, with the
+        instructions for the derivative appended.
+
+        The derivative isn't simplified (see simplification.reduce), beyond
+        leaving out terms that are zero and factors that are one.
+        '''
+        tape = Tape()
+        tape.codes, tape.left, tape.right = array('i', self.codes),\
+            array('i', self.left), array('i', self.right)
+        tape.pool, tape.pooled = list(self.pool), dict(self.pooled)
+        # the instructions appended, so that none is appended twice
+        appended = {}
+
+        def emit(token, left=none, right=none):
+            key = (token, left, right)
+            if key not in appended:
+                appended[key] = tape.append(token, left, right)
+            return appended[key]
+
+        # a zero derivative has no instruction: it is none
+        zero, one = none, emit(Number(1))
+
+        def plus(a, b):
+            if a == zero:
+                return b
+            return a if b == zero else emit(Operator('+'), a, b)
+
+        def minus(a, b):
+            if b == zero:
+                return a
+            elif a == zero:
+                return zero if b == zero else emit(MinusOp('-'), b)
+            return emit(MinusOp('-'), a, b)
+
+        def times(a, b):
+            if a == zero or b == zero:
+                return zero
+            elif a == one:
+                return b
+            return a if b == one else emit(Operator('*'), a, b)
+
+        def over(a, b):
+            if a == zero:
+                return zero
+            return a if b == one else emit(Operator('/'), a, b)
+
+        def power(a, b):
+            return a if b == one else emit(Operator('^'), a, b)
+
+        # the derivative of each function, f'(u)*du as a tree in the
+        # placeholders u and du (names no expression can contain), which are
+        # bound to instructions when it is copied onto the tape
+        u, du = Name(' u'), Name(' du')
+        func_rules = {}
+
+        def func_rule(name):
+            if name not in func_rules:
+                func_rules[name] = differentiation.diff_func(
+                    ParseTree([Func(name), u]), var, {u:du})
+            return func_rules[name]
+
+        def copied(tree, operand, derivative):
+            def copy(expr):
+                if not isinstance(expr, ParseTree):
+                    return emit(expr)
+                elif expr.root is Operator('*'):
+                    return times(bound[expr.left], bound[expr.right])
+                return emit(expr.root, *[bound[child] for child in
+                                         expr.children if child is not None])
+
+            bound = {u:operand, du:derivative}
+            return postorder(tree, copy, memo=bound)
+
+        variable = Name(var)
+        derivatives = array('i')
+        for i, (token, left, right) in enumerate(self):
+            if left == none:
+                derivatives.append(one if token is variable else zero)
+                continue
+            dleft = derivatives[left]
+            dright = derivatives[right] if right != none else zero
+            if dleft == zero and dright == zero:
+                derivative = zero
+            elif isinstance(token, Transform):
+                raise ValueError('No rule to differentiate %s' % token.value)
+            elif isinstance(token, Func):
+                derivative = copied(func_rule(token.value), left, dleft)
+            elif right == none:
+                derivative = emit(MinusOp('-'), dleft)
+            elif token.value == '+':
+                derivative = plus(dleft, dright)
+            elif token.value == '-':
+                derivative = minus(dleft, dright)
+            elif token.value == '*':
+                derivative = plus(times(left, dright), times(dleft, right))
+            elif token.value == '/':
+                derivative = minus(over(dleft, right),
+                                   over(times(left, dright),
+                                        power(right, emit(Number(2)))))
+            elif dright == zero:
+                # u^v, where v doesn't depend on var: v*u^(v-1)*du
+                exponent = self.pool[self.codes[right]]
+                if isinstance(exponent, Number):
+                    lowered = emit(Number(exponent.value - 1))
+                else:
+                    lowered = emit(MinusOp('-'), right, one)
+                derivative = times(times(right, power(left, lowered)), dleft)
+            else:
+                # u^v: u^v*(dv*ln(u) + v*du/u)
+                derivative = times(i, plus(times(dright,
+                                                 emit(Func('ln'), left)),
+                                           over(times(right, dleft), left)))
+            derivatives.append(derivative)
+
+        if derivatives[-1] == zero:
+            return from_tree(Number(0))
+        return tape.compacted(derivatives[-1])
+
+    def output(self, gnuplot_mode=False):
+        '''The output for printing the tape (see printing)'''
+        outputs = []
+        for token, left, right in self:
+            if left == none:
+                outputs.append(printing.leaf(token))
+            else:
+                outputs.append(printing.node(token, outputs[left],
+                                             outputs[right]
+                                             if right != none else None,
+                                             gnuplot_mode))
+        return outputs[-1][0]
+
+    def write(self, file, gnuplot_mode=False):
+        '''Print the tape to file, as it is written by str'''
+        printing.write(self.output(gnuplot_mode), file)
+
+    def __str__(self):
+        return ''.join(printing.pieces(self.output()))
+
+def from_tree(expr):
+    '''Convert the parse tree expr into a Tape'''
+    tape = Tape()
+    # the index on the tape of the instruction for each subtree
+    index = {}
+
+    def append(expr):
+        if not isinstance(expr, ParseTree):
+            return tape.append(expr)
+        return tape.append(expr.root, *[index[child] for child in
+                                        expr.children if child is not None])
+
+    postorder(expr, append, memo=index)
+    return tape
+## END -------------------------------------------------------------------------
@@ -0,0 +1,9 @@
+'''
+The tests import CAS's modules directly, as CAS itself does, so the directory
+above this one has to be on the path.
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,42 @@
+'''
+Tests for evaluation over NumPy arrays.
+'''
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from cas import Expr
+from evaluation import EvaluationError
+
+def test_matches_compiled():
+    f = Expr('x^2*sin(y)-exp(x)/(1+y^2)+ln(abs(x))')
+    x = numpy.linspace(0.1, 3, 50)
+    y = numpy.linspace(-1, 1, 50)
+    g = f.compile('x', 'y')
+    assert numpy.allclose(f.evaluate_array(x=x, y=y),
+                          [g(a, b) for a, b in zip(x, y)])
+
+def test_broadcast():
+    x, y = numpy.meshgrid(numpy.arange(3), numpy.arange(4))
+    assert Expr('x*10+y').evaluate_array(x=x[0], y=y[:, :1]).shape == (4, 3)
+
+def test_constant_full_shape():
+    result = Expr('2+3').evaluate_array(x=numpy.zeros(5))
+    assert numpy.array_equal(result, numpy.full(5, 5.0))
+
+def test_variable_copied():
+    x = numpy.arange(4.0)
+    result = Expr('x').evaluate_array(x=x)
+    result += 1
+    assert numpy.array_equal(x, numpy.arange(4.0))
+
+def test_shared_subexpression_not_overwritten():
+    # sin(x) is used twice; it must not be overwritten in place between uses
+    x = numpy.linspace(0, 1, 10)
+    assert numpy.allclose(Expr('sin(x)*2+sin(x)^2').evaluate_array(x=x),
+                          numpy.sin(x) * 2 + numpy.sin(x)**2)
+
+def test_missing_variable():
+    with pytest.raises(EvaluationError):
+        Expr('x+y').evaluate_array(x=numpy.zeros(3))
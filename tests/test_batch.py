@@ -0,0 +1,45 @@
+'''
+Tests for parallel batch processing.
+'''
+
+import pytest
+
+from batch import batch_map
+from cas import Expr
+from cli import IllegalOperation
+from evaluation import EvaluationError
+from parser import IllegalExpr, ParseTree, Operator, Name, Number
+from serialization import SerializationError
+
+def squared(f):
+    return Expr(expr_tree=ParseTree([Operator('^'), f.tree_repr, Number(2)]))
+
+def test_results_in_order():
+    exprs = ['x^%d' % n for n in range(2, 60)]
+    results = list(batch_map('d:x', exprs, workers=2, chunksize=4))
+    assert results == [Expr(expr).d('x') for expr in exprs]
+
+def test_strings_and_numbers():
+    values = list(batch_map('d:x eval:x=2', ['x^3', 'x*y^2'], workers=1))
+    assert values[0] == 12.0
+    assert isinstance(values[1], EvaluationError)
+    assert list(batch_map('int:x', [Expr('x'), Expr('2*x').tree_repr],
+                          workers=1, as_strings=True)) == ['x^2/2', 'x^2']
+
+def test_function():
+    assert [str(f) for f in batch_map(squared, ['x+1'], workers=1)] == \
+        ['(x+1)^2']
+
+def test_errors_and_blank_lines():
+    huge = ParseTree([Operator('*'), Name('x'), Number(10**5000)])
+    results = list(batch_map('d:x', ['x^2', '', 'x+', '  ', huge, 'sin(x)'],
+                             workers=2, chunksize=2, as_strings=True))
+    assert len(results) == 4
+    assert results[0] == '2*x'
+    assert isinstance(results[1], IllegalExpr)
+    assert isinstance(results[2], SerializationError)
+    assert results[3] == 'cos(x)'
+
+def test_bad_operation():
+    with pytest.raises(IllegalOperation):
+        list(batch_map('d', ['x']))
@@ -0,0 +1,73 @@
+'''
+Tests for the persistent result cache.
+'''
+
+import pytest
+
+import caching
+from cas import Expr
+
+@pytest.fixture
+def cache(tmp_path):
+    yield caching.enable(str(tmp_path / 'results.db'))
+    caching.disable()
+
+def test_hit(cache):
+    first = Expr('x*sin(x)').d('x')
+    assert cache.info()[:2] == (0, 1)
+    again = Expr('x*sin(x)').d('x')
+    assert cache.info()[:2] == (1, 1)
+    assert again == first
+
+def test_operations_and_variables_kept_apart(cache):
+    f = Expr('x^2*y')
+    assert str(f.d('y')) == 'x^2'
+    assert str(f.integrate('x')) == 'x^3*y/3'
+    assert f.d('x') != f.d('y')
+    assert cache.info().hits == 0
+    assert len(cache) == 3
+
+def test_shared_between_caches(tmp_path, cache):
+    Expr('exp(x)*x').d('x')
+    other = caching.ResultCache(cache.filename)
+    key = other.key('d', Expr('exp(x)*x').tree_repr, 'x')
+    assert other.get(key) is Expr('exp(x)*x').d('x').tree_repr
+    other.close()
+
+def test_new_code_invalidates(cache, monkeypatch):
+    Expr('x*cos(x)').d('x')
+    monkeypatch.setattr(caching, 'version', 'changed')
+    Expr('x*cos(x)').d('x')
+    assert cache.info()[:2] == (0, 2)
+
+def test_eviction(tmp_path):
+    cache = caching.enable(str(tmp_path / 'small.db'), maxsize=2000)
+    try:
+        for i in range(100):
+            Expr('x^%d*sin(x)' % (i + 2)).d('x')
+        assert cache.info().currsize <= 2000
+        assert len(cache) < 100
+    finally:
+        caching.disable()
+
+def test_unserializable_result(cache):
+    # the derivative has an integer too long to serialize: it isn't kept, but
+    # it is still returned
+    assert Expr('x*10^5000').d('x').tree_repr.value == 10**5000
+    assert Expr('x^2*10^5000').d('x').d('x').tree_repr.value == 2 * 10**5000
+    assert len(cache) == 0
+
+def test_unreadable_file(tmp_path):
+    path = tmp_path / 'broken.db'
+    cache = caching.enable(str(path))
+    try:
+        Expr('x^3').d('x')
+        cache.close()
+        path.write_bytes(b'not a database' * 100)
+        assert str(Expr('x^3').d('x')) == '3*x^2'
+    finally:
+        caching.disable()
+
+def test_disabled():
+    assert caching.result_cache is None
+    assert str(Expr('x^4').d('x')) == '4*x^3'
@@ -0,0 +1,62 @@
+'''
+Tests for the command line interface.
+'''
+
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import cli
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run(args, text):
+    '''Run python -m cas with args, on text; returns the exit status and
+    output'''
+    process = subprocess.run([sys.executable, '-m', 'cas'] + args,
+                             input=text, capture_output=True, text=True,
+                             cwd=root)
+    return process.returncode, process.stdout, process.stderr
+
+def test_operations():
+    status, output, errors = run(['d:x', 'd:x', 'eval:x=0'],
+                                 'x^2*sin(x)\nexp(2*x)\n')
+    assert status == 0
+    assert [float(line) for line in output.split()] == [0.0, 4.0]
+
+def test_errors_reported_per_line():
+    status, output, errors = run(['int:x'], 'x^-1\nx+\n\nx^2\n')
+    lines = output.splitlines()
+    assert status == 1
+    assert len(lines) == 3
+    assert lines[0] == 'ln(abs(x))'
+    assert lines[1].startswith('error: IllegalExpr')
+    assert lines[2] == 'x^3/3'
+
+def test_bad_operation():
+    status, output, errors = run(['diff:x'], 'x\n')
+    assert status == 2
+    assert 'Unknown operation' in errors
+
+def test_eval_last():
+    status, output, errors = run(['eval:x=1', 'd:x'], 'x\n')
+    assert status == 2
+
+def test_jsonl():
+    output = io.StringIO()
+    errors = cli.process(['x*y', '', 'sin(', 'x^3'], ['d:x'], output,
+                         jsonl=True)
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert errors == 1
+    assert records[0] == {'line':1, 'input':'x*y', 'result':'y'}
+    assert records[1]['line'] == 3 and 'error' in records[1]
+    assert records[2] == {'line':4, 'input':'x^3', 'result':'3*x^2'}
+
+@pytest.mark.parametrize('spec', ['d', 'int:', 'eval:x=one'])
+def test_illegal_operation(spec):
+    with pytest.raises(cli.IllegalOperation):
+        cli.process([], [spec], io.StringIO())
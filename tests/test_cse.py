@@ -0,0 +1,31 @@
+'''
+Tests for common subexpression elimination.
+'''
+
+from cas import Expr
+import cse
+from parser import Parser
+
+def test_shared_subexpressions():
+    temporaries, expr = Expr('sin(x+1)*sin(x+1)+(x+1)').cse()
+    assert [(name, str(subexpr)) for name, subexpr in temporaries] == \
+        [('_c0', 'x+1'), ('_c1', 'sin(_c0)')]
+    assert str(expr) == '_c1*_c1+_c0'
+
+def test_nothing_shared():
+    temporaries, expr = Expr('x*y+z').cse()
+    assert temporaries == []
+    assert str(expr) == 'x*y+z'
+
+def test_names_in_use_skipped():
+    temporaries, expr = Expr('_c0+sin(_c0)*sin(_c0)').cse()
+    assert [name for name, subexpr in temporaries] == ['_c1']
+
+def test_shared_between_expressions():
+    parse = Parser().parse
+    temporaries, results = cse.eliminate_all([parse('exp(x)+1'),
+                                              parse('exp(x)*2')])
+    assert [str(Expr(expr_tree=subexpr))
+            for temp, subexpr in temporaries] == ['exp(x)']
+    assert [str(Expr(expr_tree=result))
+            for result in results] == ['_c0+1', '_c0*2']
@@ -0,0 +1,43 @@
+'''
+Tests for differentiation, against known derivatives and finite differences.
+'''
+
+import pytest
+
+from cas import Expr
+from differentiation import derive
+from parser import Parser
+
+@pytest.mark.parametrize('expr, expected', [
+    ('x^3', '3*x^2'),
+    ('sin(x)', 'cos(x)'),
+    ('exp(2*x)', '2*exp(2*x)'),
+    ('x*y', 'y'),
+    ('y^2', '0'),
+    ('x/y', 'y^(-1)'),
+])
+def test_known_derivatives(expr, expected):
+    assert str(Expr(expr).d('x')) == expected
+
+@pytest.mark.parametrize('expr', [
+    'x^2*sin(x)', 'exp(x)/(1+x^2)', 'tan(x)*cos(x)', 'x/(x+1)/(x+2)',
+    'exp(sin(x))*x^2', 'sin(x)/x^3', '(x^2+1)^5-x^-2',
+])
+def test_finite_differences(expr):
+    f = Expr(expr).compile('x')
+    df = Expr(expr).d('x').compile('x')
+    h = 1e-6
+    for x in (0.3, 0.7, 1.9):
+        assert df(x) == pytest.approx((f(x + h) - f(x - h)) / (2 * h),
+                                      rel=1e-5, abs=1e-6)
+
+def test_memoized():
+    # each subtree of a nested quotient is differentiated once, however often
+    # the derivatives built from it refer to it
+    source = 'x'
+    for i in range(32):
+        source = '(%s)/(x+%d)' % (source, i)
+    tree = Parser().parse(source)
+    memo = {}
+    derive(tree, 'x', memo)
+    assert len(memo) == 2 * 32 + 1
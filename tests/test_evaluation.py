@@ -0,0 +1,47 @@
+'''
+Tests for compiled numeric evaluation.
+'''
+
+import math
+
+import pytest
+
+from cas import Expr
+from evaluation import EvaluationError
+
+def test_compile():
+    f = Expr('x^2*sin(y)+exp(x)/2').compile('x', 'y')
+    assert f(1.5, 0.5) == pytest.approx(1.5**2 * math.sin(0.5) +
+                                        math.exp(1.5) / 2)
+
+def test_argument_order():
+    f = Expr('x-y')
+    assert f.compile('x', 'y')(3, 1) == 2
+    assert f.compile('y', 'x')(3, 1) == -2
+
+def test_compiled_once():
+    f = Expr('x+1')
+    assert f.compile('x') is f.compile('x')
+
+def test_exact_constants():
+    assert Expr('x/3').d('x').compile('x')(0) == pytest.approx(1 / 3)
+
+def test_deep_nesting():
+    # deeper than Python's parser would take as a single expression
+    f = Expr('+'.join(['sin(x)^%d' % i for i in range(1, 500)]))
+    x = 0.5
+    assert f.compile('x')(x) == pytest.approx(sum(math.sin(x)**i
+                                                  for i in range(1, 500)))
+
+@pytest.mark.parametrize('expr, vars', [
+    ('x+y', ('x',)),
+    ('x', ('_t0',)),
+    ('x', ('lambda',)),
+])
+def test_errors(expr, vars):
+    with pytest.raises(EvaluationError):
+        Expr(expr).compile(*vars)
+
+def test_unevaluated_integral():
+    with pytest.raises(EvaluationError):
+        Expr('x^x').integrate('x').compile('x')
@@ -0,0 +1,55 @@
+'''
+Tests for derivatives found in forward mode.
+'''
+
+import pytest
+
+from cas import Expr
+from evaluation import EvaluationError
+
+corpus = ['x^2*sin(y)+exp(x)/(1+y^2)', 'sin(x)*sin(x)-cos(x*y)',
+          'tan(x)^3-x/y', '-(x-y)^2+2^y*x', 'cos(x)*(x-y)^2', 'x/(x+y)^3',
+          'exp(sin(x*y))']
+
+@pytest.mark.parametrize('expr', corpus)
+def test_matches_symbolic(expr):
+    f = Expr(expr)
+    value, derivative = f.eval_with_derivative('x', x=0.7, y=1.3)
+    assert value == pytest.approx(f.compile('x', 'y')(0.7, 1.3))
+    assert derivative == pytest.approx(f.d('x').compile('x', 'y')(0.7, 1.3))
+
+def test_variable_exponent():
+    # (2^x)' = 2^x*ln(2)
+    value, derivative = Expr('2^x').eval_with_derivative('x', x=1.5)
+    assert value == pytest.approx(2**1.5)
+    assert derivative == pytest.approx(2**1.5 * 0.6931471805599453)
+
+def test_ln_and_abs():
+    # symbolic d has no rules for these
+    assert Expr('ln(x)').eval_with_derivative('x', x=4) == \
+        pytest.approx((1.3862943611198906, 0.25))
+    assert Expr('abs(x-y)').eval_with_derivative('x', x=1, y=2) == (1, -1)
+
+def test_constant_in_var():
+    assert Expr('y^2').eval_with_derivative('x', x=1, y=3) == (9, 0)
+
+def test_missing_variable():
+    with pytest.raises(EvaluationError):
+        Expr('x+y').eval_with_derivative('x', x=1)
+
+@pytest.mark.parametrize('expr', corpus)
+def test_array(expr):
+    numpy = pytest.importorskip('numpy')
+    f = Expr(expr)
+    x = numpy.linspace(0.5, 2, 9)
+    values, derivatives = f.eval_with_derivative_array('x', x=x, y=1.3)
+    assert values.shape == derivatives.shape == x.shape
+    assert numpy.allclose(values, f.evaluate_array(x=x, y=1.3))
+    assert numpy.allclose(derivatives, f.d('x').evaluate_array(x=x, y=1.3))
+
+def test_array_broadcast():
+    numpy = pytest.importorskip('numpy')
+    values, derivatives = Expr('y^2').eval_with_derivative_array(
+        'x', x=numpy.zeros(4), y=2)
+    assert numpy.array_equal(values, numpy.full(4, 4.0))
+    assert numpy.array_equal(derivatives, numpy.zeros(4))
@@ -0,0 +1,39 @@
+'''
+Tests for the free variables and polynomial flags recorded on each node.
+'''
+
+import pytest
+
+from parser import Parser, Number, Name, Func
+
+parse = Parser().parse
+
+@pytest.mark.parametrize('expr, free_vars', [
+    ('2+3', set()),
+    ('x', {'x'}),
+    ('sin(x)*y-exp(2)', {'x', 'y'}),
+    ('x^y/z', {'x', 'y', 'z'}),
+])
+def test_free_vars(expr, free_vars):
+    assert parse(expr).free_vars == free_vars
+
+def test_function_names_not_variables():
+    assert Func('sin').free_vars == set()
+    assert Name('sin').free_vars == {'sin'}
+
+@pytest.mark.parametrize('expr, polynomial', [
+    ('x^2*y-3*x+1', True),
+    ('(x+1)^3/2', True),
+    ('-x', True),
+    ('x^-1', False),
+    ('x/y', False),
+    ('x^1.5', False),
+    ('1.5*x', False),
+    ('sin(x)', False),
+    ('x/0', False),
+])
+def test_polynomial(expr, polynomial):
+    assert parse(expr).polynomial == polynomial
+
+def test_exact_numbers():
+    assert Number(2).polynomial and not Number(2.0).polynomial
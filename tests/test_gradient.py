@@ -0,0 +1,33 @@
+'''
+Tests for gradients, Hessians and Jacobians.
+'''
+
+import pytest
+
+from cas import Expr, jacobian, compile_matrix
+
+def printed(matrix):
+    return [[str(e) for e in row] for row in matrix]
+
+def test_gradient():
+    f = Expr('x^2*y+sin(y)')
+    assert [str(e) for e in f.gradient(['x', 'y', 'z'])] == \
+        [str(f.d('x')), str(f.d('y')), '0']
+
+def test_hessian_symmetric():
+    f = Expr('x^3*y^2+exp(x*y)')
+    rows = f.hessian(['x', 'y'])
+    # the mixed partial derivative is found once, and shared
+    assert rows[1][0] == rows[0][1]
+    assert printed(rows) == [[str(f.d('x').d('x')), str(f.d('x').d('y'))],
+                             [str(f.d('x').d('y')), str(f.d('y').d('y'))]]
+
+def test_jacobian():
+    rows = jacobian([Expr('x*y'), Expr('x+y^2')], ['x', 'y'])
+    assert printed(rows) == [['y', 'x'], ['1', '2*y']]
+
+def test_compile_matrix():
+    rows = Expr('x^2*y^3').hessian(['x', 'y'])
+    values = compile_matrix(rows, 'x', 'y')(1, 2)
+    assert values[0] == pytest.approx([16, 24])
+    assert values[1] == pytest.approx([24, 12])
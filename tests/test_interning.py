@@ -0,0 +1,38 @@
+'''
+Tests for interned tokens and parse trees.
+'''
+
+import copy
+import gc
+import pickle
+
+from parser import Parser, ParseTree, Interned, Number, Name, Operator, Func
+
+def test_identical_trees_shared():
+    tree = Parser().parse('sin(x)*sin(x)+1')
+    assert tree.left.left is tree.left.right
+    assert ParseTree([Operator('+'), tree.left, Number(1)]) is tree
+
+def test_number_types_distinct():
+    assert Number(1) is not Number(1.0)
+    assert Number(1) is Number('1')
+
+def test_signed_zeros_distinct():
+    assert Number(-0.0) is not Number(0.0)
+    assert str(Number(-0.0)) == '-0.0'
+    assert Number(float('-0')) is Number(-0.0)
+
+def test_name_and_function_distinct():
+    assert Name('sin') is not Func('sin')
+
+def test_copies_interned():
+    tree = Parser().parse('x^2-y')
+    assert pickle.loads(pickle.dumps(tree)) is tree
+    assert copy.deepcopy(tree) is tree
+
+def test_unused_trees_dropped():
+    tree = Parser().parse('unused_variable_1234+1')
+    key = tree.key()
+    del tree
+    gc.collect()
+    assert key not in Interned.table
@@ -0,0 +1,39 @@
+'''
+Tests for cached and streamed printing.
+'''
+
+import io
+
+from cas import Expr
+
+class Recorder():
+    '''A file that records each write'''
+    def __init__(self):
+        self.chunks = []
+    def write(self, text):
+        self.chunks.append(text)
+
+def test_cached():
+    f = Expr('x^2+sin(x)')
+    assert str(f) is str(f)
+    assert f.__str__(gnuplot_mode=True) == 'x**2+sin(x)'
+    assert str(f) == 'x^2+sin(x)'
+
+def test_write_matches_str():
+    f = Expr('+'.join(['x^%d*sin(x)' % i for i in range(200)])).d('x')
+    file = io.StringIO()
+    f.write(file)
+    assert file.getvalue() == str(f)
+
+def test_write_in_chunks():
+    f = Expr('+'.join(['x^%d' % i for i in range(100)]))
+    file = Recorder()
+    f.write(file, chunk_size=10)
+    assert len(file.chunks) > 1
+    assert ''.join(file.chunks) == str(f)
+
+def test_deep_output():
+    f = Expr('+'.join(['x'] * 50000))
+    file = io.StringIO()
+    f.write(file, gnuplot_mode=True)
+    assert len(file.getvalue()) == 2 * 50000 - 1
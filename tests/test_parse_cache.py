@@ -0,0 +1,45 @@
+'''
+Tests for the parse cache.
+'''
+
+import pytest
+
+from parser import ParseCache, IllegalExpr
+
+def test_hits_and_misses():
+    cache = ParseCache(maxsize=8)
+    tree = cache.parse('x^2+1')
+    assert cache.parse('x^2+1') is tree
+    info = cache.info()
+    assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
+
+def test_least_recently_used_evicted():
+    cache = ParseCache(maxsize=2)
+    cache.parse('x')
+    cache.parse('y')
+    cache.parse('x')
+    cache.parse('z')
+    assert set(cache.trees) == {'x', 'z'}
+
+def test_resize_and_clear():
+    cache = ParseCache(maxsize=4)
+    for expr in ('a', 'b', 'c', 'd'):
+        cache.parse(expr)
+    cache.resize(1)
+    assert list(cache.trees) == ['d']
+    cache.clear()
+    assert cache.info() == (0, 0, 1, 0)
+
+def test_disabled():
+    cache = ParseCache(maxsize=0)
+    cache.parse('x')
+    cache.parse('x')
+    assert cache.info() == (0, 2, 0, 0)
+
+def test_errors_not_cached():
+    cache = ParseCache()
+    for i in range(2):
+        with pytest.raises(IllegalExpr):
+            cache.parse('x+')
+    assert cache.info().misses == 2
+    assert not cache.trees
@@ -0,0 +1,60 @@
+'''
+Tests for the parser: both engines must build the same trees.
+'''
+
+import pytest
+
+from parser import Parser, ParseTree, IllegalExpr
+
+precedence, pattern = Parser('precedence'), Parser('pattern')
+
+def grouped(tree):
+    '''tree, written out with every operation parenthesized'''
+    if not isinstance(tree, ParseTree):
+        return str(tree.value)
+    operands = [grouped(child) for child in tree.children if child is not None]
+    if len(operands) == 1:
+        return '%s(%s)' % (tree.root.value, operands[0])
+    return '(%s %s %s)' % (operands[0], tree.root.value, operands[1])
+
+@pytest.mark.parametrize('expr, expected', [
+    ('x+y*z', '(x + (y * z))'),
+    ('a-b-c', '((a - b) - c)'),
+    ('x/y/z', '((x / y) / z)'),
+    ('2^3^2', '(2 ^ (3 ^ 2))'),
+    ('-x*y', '-((x * y))'),
+    ('-x+y', '(-(x) + y)'),
+    ('-x^2', '-((x ^ 2))'),
+    ('sin(x)^2', '(sin(x) ^ 2)'),
+    ('(x+y)*z', '((x + y) * z)'),
+    # a negation straight after an operator binds only its operand
+    ('x^-2*y', '((x ^ -(2)) * y)'),
+    ('x/-2*y', '((x / -(2)) * y)'),
+    ('2^-x*y', '((2 ^ -(x)) * y)'),
+    ('x*-y*z', '((x * -(y)) * z)'),
+    ('x^-sin(x)*y', '((x ^ -(sin(x))) * y)'),
+    ('x*-y^2', '(x * -((y ^ 2)))'),
+    ('x^-y^z', '(x ^ -((y ^ z)))'),
+    ('x--y', '(x - -(y))'),
+    ('x+-y*z', '(x + -((y * z)))'),
+    ('x^--2*y', '((x ^ -(-(2))) * y)'),
+])
+def test_engines_agree(expr, expected):
+    tree = precedence.parse(expr)
+    assert grouped(tree) == expected
+    # trees are interned, so equal trees are the same tree
+    assert pattern.parse(expr) is tree
+
+@pytest.mark.parametrize('expr', ['x+', '(x', 'x)', '*x', '()'])
+def test_illegal(expr):
+    with pytest.raises(IllegalExpr):
+        precedence.parse(expr)
+
+def test_deep_nesting():
+    depth = 5000
+    tree = precedence.parse('(' * depth + 'x' + ')' * depth + '+1')
+    assert grouped(tree) == '(x + 1)'
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        Parser('recursive')
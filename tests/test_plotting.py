@@ -0,0 +1,114 @@
+'''
+Tests for plotting, against a stand-in for gnuplot that logs what it is sent.
+'''
+
+import stat
+import sys
+
+import pytest
+
+from cas import Expr
+import plotting
+from plotting import GnuplotSession, PlottingError
+
+## The stand-in: it logs each command, reads the points sent after a plot
+## command, and answers print commands, as gnuplot does, once it has logged
+## everything before them
+fake_gnuplot = '''#!%s
+import re, struct, sys
+log = open(%r, 'a')
+while True:
+    line = sys.stdin.buffer.readline()
+    if not line:
+        break
+    line = line.decode().rstrip('\\n')
+    log.write(line + '\\n')
+    for n in re.findall(r"'-' binary record=\\((\\d+)\\)", line):
+        data = sys.stdin.buffer.read(16 * int(n))
+        xs = struct.unpack('<%%dd' %% (2 * int(n)), data)[::2]
+        log.write('DATA %%d %%r %%r\\n' %% (int(n), xs[0], xs[-1]))
+    log.flush()
+    match = re.match(r'print "(.*)"$', line)
+    if match:
+        sys.stdout.write(match.group(1) + '\\n')
+        sys.stdout.flush()
+    if line == 'quit':
+        break
+'''
+
+@pytest.fixture
+def gnuplot(tmp_path):
+    '''A session with the stand-in, and a function reading its log'''
+    log = tmp_path / 'gnuplot.log'
+    log.write_text('')
+    command = tmp_path / 'gnuplot'
+    command.write_text(fake_gnuplot % (sys.executable, str(log)))
+    command.chmod(command.stat().st_mode | stat.S_IEXEC)
+    session = GnuplotSession(command=str(command))
+    yield session, lambda: log.read_text().splitlines()
+    session.close()
+
+def test_formula(gnuplot):
+    session, log = gnuplot
+    session.plot([Expr('x^2'), Expr('sin(x)')], title='Two', range=((0, 1),))
+    session.wait()
+    lines = log()
+    assert 'set title "Two"' in lines
+    assert 'set xrange [0:1]' in lines
+    assert 'plot x**2 title "x^2", sin(x) title "sin(x)"' in lines
+
+def test_constants_not_integer_division(gnuplot):
+    session, log = gnuplot
+    session.plot([Expr('exp(x)').taylor('x', 0, 3), Expr('x^(1/2)')])
+    session.wait()
+    plot, = [line for line in log() if line.startswith('plot')]
+    assert plot.startswith('plot 1.0+x*(1.0+x*(1.0/2+x*(1.0/6))) title ')
+    assert ', x**(1.0/2.0) title ' in plot
+
+def test_sampled(gnuplot):
+    session, log = gnuplot
+    # ln isn't a gnuplot function under that name, so this is sampled
+    session.plot(Expr('ln(abs(x))+x'), range=((1, 3),))
+    session.wait()
+    plot, = [line for line in log() if line.startswith('plot')]
+    assert "'-' binary record=" in plot
+    data, = [line.split() for line in log() if line.startswith('DATA')]
+    assert int(data[1]) >= 50
+    assert (float(data[2]), float(data[3])) == (1.0, 3.0)
+
+def test_output(gnuplot, tmp_path):
+    session, log = gnuplot
+    output = str(tmp_path / 'f.svg')
+    session.plot(Expr('x'), output=output)
+    session.wait()
+    lines = log()
+    assert 'set terminal svg' in lines
+    assert lines[lines.index('set terminal svg') + 1] == \
+        'set output "%s"' % output
+    assert 'unset output' in lines
+    with pytest.raises(PlottingError):
+        session.plot(Expr('x'), output='f.xyz')
+
+def test_wait_repeatedly(gnuplot):
+    session, log = gnuplot
+    for i in range(3):
+        session.wait()
+    # each wait returns once its marker is printed: what follows it may not
+    # have been read yet
+    assert [line for line in log() if line.startswith('print')] == \
+        ['print "CAS sync %d"' % i for i in (1, 2, 3)]
+
+def test_closed(gnuplot):
+    session, log = gnuplot
+    session.close()
+    assert not session.alive()
+    assert log()[-1] == 'quit'
+    with pytest.raises(PlottingError):
+        session.plot(Expr('x'))
+
+def test_no_gnuplot(tmp_path):
+    with pytest.raises(PlottingError):
+        GnuplotSession(command=str(tmp_path / 'missing'))
+
+def test_quoted():
+    assert plotting.quoted('say "hi"\\') == '"say \\"hi\\"\\\\"'
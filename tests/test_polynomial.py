@@ -0,0 +1,54 @@
+'''
+Tests for sparse Polynomials.
+'''
+
+from fractions import Fraction
+
+import pytest
+
+from cas import Expr
+import polynomial
+from polynomial import Polynomial, NotPolynomial
+from parser import Parser
+
+parse = Parser().parse
+
+def test_from_tree():
+    p = polynomial.from_tree(parse('(x+y)^2-2*x*y+x/2'))
+    assert p == Polynomial(('x', 'y'), {(2, 0):1, (0, 2):1,
+                                        (1, 0):Fraction(1, 2)})
+
+def test_arithmetic():
+    x = polynomial.variable(('x',), 'x')
+    one = polynomial.constant(('x',), 1)
+    assert (x + one) * (x - one) == x**2 - one
+    assert ((x + one)**5).degree() == 5
+    assert (x - x).degree() == -1
+
+def test_different_variables():
+    with pytest.raises(ValueError):
+        polynomial.variable(('x',), 'x') + polynomial.variable(('y',), 'y')
+
+def test_diff_and_integrate():
+    p = polynomial.from_tree(parse('3*x^2*y+y'))
+    assert p.diff('x') == polynomial.from_tree(parse('6*x*y'), ('x', 'y'))
+    assert p.integrate('x').diff('x') == p
+    assert p.integrate('z').vars == ('x', 'y', 'z')
+
+def test_to_tree():
+    p = polynomial.from_tree(parse('x^3/3-2*x+1'))
+    assert str(Expr(expr_tree=p.to_tree())) == 'x^3/3-2*x+1'
+
+def test_not_polynomial():
+    with pytest.raises(NotPolynomial):
+        polynomial.from_tree(parse('sin(x)'))
+
+def test_compact():
+    # (x+1)^100 has far more terms expanded than nodes as a tree
+    with pytest.raises(NotPolynomial):
+        polynomial.from_tree(parse('(x+1)^100'), compact=True)
+    assert polynomial.from_tree(parse('(x+1)^2'), compact=True).degree() == 2
+
+def test_derivative_exact():
+    assert str(Expr('(x+1)^100').d('x')) == '100*(x+1)^99'
+    assert str(Expr('x^3/3+x/2').integrate('x')) == 'x^4/12+x^2/4'
@@ -0,0 +1,77 @@
+'''
+Tests for printing: printed output parses back to the same tree.
+'''
+
+from fractions import Fraction
+
+import pytest
+
+from cas import Expr
+from parser import Parser, ParseTree, Number, Operator, MinusOp
+from traversal import postorder
+
+parse = Parser().parse
+
+corpus = ['x+(y-z)', 'x*(y/z)', 'x-(y+z)', 'x/(y*z)', 'x-y-z', 'x/y/z',
+          '(x^y)^z', 'x^y^z', '-(x+y)', '-x*y', '(-x)*y', 'x*(-y)', 'x^(-2)',
+          'x-(-y)', '2^-x*y', 'sin(x)^2/(1-cos(x))', 'exp(-x^2)*(x+1)^3',
+          '-2.5*x', 'x*y*z+x*(y*z)']
+
+def parsed_form(tree):
+    '''
+    tree, with its negative numbers and fractions written as the parser would
+    read them when printed: as negations and quotients
+    '''
+    def rewrite(node):
+        if isinstance(node, ParseTree):
+            return ParseTree([node.root] + [converted[child]
+                                            for child in node.children
+                                            if child is not None])
+        elif isinstance(node, Number) and node.value < 0:
+            return ParseTree([MinusOp('-'), rewrite(Number(-node.value))])
+        elif isinstance(node, Number) and type(node.value) == Fraction:
+            return ParseTree([Operator('/'), Number(node.value.numerator),
+                              Number(node.value.denominator)])
+        return node
+
+    converted = {}
+    return postorder(tree, rewrite, memo=converted)
+
+@pytest.mark.parametrize('expr', corpus)
+def test_round_trip(expr):
+    f = Expr(expr)
+    for e in (f, f.d('x'), f.d('x').d('y'), f.d('x').d('x').d('x')):
+        assert parse(str(e)) is parsed_form(e.tree_repr)
+
+@pytest.mark.parametrize('expr, printed', [
+    ('x+(y-z)', 'x+(y-z)'),
+    ('x*(y/z)', 'x*(y/z)'),
+    ('(x+y)+z', 'x+y+z'),
+    ('x^(y^z)', 'x^y^z'),
+    ('(x^y)^z', '(x^y)^z'),
+    ('x-(-y)', 'x-(-y)'),
+    ('-(x*y)', '-x*y'),
+    ('(-x)*y', '(-x)*y'),
+])
+def test_parentheses(expr, printed):
+    assert str(Expr(expr)) == printed
+
+def test_fractions():
+    assert str(Expr('x/2').d('x')) == '1/2'
+    assert str(Expr('x*y/3').d('x')) == 'y/3'
+
+@pytest.mark.parametrize('expr, printed', [
+    ('x^2+2^x', 'x**2+2.0**x'),
+    # gnuplot divides integers as C does, but raises negative numbers only to
+    # whole powers written as integers
+    ('x^(1/2)', 'x**(1.0/2.0)'),
+    ('x^-1+x^(-2)', 'x**(-1)+x**(-2)'),
+    ('3*x-2.5', '3.0*x-2.5'),
+])
+def test_gnuplot_mode(expr, printed):
+    assert Expr(expr).__str__(gnuplot_mode=True) == printed
+
+def test_gnuplot_mode_fractions():
+    f = Expr('exp(x)').taylor('x', 0, 3)
+    assert f.__str__(gnuplot_mode=True) == '1.0+x*(1.0+x*(1.0/2+x*(1.0/6)))'
+    assert str(f) == '1+x*(1+x*(1/2+x*(1/6)))'
@@ -0,0 +1,111 @@
+'''
+Tests for definite integrals.
+'''
+
+import math
+
+import pytest
+
+from cas import Expr
+
+numpy = pytest.importorskip('numpy')
+
+import quadrature
+
+@pytest.mark.parametrize('expr, a, b, expected', [
+    ('sin(x)', 0, math.pi, 2),
+    ('x^2', 1, 0, -1 / 3),
+    ('x^10', 0, 10, 1e11 / 11),
+    ('x^(-1/2)', 0, 1, 2),
+    ('x', 2, 2, 0)])
+def test_from_antiderivative(expr, a, b, expected):
+    value, error = Expr(expr).integrate('x', a, b, with_error=True)
+    assert value == pytest.approx(expected, rel=1e-12)
+    assert error == 0
+
+@pytest.mark.parametrize('expr, a, b, expected', [
+    ('exp(-x^2)', 0, 1, 0.746824132812427),
+    ('sin(x^2)', 0, 1, 0.310268301723381),
+    ('x^x', 0.5, 2, 2.461261882789122),
+    ('ln(x)', 0, 1, -1)])
+def test_numeric(expr, a, b, expected):
+    value, error = Expr(expr).integrate('x', a, b, with_error=True)
+    assert value == pytest.approx(expected, rel=1e-10)
+    assert 0 < error < 1e-10
+
+@pytest.mark.parametrize('expr, a, b', [('x^-2', -1, 1), ('tan(x)', 0, 3),
+                                        ('1/x', -1, 2)])
+def test_divergent(expr, a, b):
+    # the antiderivative gives a finite number, but the integral diverges
+    value, error = Expr(expr).integrate('x', a, b, with_error=True)
+    assert not math.isfinite(value) or not error < 1
+
+def test_gauss_kronrod():
+    value, error = quadrature.gauss_kronrod(lambda x, owners: numpy.cos(x),
+                                            0, 1)
+    assert value == pytest.approx(math.sin(1), rel=1e-14)
+    assert error < 1e-10
+
+def test_array_bounds():
+    b = numpy.linspace(0, 2, 5)
+    values, errors = Expr('y*x').integrate('x', 0, b, with_error=True, y=3)
+    assert numpy.allclose(values, 1.5 * b**2)
+    assert not errors.any()
+    values = Expr('exp(-y*x^2)').integrate('x', 0, b,
+                                           y=numpy.array([[1], [2]]))
+    assert values.shape == (2, 5)
+    assert values[0, -1] == pytest.approx(0.882081390762422)
+    assert values[1, -1] == pytest.approx(0.626617166919208)
+
+def test_variables_named_like_bounds():
+    assert Expr('a*x').integrate('x', 0, 1, a=2) == pytest.approx(1)
+    assert Expr('a*b*x').integrate('x', 1, 3, a=2, b=3) == pytest.approx(24)
+
+def test_one_bound():
+    with pytest.raises(ValueError):
+        Expr('x').integrate('x', 0)
+
+def test_symbolic_failure(monkeypatch):
+    def fail(expr, var):
+        raise ZeroDivisionError
+    monkeypatch.setattr(quadrature.integration, 'integrate', fail)
+    value, error = Expr('cos(x)*x').integrate('x', 0, 1, with_error=True)
+    assert value == pytest.approx(math.sin(1) + math.cos(1) - 1)
+    assert error > 0
+
+def test_integrator_bug_raised(monkeypatch):
+    def fail(expr, var):
+        raise TypeError
+    monkeypatch.setattr(quadrature.integration, 'integrate', fail)
+    with pytest.raises(TypeError):
+        Expr('cos(x)*x^2').integrate('x', 0, 1)
+
+def test_bounded_integrand_not_integrated_numerically(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('integrated numerically')
+    monkeypatch.setattr(quadrature, 'gauss_kronrod', fail)
+    assert Expr('tan(x)+x^3').integrate('x', 0, 1, with_error=True) == \
+        pytest.approx((0.6156264703860141 + 0.25, 0))
+    values = Expr('sin(x)*y').integrate('x', 0, numpy.array([1, 2]), y=2)
+    assert numpy.allclose(values, 2 - 2 * numpy.cos([1, 2]))
+
+@pytest.mark.parametrize('expr, a, b, expected', [
+    ('tan(x)', 0, 1, True), ('tan(x)', 0, 3, False),
+    ('1/x', 1, 2, True), ('1/x', -1, 2, False),
+    ('x^-2', -1, 1, False), ('x^-2', 1, 2, True),
+    ('x^3-x', -2, 2, True), ('x^(1/2)', 0, 4, True),
+    ('x^(-1/2)', 0, 1, False), ('ln(x)', 0, 1, False),
+    ('sin(1/x)', -1, 1, True), ('exp(x)/(2+cos(x))', -9, 9, True),
+    ('1/sin(x)', 1, 3, True), ('1/sin(x)', 3, 4, False)])
+def test_finite(expr, a, b, expected):
+    t = quadrature.tape.from_tree(Expr(expr).tree_repr)
+    assert quadrature.finite(t, 'x', numpy.float64(a), numpy.float64(b),
+                             {}) == expected
+
+def test_finite_array():
+    t = quadrature.tape.from_tree(Expr('tan(x)*y').tree_repr)
+    b = numpy.array([1.0, 3.0, 1.5])
+    assert list(quadrature.finite(t, 'x', numpy.zeros(3), b,
+                                  {'y':numpy.ones(3)})) == [True, False, True]
+    assert quadrature.finite(t, 'x', numpy.zeros(3), b / 2,
+                             {'y':numpy.ones(3)}).all()
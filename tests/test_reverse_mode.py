@@ -0,0 +1,65 @@
+'''
+Tests for gradients found in reverse mode.
+'''
+
+import pytest
+
+from cas import Expr
+from evaluation import EvaluationError
+
+corpus = ['x^2*sin(y)+exp(x)/(1+y^2)', 'sin(x)*sin(x)-cos(x*y)',
+          'tan(x)^3-x/y', '-(x-y)^2+x*y^3', 'cos(x)*(x-y)^2', 'x/(x+y)^3',
+          'exp(sin(x*y*z))-z/x']
+
+@pytest.mark.parametrize('expr', corpus)
+def test_matches_symbolic(expr):
+    f = Expr(expr)
+    vars = ['x', 'y', 'z']
+    point = dict(x=0.7, y=1.3, z=-0.4)
+    value, gradient = f.eval_with_gradient(vars, **point)
+    assert value == pytest.approx(f.compile(*vars)(0.7, 1.3, -0.4))
+    assert gradient == pytest.approx([d.compile(*vars)(0.7, 1.3, -0.4)
+                                      for d in f.gradient(vars)])
+
+@pytest.mark.parametrize('expr', corpus + ['2^y*x^y'])
+def test_matches_forward_mode(expr):
+    f = Expr(expr)
+    point = dict(x=0.7, y=1.3, z=-0.4)
+    value, gradient = f.eval_with_gradient(['y', 'x'], **point)
+    assert gradient == pytest.approx(
+        [f.eval_with_derivative(var, **point)[1] for var in ['y', 'x']])
+
+def test_variable_exponent():
+    # d(x^y)/dy = x^y*ln(x)
+    value, (dx, dy) = Expr('x^y').eval_with_gradient(['x', 'y'], x=2, y=3)
+    assert (value, dx) == pytest.approx((8, 12))
+    assert dy == pytest.approx(8 * 0.6931471805599453)
+
+def test_absent_variable():
+    value, gradient = Expr('x*y').eval_with_gradient(['x', 'z', 'y'], x=2,
+                                                       y=5)
+    assert (value, gradient) == (10, [5, 0, 2])
+
+def test_shared_subexpression():
+    # sin(x) is on the tape once, and its adjoint collects both uses
+    value, (dx,) = Expr('sin(x)*sin(x)+sin(x)').eval_with_gradient(['x'],
+                                                                   x=0.5)
+    assert dx == pytest.approx(0.8775825618903728 * (2 * 0.479425538604203 + 1))
+
+def test_missing_variable():
+    with pytest.raises(EvaluationError):
+        Expr('x+y').eval_with_gradient(['x'], x=1)
+
+@pytest.mark.parametrize('expr', corpus)
+def test_array(expr):
+    numpy = pytest.importorskip('numpy')
+    f = Expr(expr)
+    x = numpy.linspace(0.5, 2, 9)
+    y = numpy.linspace(1, 3, 3)[:, None]
+    values, gradient = f.eval_with_gradient_array(['x', 'y'], x=x, y=y, z=0.3)
+    assert values.shape == (3, 9)
+    assert numpy.allclose(values, f.evaluate_array(x=x, y=y, z=0.3))
+    for derivative, expected in zip(gradient, f.gradient(['x', 'y'])):
+        assert derivative.shape == (3, 9)
+        assert numpy.allclose(derivative, expected.evaluate_array(x=x, y=y,
+                                                                  z=0.3))
@@ -0,0 +1,56 @@
+'''
+Tests for numeric sampling.
+'''
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from cas import Expr
+import sampling
+
+def evaluated(f, x):
+    return sampling.evaluate(f.to_tape(), {'x':x})
+
+def test_numeric_derivative():
+    # CAS has no rule for ln, so its derivative is left as d[ln, x]
+    f = Expr('ln(x)*x').d('x')
+    x = numpy.linspace(0.5, 4, 9)
+    assert numpy.allclose(evaluated(f, x), 1 / x * x + numpy.log(x),
+                          rtol=1e-8)
+
+def test_second_numeric_derivative():
+    f = Expr('ln(x)').d('x').d('x')
+    x = numpy.linspace(0.5, 4, 9)
+    assert numpy.allclose(evaluated(f, x), -1 / x**2, rtol=1e-4)
+
+def test_numeric_integral():
+    # the integral of exp(-x^2), from 0 to x, is sqrt(pi)/2 * erf(x)
+    f = Expr('exp(-x^2)').integrate('x')
+    x = numpy.array([0.0, 0.5, 1.0, 2.0])
+    erf = numpy.array([0.0, 0.5204998778130465, 0.8427007929497149,
+                       0.9953222650189527])
+    assert numpy.allclose(evaluated(f, x), numpy.sqrt(numpy.pi) / 2 * erf)
+
+def test_undefined_points_nan():
+    assert numpy.isnan(evaluated(Expr('ln(x)'), numpy.array([-1.0]))).all()
+
+def test_adaptive():
+    # a sigmoid gets its points where it turns, not on its flat stretches
+    xs, ys = sampling.sample(lambda x: numpy.tanh(20 * x), -10, 10)
+    assert len(xs) > 50
+    assert numpy.all(numpy.diff(xs) > 0)
+    assert numpy.sum(numpy.abs(xs) < 1) > len(xs) / 3
+    straight, values = sampling.sample(lambda x: 2 * x + 1, -10, 10)
+    assert len(straight) == 50
+
+def test_max_points():
+    xs, ys = sampling.sample(lambda x: numpy.sin(1 / x), -1, 1,
+                             max_points=300)
+    assert len(xs) <= 300
+
+def test_edges():
+    # the points close in on where the logarithm stops being defined
+    xs, ys = sampling.sample(lambda x: numpy.log(x), -1, 1)
+    defined = xs[numpy.isfinite(ys)]
+    assert defined.min() < 0.01
@@ -0,0 +1,62 @@
+'''
+Tests for the binary and JSON formats.
+'''
+
+import pytest
+
+from cas import Expr, save, load
+from parser import Parser, ParseTree, Operator, Name, Number
+import serialization
+from serialization import SerializationError
+
+parse = Parser().parse
+
+corpus = ['x^2*sin(y)+exp(x)/(1+y^2)', '-2.5*x-3', 'x', '7',
+          'sin(x)*sin(x)-cos(x)']
+trees = [parse(expr) for expr in corpus] + \
+    [Expr('x^3/3').integrate('x').tree_repr,
+     Expr('x^x').integrate('x').tree_repr]
+
+def test_round_trip():
+    assert serialization.loads(serialization.dumps(trees)) == trees
+
+def test_named_round_trip():
+    named = {'f%d' % i:tree for i, tree in enumerate(trees)}
+    assert serialization.loads(serialization.dumps(named)) == named
+
+def test_json_round_trip():
+    assert serialization.loads_json(serialization.dumps_json(trees)) == trees
+
+def test_file(tmp_path):
+    filename = str(tmp_path / 'library.cas')
+    save({'f':Expr('x^2'), 'g':Expr('sin(x)')}, filename)
+    with load(filename) as library:
+        assert len(library) == 2
+        assert str(library['g'].d('x')) == 'cos(x)'
+
+def test_lazy():
+    data = bytearray(serialization.dumps(trees[:2]))
+    # damage the second expression only: the first still loads
+    data[-1] ^= 0xff
+    library = serialization.Library(bytes(data))
+    assert library[0] is trees[0]
+    with pytest.raises(SerializationError):
+        library[1]
+
+@pytest.mark.parametrize('data', [b'', b'CAS', b'XYZ\0' + bytes(8),
+                                  b'CAS\0\x09\0\0\0\0\0\0\0'])
+def test_not_a_library(data):
+    with pytest.raises(SerializationError):
+        serialization.loads(data)
+
+def test_corrupt():
+    data = serialization.dumps(trees[:1])
+    with pytest.raises(SerializationError):
+        serialization.loads(data[:-3])
+
+def test_huge_integer():
+    tree = ParseTree([Operator('*'), Name('x'), Number(10**5000)])
+    with pytest.raises(SerializationError):
+        serialization.dumps([tree])
+    with pytest.raises(SerializationError):
+        serialization.dumps_json([tree])
@@ -0,0 +1,55 @@
+'''
+Tests for the rewrite rules, and the size of the derivatives they simplify.
+'''
+
+import pytest
+
+from cas import Expr
+from differentiation import derive
+from simplification import reduce
+from traversal import postorder, subtrees
+
+def simplified(source):
+    return str(Expr(expr_tree=reduce(Expr(source).tree_repr)))
+
+def count_nodes(expr):
+    sizes = {}
+    return postorder(expr,
+                     lambda expr: 1 + sum([sizes[child]
+                                           for child in subtrees(expr)]),
+                     memo=sizes)
+
+@pytest.mark.parametrize('source, expected', [
+    ('2*x+3*x', '5*x'),
+    ('(y+x)+x', 'y+2*x'),
+    ('x+(y+x)', '2*x+y'),
+    ('x-(y-x)', '2*x-y'),
+    ('x+1+(2-x)', '3'),
+    ('(a+b)-(b+a)', '0'),
+    ('x*(y*x)', 'x^2*y'),
+    ('(y*x)*x', 'y*x^2'),
+    ('x*(y*x^2)*x', 'x^4*y'),
+    ('2*x*3*x', '6*x^2'),
+    ('x*y', 'x*y')])
+def test_like_terms_and_factors(source, expected):
+    assert simplified(source) == expected
+
+def test_long_sum_left_alone():
+    # past max_operands terms, only neighbouring terms are combined
+    source = '+'.join(['sin(x+%d)' % k for k in range(1, 41)])
+    assert simplified(source) == source
+    assert simplified(source + '+sin(x+40)') == source[:-10] + '+2*sin(x+40)'
+
+def test_derivatives_shrink():
+    f = Expr('sin(x)*exp(x)')
+    assert str(f.d('x', 4)) == '-4*(sin(x)*exp(x))'
+    assert count_nodes(f.d('x', 4).tree_repr) == 8
+
+@pytest.mark.parametrize('source, most', [('exp(x)/(1+x^2)', 150),
+                                          ('x/(x+1)/(x+2)', 139),
+                                          ('tan(x)*cos(x)', 83)])
+def test_third_derivative_size(source, most):
+    expr = Expr(source).tree_repr
+    for order in range(3):
+        expr = reduce(derive(expr, 'x', {}))
+    assert count_nodes(expr) <= most
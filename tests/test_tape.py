@@ -0,0 +1,54 @@
+'''
+Tests for tapes.
+'''
+
+import pytest
+
+from cas import Expr
+from evaluation import EvaluationError
+
+corpus = ['x^2*sin(y)+exp(x)/(1+y^2)', 'sin(x)*sin(x)-cos(x*y)',
+          'tan(x)^3-x/y', '-(x-y)^2+2^y*x']
+
+@pytest.mark.parametrize('expr', corpus)
+def test_tree_round_trip(expr):
+    f = Expr(expr)
+    t = f.to_tape()
+    assert t.to_tree() is f.tree_repr
+    assert str(t) == str(f)
+
+def test_shared_subexpressions_stored_once():
+    t = Expr('sin(x)*sin(x)+sin(x)').to_tape()
+    assert len(t) == 4
+
+@pytest.mark.parametrize('expr', corpus)
+def test_evaluate(expr):
+    f = Expr(expr)
+    assert f.to_tape().evaluate(x=0.7, y=1.3) == \
+        pytest.approx(f.compile('x', 'y')(0.7, 1.3))
+
+@pytest.mark.parametrize('expr', corpus)
+def test_diff(expr):
+    f = Expr(expr)
+    d = f.to_tape().diff('x')
+    assert d.evaluate(x=0.7, y=1.3) == \
+        pytest.approx(f.d('x').compile('x', 'y')(0.7, 1.3))
+
+def test_diff_constant():
+    assert str(Expr('y^2').to_tape().diff('x')) == '0'
+
+def test_compacted():
+    t = Expr('x+sin(y)').to_tape()
+    inner = t.compacted(t.left[-1])
+    assert str(inner) == 'x'
+    assert t.compacted().nbytes() == t.nbytes()
+
+def test_evaluate_array():
+    numpy = pytest.importorskip('numpy')
+    x = numpy.linspace(0, 1, 7)
+    assert numpy.allclose(Expr('x^2+1').to_tape().evaluate_array(x=x),
+                          x**2 + 1)
+
+def test_missing_variable():
+    with pytest.raises(EvaluationError):
+        Expr('x+y').to_tape().evaluate(x=1)
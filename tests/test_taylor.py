@@ -0,0 +1,55 @@
+'''
+Tests for higher derivatives, and Taylor polynomials.
+'''
+
+import math
+
+import pytest
+
+from cas import Expr
+
+def test_repeated_derivative():
+    f = Expr('sin(x)*y+x^5')
+    assert f.d('x', 3) == f.d('x').d('x').d('x')
+    assert str(f.d('x', 4)) == '120*x+sin(x)*y'
+
+def test_zeroth_derivative():
+    f = Expr('x^2+y')
+    assert f.d('x', 0) == f
+
+def test_chain_kept():
+    f = Expr('exp(2*x)')
+    second = f.d('x', 2)
+    # asking for more carries on from those already found
+    assert f.derivative_chains['x'][2] is second.tree_repr
+    assert second.d('x', 2) == f.d('x', 4)
+    assert f.d('x', 4).compile('x')(0.3) == pytest.approx(16 * math.exp(0.6))
+
+def test_negative_order():
+    with pytest.raises(ValueError):
+        Expr('x').d('x', -1)
+
+def test_horner_form():
+    assert str(Expr('exp(x)').taylor('x', 0, 3)) == '1+x*(1+x*(1/2+x*(1/6)))'
+    assert str(Expr('x^2').taylor('x', 1, 4)) == '1+(x-1)*(2+(x-1)*1)'
+
+def test_zero_coefficients_dropped():
+    assert str(Expr('sin(x)').taylor('x', 0, 5)) == \
+        'x*(1+x*(x*(-1/6+x*(x*(1/120)))))'
+    assert Expr('y').taylor('x', 0, 3) == Expr('y')
+
+@pytest.mark.parametrize('expr, point', [('exp(x)', 0), ('sin(x)', 0.5),
+                                         ('cos(x)*exp(x)', -0.3),
+                                         ('1/(1+x)', 0)])
+def test_accuracy(expr, point):
+    f = Expr(expr)
+    p = f.taylor('x', point, 8)
+    for x in (point - 0.05, point, point + 0.05):
+        assert p.compile('x')(x) == pytest.approx(f.compile('x')(x),
+                                                  rel=1e-9, abs=1e-12)
+
+def test_symbolic_point():
+    p = Expr('exp(x)').taylor('x', Expr('a'), 2)
+    assert str(p) == 'exp(a)+(x-a)*(exp(a)+(x-a)*(exp(a)/2))'
+    assert p.compile('x', 'a')(1.1, 1) == \
+        pytest.approx(math.e * (1 + 0.1 + 0.1**2 / 2))
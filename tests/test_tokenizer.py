@@ -0,0 +1,34 @@
+'''
+Tests for the scanner.
+'''
+
+import pytest
+
+from parser import (scan, IllegalToken, Number, Name, Operator, MinusOp,
+                    OpenParen, CloseParen)
+
+def test_token_classes():
+    tokens = list(scan('sin(x1)^2.5-3*y/z+10'))
+    assert [type(token) for token in tokens] == \
+        [Name, OpenParen, Name, CloseParen, Operator, Number, MinusOp, Number,
+         Operator, Name, Operator, Name, Operator, Number]
+    assert [token.value for token in tokens] == \
+        ['sin', '(', 'x1', ')', '^', 2.5, '-', 3, '*', 'y', '/', 'z', '+', 10]
+
+def test_lazy():
+    tokens = scan('x+$')
+    assert next(tokens).value == 'x'
+    assert next(tokens).value == '+'
+    with pytest.raises(IllegalToken):
+        next(tokens)
+
+@pytest.mark.parametrize('expr, column', [('$', 1), ('x+y z', 4),
+                                          ('x+\ny', 3)])
+def test_illegal_token_column(expr, column):
+    with pytest.raises(IllegalToken) as error:
+        list(scan(expr))
+    assert error.value.column == column
+
+def test_long_input():
+    # the scanner doesn't recurse, so length is no limit
+    assert len(list(scan('x+' * 50000 + 'x'))) == 100001
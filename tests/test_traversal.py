@@ -0,0 +1,54 @@
+'''
+Tests for the explicit-stack traversal, and the passes built on it.
+'''
+
+import pytest
+
+from cas import Expr
+from parser import Parser
+from simplification import reduce
+from traversal import postorder
+
+depth = 10000
+
+def test_shared_subtrees_visited_once():
+    tree = Parser().parse('sin(x)*sin(x)+sin(x)')
+    visited = []
+    postorder(tree, visited.append)
+    assert len(visited) == len(set(visited)) == 4
+
+def test_children_first():
+    tree = Parser().parse('(x+1)*y')
+    order = []
+
+    def visit(node):
+        order.append(node)
+        return node
+
+    postorder(tree, visit)
+    assert order.index(tree.left) < order.index(tree)
+    assert order.index(tree.left.left) < order.index(tree.left)
+
+def test_deep_sum():
+    f = Expr('+'.join(['x^%d' % (i % 7) for i in range(depth)]))
+    assert f.d('x').tree_repr is not None
+    assert f.integrate('x').tree_repr is not None
+    assert str(f).count('+') == depth - 1
+
+def test_deep_nesting():
+    source = 'x'
+    for i in range(depth // 4):
+        source = 'sin(%s+1)' % source
+    f = Expr(source)
+    reduce(f.d('x').tree_repr)
+    assert str(f) == source
+
+@pytest.mark.parametrize('expr, expected', [
+    ('x^-1', 'ln(abs(x))'),
+    ('x^(-1)', 'ln(abs(x))'),
+    ('2*x^-1', '2*ln(abs(x))'),
+    ('x^(1-2)', 'ln(abs(x))'),
+    ('x^x', 'integrate[x^x, x]'),
+])
+def test_integrate_powers(expr, expected):
+    assert str(Expr(expr).integrate('x')) == expected
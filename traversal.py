@@ -0,0 +1,71 @@
+'''
+Tree traversal for CAS.
+
+Parse trees can be far deeper than Python lets a recursive function go -- a sum
+of ten thousand terms is a tree ten thousand levels deep -- so the passes over
+them (differentiation, integration, simplification, printing, and so on) are
+built on postorder, which keeps a stack of its own instead.
+'''
+
+from parser import Name, ParseTree
+
+def subtrees(expr):
+    '''The children of expr: an operator's operands, or a function's argument'''
+    if isinstance(expr, ParseTree):
+        return [child for child in expr.children if child is not None]
+    return ()
+
+def postorder(expr, visit, children=subtrees, memo=None):
+    '''
+    Visit the nodes of expr, children first, and return the result of visiting
+    expr. visit is called on each node once all of its children (as given by
+    children) have been visited; it finds their results in memo, which maps
+    each node visited to its result.
+
+    Trees are interned, so a subtree that occurs many times is visited once:
+    nodes already in memo are skipped, along with their children. memo may be
+    passed in, to share results between several traversals.
+    '''
+    if memo is None:
+        memo = {}
+    if expr in memo:
+        return memo[expr]
+    # each entry is a node, with its children once they have been pushed
+    stack = [(expr, None)]
+    while stack:
+        node, nodes_children = stack.pop()
+        if node in memo:
+            continue
+        if nodes_children is None:
+            nodes_children = children(node)
+            stack.append((node, nodes_children))
+            for child in reversed(nodes_children):
+                if child not in memo:
+                    stack.append((child, None))
+        else:
+            memo[node] = visit(node)
+    return memo[expr]
+
+def substitute(expr, var, value):
+    '''
+    expr, with value (a parse tree, or a token) in place of each occurrence of
+    the variable named var. Subtrees without var are kept as they are.
+    '''
+    memo = {}
+
+    def operands(expr):
+        if var not in expr.free_vars:
+            return ()
+        return subtrees(expr)
+
+    def replacer(expr):
+        if var not in expr.free_vars:
+            return expr
+        elif isinstance(expr, ParseTree):
+            return ParseTree([expr.root] + [memo[child]
+                                            for child in expr.children
+                                            if child is not None])
+        return value if isinstance(expr, Name) else expr
+
+    return postorder(expr, replacer, operands, memo)
+## END -------------------------------------------------------------------------